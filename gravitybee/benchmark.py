@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Startup benchmarks of generated standalone applications.
+
+The executable is run a number of times with the same arguments, each time
+from the same empty temporary directory (onefile applications unpack into
+the current directory). The first run is reported on its own and the rest as
+warm starts. The first run isn't a true cold start: the executable was just
+written, so it is usually already in the OS page cache. Wall-clock latency
+percentiles and the peak resident set size of the runs are recorded.
+
+A run that takes longer than the timeout, such as a server that doesn't
+exit on ``--help``, is killed and no more runs are made.
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+PERCENTILES = (50, 90, 99)
+DEFAULT_TIMEOUT = 60
+
+
+def percentile(values, percent):
+    """Return a percentile of values, interpolating between the nearest."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+
+    rank = (len(ordered) - 1) * percent / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def _distribution(values):
+    """Return the min, max and percentiles of values, or None if empty."""
+    if not values:
+        return None
+
+    distribution = {'min': round(min(values), 6), 'max': round(max(values), 6)}
+    for percent in PERCENTILES:
+        distribution[f'p{percent}'] = round(percentile(values, percent), 6)
+    return distribution
+
+
+def run_once(commands, cwd=None, timeout=None):
+    """
+    Run a command once, discarding its output.
+
+    Returns:
+        A tuple of wall-clock seconds, int return code (None if the command
+        was killed for taking longer than the timeout) and int peak RSS in
+        bytes (None where not available).
+    """
+    started = time.perf_counter()
+    with subprocess.Popen(
+        commands,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ) as proc:
+        max_rss = None
+
+        # reap the child ourselves to get its resource usage, killing it
+        # from a timer so the timeout doesn't mean polling
+        if hasattr(os, 'wait4'):
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                proc.kill()
+
+            timer = None
+            if timeout is not None:
+                timer = threading.Timer(timeout, kill)
+                timer.start()
+            try:
+                _, status, rusage = os.wait4(proc.pid, 0)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+            proc.returncode = os.WEXITSTATUS(status) \
+                if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            # ru_maxrss is in kilobytes except on macOS where it is in bytes
+            max_rss = rusage.ru_maxrss * (
+                1 if sys.platform == 'darwin' else 1024)
+            returncode = None if timed_out.is_set() else proc.returncode
+        else:
+            try:
+                returncode = proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                returncode = None
+
+    return time.perf_counter() - started, returncode, max_rss
+
+
+def benchmark(executable, args=None, runs=5, timeout=DEFAULT_TIMEOUT):
+    """
+    Measure the startup of an executable.
+
+    Args:
+        executable: A str path of the executable.
+        args: An optional list of str arguments, such as ["--version"].
+        runs: An int number of runs, the first of which is reported on its
+            own.
+        timeout: A number of seconds each run may take, or None for no
+            limit. A run that takes longer is killed and ends the benchmark.
+
+    Returns:
+        A dict with "runs", "args", "first_run_seconds", "warm_seconds" (a
+        dict of min, max and percentiles), "max_rss_bytes", "failures",
+        "timeout_seconds" and "timeouts" (int number of runs killed).
+    """
+    commands = [os.path.abspath(executable)] + list(args or [])
+    latencies = []
+    peaks = []
+    failures = 0
+    timeouts = 0
+
+    with tempfile.TemporaryDirectory(prefix='gravitybee-benchmark-') as cwd:
+        for _ in range(runs):
+            seconds, returncode, max_rss = run_once(commands, cwd, timeout)
+            if returncode is None:
+                # later runs would most likely hang too
+                logger.warning(
+                    "Benchmark run killed after %ss, not running it again",
+                    timeout)
+                timeouts += 1
+                break
+            latencies.append(seconds)
+            if max_rss is not None:
+                peaks.append(max_rss)
+            if returncode != 0:
+                failures += 1
+
+    if failures:
+        logger.warning(
+            "%s of %s benchmark runs exited with an error", failures, runs)
+
+    return {
+        'runs': runs,
+        'args': list(args or []),
+        'first_run_seconds': round(latencies[0], 6) if latencies else None,
+        'warm_seconds': _distribution(latencies[1:]),
+        'max_rss_bytes': max(peaks) if peaks else None,
+        'failures': failures,
+        'timeout_seconds': timeout,
+        'timeouts': timeouts,
+    }
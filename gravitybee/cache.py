@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed build cache for gravitybee.
+
+A PyInstaller run is the slowest part of generating a standalone
+application. When none of the inputs of a build have changed, the output
+of the previous build can be reused instead. Inputs are reduced to a single
+digest (the cache key) and each cache entry lives in a directory named by
+that key::
+
+    <cache_dir>/<key>/cache-info.json
+    <cache_dir>/<key>/artifact/<standalone file or directory>
+
+Entries are written to a temporary directory first and then renamed into
+place so a partially written entry is never visible to readers. The same
+goes for entries copied in from a remote cache (see gravitybee.remote).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+
+try:
+    from importlib import metadata
+except ImportError:     # Python 3.7
+    import importlib_metadata as metadata
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+CACHE_INFO_FILE = 'cache-info.json'
+ARTIFACT_DIR = 'artifact'
+IGNORED_DIRS = ('__pycache__', '.git', '.gravitybee', '.pyppyn')
+IGNORED_EXTS = ('.pyc', '.pyo')
+
+
+def requirement_name(requirement):
+    """Return the distribution name from a requirement string."""
+    return re.split(r'[\s;\[<>=!~(]', requirement.strip(), maxsplit=1)[0]
+
+
+def installed_version(requirement):
+    """Return the installed version of a requirement or None."""
+    try:
+        return metadata.version(requirement_name(requirement))
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def file_digest(path):
+    """Return a SHA256 hex digest of a file's contents or None."""
+    if path is None or not os.path.isfile(path):
+        return None
+
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file_to_hash:
+        for chunk in iter(lambda: file_to_hash.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def tree_digest(path):
+    """
+    Return a SHA256 hex digest of a file or directory tree.
+
+    Relative paths and file contents are both part of the digest so renames
+    are detected. Bytecode caches and VCS directories are ignored.
+    """
+    if not os.path.exists(path):
+        return None
+
+    if os.path.isfile(path):
+        return file_digest(path)
+
+    sha256 = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+        for name in sorted(files):
+            if name.endswith(IGNORED_EXTS):
+                continue
+            full_path = os.path.join(root, name)
+            rel_path = os.path.relpath(full_path, path).replace("\\", "/")
+            sha256.update(rel_path.encode('utf-8') + b'\0')
+            sha256.update((file_digest(full_path) or '').encode('ascii'))
+    return sha256.hexdigest()
+
+
+def compute_key(inputs):
+    """Reduce a JSON-serializable dict of build inputs to a cache key."""
+    serialized = json.dumps(inputs, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+class BuildCache():
+    """
+    A directory of previously generated standalone applications keyed by
+    a digest of their build inputs.
+
+    Attributes:
+        directory: A str of the directory holding cache entries.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def entry_path(self, key):
+        """Return the directory of the cache entry for a key."""
+        return os.path.join(self.directory, key)
+
+    def contains(self, key):
+        """Return True if a complete entry exists for the key."""
+        return os.path.isfile(
+            os.path.join(self.entry_path(key), CACHE_INFO_FILE))
+
+    def fetch(self, key, dest_dir):
+        """
+        Restore a cached artifact into a directory.
+
+        Args:
+            key: A str cache key.
+            dest_dir: A str of the directory to copy the artifact into.
+
+        Returns:
+            A str of the restored artifact's path, or None on a miss.
+        """
+        if not self.contains(key):
+            logger.info("Build cache miss: %s", key)
+            return None
+
+        with open(
+            os.path.join(self.entry_path(key), CACHE_INFO_FILE),
+            "r",
+            encoding="utf8",
+        ) as info_file:
+            entry_info = json.loads(info_file.read())
+
+        src = os.path.join(
+            self.entry_path(key), ARTIFACT_DIR, entry_info['artifact'])
+        if not os.path.exists(src):
+            logger.warning("Build cache entry is incomplete: %s", key)
+            return None
+
+        if not os.path.exists(dest_dir):
+            os.makedirs(dest_dir)
+
+        dst = os.path.join(dest_dir, entry_info['artifact'])
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, symlinks=True)
+        else:
+            shutil.copy2(src, dst)
+
+        logger.info("Build cache hit: %s", key)
+        return dst
+
+    def store(self, key, artifact_path, extra_info=None):
+        """
+        Add an artifact to the cache.
+
+        Args:
+            key: A str cache key.
+            artifact_path: A str path to the standalone file or directory.
+            extra_info: An optional dict stored alongside the artifact.
+
+        Returns:
+            True if the entry was stored, False if it already existed.
+        """
+        if self.contains(key):
+            return False
+
+        temp_dir = self.temp_dir()
+        artifact_name = os.path.basename(artifact_path)
+        os.makedirs(os.path.join(temp_dir, ARTIFACT_DIR))
+
+        try:
+            dst = os.path.join(temp_dir, ARTIFACT_DIR, artifact_name)
+            if os.path.isdir(artifact_path):
+                shutil.copytree(artifact_path, dst, symlinks=True)
+            else:
+                shutil.copy2(artifact_path, dst)
+
+            entry_info = dict(extra_info or {})
+            entry_info['artifact'] = artifact_name
+            entry_info['created'] = time.time()
+            with open(
+                os.path.join(temp_dir, CACHE_INFO_FILE), "w", encoding="utf8"
+            ) as info_file:
+                info_file.write(json.dumps(entry_info))
+        except OSError:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        if not self.publish(temp_dir, key):
+            return False
+
+        logger.info("Stored build in cache: %s", key)
+        return True
+
+    def import_entry(self, key, entry_dir, extra_files=None):
+        """
+        Copy a complete entry, such as one from another cache, into place.
+
+        Args:
+            key: A str cache key.
+            entry_dir: A str of the entry directory to copy.
+            extra_files: An optional dict of str file names to str paths of
+                files added to the entry.
+
+        Returns:
+            True if the entry was copied, False if it already existed.
+        """
+        if self.contains(key):
+            return False
+
+        temp_dir = self.temp_dir()
+        try:
+            shutil.copytree(entry_dir, temp_dir, symlinks=True)
+            for name, path in (extra_files or {}).items():
+                shutil.copy2(path, os.path.join(temp_dir, name))
+        except OSError:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        return self.publish(temp_dir, key)
+
+    def temp_dir(self):
+        """Return a new, unused path in the cache to build an entry in."""
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, '.tmp-' + uuid.uuid4().hex)
+
+    def publish(self, temp_dir, key):
+        """
+        Rename a complete entry built in temp_dir() into place.
+
+        Returns:
+            True if the entry was published, False if another build
+            published the same key first (temp_dir is then removed).
+        """
+        try:
+            os.rename(temp_dir, self.entry_path(key))
+        except OSError:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            if self.contains(key):
+                return False
+            raise
+
+        return True
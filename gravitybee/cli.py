@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 """gravitybee cli."""
+import contextlib
+import json
+import logging
+import os
 import sys
 
 import click
@@ -9,7 +13,7 @@ import gravitybee
 click.disable_unicode_literals_warning = True
 
 
-@click.command(context_settings=dict(
+@click.group(invoke_without_command=True, context_settings=dict(
     ignore_unknown_options=True,
 ))
 @click.version_option(version=gravitybee.__version__)
@@ -73,6 +77,14 @@ click.disable_unicode_literals_warning = True
     help="Any extra package(s) to be included with the "
     + "standalone application. Can be used multiple times."
 )
+@click.option(
+    '--wheelhouse',
+    'wheelhouse',
+    default=None,
+    envvar='GB_WHEELHOUSE',
+    help="Directory of wheels to install extra packages from, "
+    + "without using a package index."
+)
 @click.option(
     '--extra-modules',
     'extra_modules',
@@ -100,6 +112,15 @@ click.disable_unicode_literals_warning = True
     envvar='GB_WORK_DIR',
     help="Relative path for work directory."
 )
+@click.option(
+    '--incremental',
+    'incremental',
+    default=False,
+    envvar='GB_INCREMENTAL',
+    is_flag=True,
+    help="Reuse a stable, per-app work directory so PyInstaller can "
+    + "reuse its analysis caches across builds."
+)
 @click.option(
     '--hook-template',
     '-t',
@@ -179,14 +200,24 @@ click.disable_unicode_literals_warning = True
 @click.option(
     '--sha',
     'sha',
-    default=gravitybee.Arguments.OPTION_SHA_INFO,
+    default=gravitybee.SHA_INFO,
     envvar='GB_SHA',
     type=click.Choice([
-        gravitybee.Arguments.OPTION_SHA_FILE,
-        gravitybee.Arguments.OPTION_SHA_INFO
+        gravitybee.SHA_FILE,
+        gravitybee.SHA_INFO
     ]),
     help="Where to put SHA256 hash for generated file."
 )
+@click.option(
+    '--hash-algorithm',
+    'hash_algorithms',
+    default=[],
+    envvar='GB_HASH_ALGORITHMS',
+    multiple=True,
+    type=click.Choice(gravitybee.HASH_ALGORITHMS),
+    help="Additional digest to compute for the generated file along with "
+    + "SHA256. Can be used multiple times."
+)
 @click.option(
     '--staging-dir',
     'staging_dir',
@@ -194,6 +225,41 @@ click.disable_unicode_literals_warning = True
     envvar='GB_STAGING_DIR',
     help="Where to stage the artifacts of the build."
 )
+@click.option(
+    '--staging-mode',
+    'staging_mode',
+    default=gravitybee.STAGING_CLEAN,
+    envvar='GB_STAGING_MODE',
+    type=click.Choice([
+        gravitybee.STAGING_CLEAN,
+        gravitybee.STAGING_INCREMENTAL
+    ]),
+    help="Whether to replace the staging directory on each build (clean) "
+    + "or keep earlier versions and swap in the new one (incremental)."
+)
+@click.option(
+    '--keep-versions',
+    'keep_versions',
+    default=None,
+    envvar='GB_KEEP_VERSIONS',
+    type=click.IntRange(min=1),
+    help="In incremental staging mode, how many versions to keep."
+)
+@click.option(
+    '--max-staging-size',
+    'max_staging_size',
+    default=None,
+    envvar='GB_MAX_STAGING_SIZE',
+    help="In incremental staging mode, the size (such as 500M or 2G) the "
+    + "staging directory is pruned to by removing the oldest versions."
+)
+@click.option(
+    '--info-dir',
+    'info_dir',
+    default=None,
+    envvar='GB_INFO_DIR',
+    help="Where to write gravitybee-info.json and the other output files."
+)
 @click.option(
     '--with-latest',
     'with_latest',
@@ -202,11 +268,419 @@ click.disable_unicode_literals_warning = True
     is_flag=True,
     help="Whether to include a latest directory as part of staging."
 )
-def main(**kwargs):
+@click.option(
+    '--latest-strategy',
+    'latest_strategy',
+    default=gravitybee.LATEST_COPY,
+    envvar='GB_LATEST_STRATEGY',
+    type=click.Choice([
+        gravitybee.LATEST_COPY,
+        gravitybee.LATEST_HARDLINK,
+        gravitybee.LATEST_REFLINK,
+        gravitybee.LATEST_SYMLINK
+    ]),
+    help="How to place artifacts in the latest directory. Falls back to "
+    + "copying when the filesystem doesn't support the strategy."
+)
+@click.option(
+    '--engine',
+    'engine',
+    default=gravitybee.ENGINE_SUBPROCESS,
+    envvar='GB_ENGINE',
+    type=click.Choice([
+        gravitybee.ENGINE_SUBPROCESS,
+        gravitybee.ENGINE_INPROCESS,
+        gravitybee.ENGINE_WORKER
+    ]),
+    help="How to run PyInstaller: in a new process for each build, "
+    + "in-process, or in a reusable worker process."
+)
+@click.option(
+    '--build-profile',
+    'build_profile',
+    default=gravitybee.BUILD_RELEASE,
+    envvar='GB_BUILD_PROFILE',
+    type=click.Choice([
+        gravitybee.BUILD_RELEASE,
+        gravitybee.BUILD_DEBUG
+    ]),
+    help="Build a release (without UPX) or debug (debug "
+    + "bootloader and import tracing) application."
+)
+@click.option(
+    '--strip',
+    'strip',
+    default=False,
+    envvar='GB_STRIP',
+    is_flag=True,
+    help="Strip symbols from the binaries of a release build (except on "
+    + "Windows)."
+)
+@click.option(
+    '--optimize',
+    'optimize',
+    type=click.IntRange(min=0, max=2),
+    default=0,
+    envvar='GB_OPTIMIZE',
+    help="Bytecode optimization level of the bundled modules: 1 removes "
+    + "asserts and 2 also removes docstrings."
+)
+@click.option(
+    '--log-file',
+    'log_file',
+    default=None,
+    envvar='GB_LOG_FILE',
+    help="File to also write PyInstaller's output to as it runs."
+)
+@click.option(
+    '--profile',
+    'profile',
+    default=False,
+    envvar='GB_PROFILE',
+    is_flag=True,
+    help="Record how long each stage of the build takes, and the CPU time "
+    + "and peak memory of PyInstaller, in gravitybee-info.json."
+)
+@click.option(
+    '--cache',
+    'cache',
+    default=False,
+    envvar='GB_CACHE',
+    is_flag=True,
+    help="Reuse a previously generated standalone application when "
+    + "none of the build inputs have changed."
+)
+@click.option(
+    '--cache-dir',
+    'cache_dir',
+    default=None,
+    envvar='GB_CACHE_DIR',
+    help="Where to keep cached builds when using --cache."
+)
+@click.option(
+    '--remote-cache',
+    'remote_cache',
+    default=None,
+    envvar='GB_REMOTE_CACHE',
+    help="URL or shared directory of a build cache used by several "
+    + "machines. Builds missing from the local cache are fetched from it "
+    + "and new builds are published to it. Implies --cache."
+)
+@click.option(
+    '--precompute-metadata',
+    'precompute_metadata',
+    default=False,
+    envvar='GB_PRECOMPUTE_METADATA',
+    is_flag=True,
+    help="Resolve the metadata of the application's dependencies, "
+    + "including indirect ones, when writing the hook instead of having "
+    + "PyInstaller look up each direct dependency."
+)
+@click.option(
+    '--tree-shake',
+    'tree_shake',
+    default=False,
+    envvar='GB_TREE_SHAKE',
+    is_flag=True,
+    help="Analyze the application's imports and exclude the modules of "
+    + "third-party packages it never imports. A report is written to "
+    + "gravitybee-treeshake.json."
+)
+@click.option(
+    '--runtime-tmpdir',
+    'runtime_tmpdir',
+    default=None,
+    envvar='GB_RUNTIME_TMPDIR',
+    help="Where a onefile application extracts itself each time it "
+    + "runs. Defaults to the current directory on POSIX platforms; "
+    + "an empty value uses the system temp dir."
+)
+@click.option(
+    '--extract-cache',
+    'extract_cache',
+    default=False,
+    envvar='GB_EXTRACT_CACHE',
+    is_flag=True,
+    help="Instead of a onefile application that extracts itself every "
+    + "time it runs, create a self-extracting executable that extracts "
+    + "once into a cache dir and reuses it. Not on Windows."
+)
+@click.option(
+    '--extract-max-age',
+    'extract_max_age',
+    default=None,
+    envvar='GB_EXTRACT_MAX_AGE',
+    help="Cached extractions not run for this long (such as 7d) are "
+    + "removed when a new version is extracted."
+)
+@click.option(
+    '--gc-max-age',
+    'gc_max_age',
+    default=None,
+    envvar='GB_GC_MAX_AGE',
+    help="After building, remove work directories left in "
+    + ".gravitybee/build that are older than this (such as 12h or 7d). "
+    + "Runs in a detached process."
+)
+@click.option(
+    '--gc-max-size',
+    'gc_max_size',
+    default=None,
+    envvar='GB_GC_MAX_SIZE',
+    help="After building, remove the oldest work directories until "
+    + ".gravitybee/build is no larger than this (such as 10G). "
+    + "Runs in a detached process."
+)
+@click.option(
+    '--benchmark',
+    'benchmark',
+    type=click.IntRange(min=0),
+    default=0,
+    envvar='GB_BENCHMARK',
+    help="After building, run the standalone application this many "
+    + "times and record its first and warm startup latency and peak "
+    + "memory in gravitybee-info.json."
+)
+@click.option(
+    '--benchmark-args',
+    'benchmark_args',
+    default='--help',
+    envvar='GB_BENCHMARK_ARGS',
+    help="Arguments to run the standalone application with when "
+    + "benchmarking."
+)
+@click.option(
+    '--benchmark-timeout',
+    'benchmark_timeout',
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    envvar='GB_BENCHMARK_TIMEOUT',
+    help="Seconds after which a benchmark run is killed and benchmarking "
+    + "stops. Default: 60"
+)
+@click.option(
+    '--plan',
+    'plan',
+    default=False,
+    envvar='GB_PLAN',
+    is_flag=True,
+    help="Resolve and validate the build without running PyInstaller, "
+    + "writing the plan as JSON to stdout."
+)
+@click.pass_context
+def main(ctx, **kwargs):
     """Entry point for GravityBee CLI."""
+    if ctx.invoked_subcommand is not None:
+        return
+
+    if kwargs['plan']:
+        _plan(kwargs)
+
     print("GravityBee CLI,", gravitybee.__version__)
 
     # Create an instance
     args = gravitybee.Arguments(**kwargs)
     package_generator = gravitybee.PackageGenerator(args)
     sys.exit(package_generator.generate())
+
+
+@contextlib.contextmanager
+def _stdout_to_stderr():
+    """Send everything written to stdout, even by children, to stderr."""
+    stdout = sys.stdout
+    stdout.flush()
+    saved = os.dup(stdout.fileno())
+    os.dup2(sys.stderr.fileno(), stdout.fileno())
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+    finally:
+        stdout.flush()
+        os.dup2(saved, stdout.fileno())
+        os.close(saved)
+
+
+def _plan(kwargs):
+    """Write the plan of a build, and nothing else, to stdout."""
+    gravitybee.configure_logging()
+    for handler in logging.getLogger().handlers \
+            + logging.getLogger('gravitybee').handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(sys.stderr)
+
+    # setuptools prints while reading the setup configuration
+    with _stdout_to_stderr():
+        args = gravitybee.Arguments(**kwargs)
+        plan = gravitybee.PackageGenerator(args).plan()
+
+    print(json.dumps(plan, indent=2))
+    sys.exit(gravitybee.EXIT_OKAY if plan['valid']
+             else gravitybee.EXIT_NOT_OKAY)
+
+
+@main.command('matrix')
+@click.argument(
+    'spec_file',
+    type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    '--jobs',
+    '-j',
+    'jobs',
+    default=None,
+    envvar='GB_JOBS',
+    type=click.IntRange(min=1),
+    help="Maximum number of builds to run at once. "
+    + "Default: number of CPUs."
+)
+@click.pass_context
+def matrix(ctx, spec_file, jobs):
+    """Build several variants concurrently from a JSON spec file.
+
+    Options given to gravitybee itself apply to every build. Its work,
+    staging and info dirs are base dirs, with a dir for each variant.
+    """
+    # pylint: disable=import-outside-toplevel
+    from gravitybee.matrix import build_matrix, load_specs
+
+    print("GravityBee CLI,", gravitybee.__version__)
+
+    defaults = {key: value for key, value in ctx.parent.params.items()
+                if value}
+    results = build_matrix(load_specs(spec_file), jobs, defaults)
+
+    for result in results:
+        print(result['name'], result['exit_code'],
+              result.get('gen_file_w_path') or result['error'])
+
+    if any(result['exit_code'] != gravitybee.EXIT_OKAY for result in results):
+        sys.exit(gravitybee.EXIT_NOT_OKAY)
+    sys.exit(gravitybee.EXIT_OKAY)
+
+
+@main.command('watch')
+@click.option(
+    '--interval',
+    'interval',
+    default=0.5,
+    envvar='GB_WATCH_INTERVAL',
+    type=click.FloatRange(min=0),
+    help="Seconds between checks for changes. Default: 0.5"
+)
+@click.option(
+    '--debounce',
+    'debounce',
+    default=0.3,
+    envvar='GB_WATCH_DEBOUNCE',
+    type=click.FloatRange(min=0),
+    help="Seconds the inputs must be unchanged for before rebuilding. "
+    + "Default: 0.3"
+)
+@click.pass_context
+def watch(ctx, interval, debounce):
+    """Rebuild whenever the source, extra data or setup files change.
+
+    Options given to gravitybee itself apply to every build. Builds are
+    incremental and run PyInstaller in a worker process unless another
+    engine is given.
+    """
+    # pylint: disable=import-outside-toplevel
+    from gravitybee.watch import watch as watch_builds
+
+    print("GravityBee CLI,", gravitybee.__version__)
+
+    kwargs = dict(ctx.parent.params)
+    if ctx.parent.get_parameter_source('engine') \
+            == click.core.ParameterSource.DEFAULT:
+        kwargs['engine'] = None
+
+    results = watch_builds(kwargs, interval, debounce)
+
+    if results and results[-1] != gravitybee.EXIT_OKAY:
+        sys.exit(gravitybee.EXIT_NOT_OKAY)
+    sys.exit(gravitybee.EXIT_OKAY)
+
+
+@main.command('cache-server')
+@click.argument(
+    'directory',
+    type=click.Path(file_okay=False)
+)
+@click.option(
+    '--host',
+    'host',
+    default='127.0.0.1',
+    envvar='GB_CACHE_HOST',
+    help="Address to listen on. Default: 127.0.0.1"
+)
+@click.option(
+    '--port',
+    'port',
+    default=8765,
+    envvar='GB_CACHE_PORT',
+    type=click.IntRange(min=0, max=65535),
+    help="Port to listen on. Default: 8765"
+)
+def cache_server(directory, host, port):
+    """Serve a directory as a remote build cache over HTTP.
+
+    Use http://HOST:PORT as the --remote-cache of builds.
+    """
+    # pylint: disable=import-outside-toplevel
+    from gravitybee.remote import make_server
+
+    print("GravityBee CLI,", gravitybee.__version__)
+
+    with make_server(directory, host, port) as server:
+        print("Serving remote build cache", directory, "at http://"
+              + host + ":" + str(server.server_address[1]))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+@main.command('gc')
+@click.option(
+    '--max-age',
+    'max_age',
+    default='1d',
+    envvar='GB_GC_MAX_AGE',
+    help="Remove work directories older than this (such as 12h or 7d). "
+    + "Default: 1d"
+)
+@click.option(
+    '--max-size',
+    'max_size',
+    default=None,
+    envvar='GB_GC_MAX_SIZE',
+    help="Remove the oldest work directories until the build directory is "
+    + "no larger than this (such as 10G)."
+)
+@click.option(
+    '--build-dir',
+    'build_dir',
+    default=gravitybee.BUILD_DIR,
+    type=click.Path(file_okay=False),
+    help="Directory of work directories to collect. "
+    + "Default: " + gravitybee.BUILD_DIR
+)
+def garbage_collect(max_age, max_size, build_dir):
+    """Remove old work directories left behind by earlier builds."""
+    # pylint: disable=import-outside-toplevel
+    from gravitybee import staging, workdir
+
+    gravitybee.configure_logging()
+    print("GravityBee CLI,", gravitybee.__version__)
+
+    try:
+        removed = workdir.collect_garbage(
+            build_dir,
+            max_age=workdir.parse_age(max_age),
+            max_size=staging.parse_size(max_size)
+        )
+    except ValueError as err:
+        raise click.BadParameter(str(err)) from err
+
+    for path in removed:
+        print("Removed", path)
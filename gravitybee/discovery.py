@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Static discovery of an application package's submodules.
+
+PyInstaller's ``collect_submodules()`` imports every submodule of a package
+in a child process to find them, which is slow for large packages and runs
+their import-time side effects. Instead, the package's source tree is
+walked and each module is parsed (not imported) with ``ast`` to make sure it
+is valid Python. The resulting names are written into the hook as a literal
+``hiddenimports`` list.
+
+Packages that change their own ``__path__`` (for example, with
+``pkgutil.extend_path``) can have submodules outside their directory, so
+static discovery gives up on them and the hook falls back to
+``collect_submodules()``.
+
+Results are cached, keyed by the paths, sizes and mtimes of the files in
+the package, so unchanged packages are not parsed again.
+"""
+
+import ast
+import json
+import keyword
+import logging
+import os
+from importlib.machinery import EXTENSION_SUFFIXES
+
+from gravitybee.cache import compute_key
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+SOURCE_SUFFIX = '.py'
+INIT_FILE = '__init__.py'
+
+
+def _module_name(filename):
+    """Return the module name of a source or extension file, or None."""
+    for suffix in [SOURCE_SUFFIX] + EXTENSION_SUFFIXES:
+        if filename.endswith(suffix):
+            name = filename[:-len(suffix)]
+            if name.isidentifier() and not keyword.iskeyword(name):
+                return name
+    return None
+
+
+def package_modules(pkg_path):
+    """Return (module name, path) of every module under a package dir."""
+    pkg_name = os.path.basename(os.path.normpath(pkg_path))
+    modules = []
+
+    for dirpath, dirnames, filenames in os.walk(pkg_path):
+        # only regular packages are walked, like pkgutil.iter_modules()
+        dirnames[:] = sorted(
+            name for name in dirnames
+            if os.path.isfile(os.path.join(dirpath, name, INIT_FILE))
+            and name.isidentifier()
+        )
+
+        package = '.'.join(
+            [pkg_name] + [
+                part for part in os.path.relpath(
+                    dirpath, pkg_path).split(os.sep)
+                if part != '.'
+            ]
+        )
+
+        for filename in sorted(filenames):
+            name = _module_name(filename)
+            if name is None:
+                continue
+            module = package if name == '__init__' else package + '.' + name
+            modules.append((module, os.path.join(dirpath, filename)))
+
+    return modules
+
+
+def _sets_path(tree):
+    """Return True if a module body assigns to __path__."""
+    for node in ast.walk(tree):
+        targets = []
+        if isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
+            targets = getattr(node, 'targets', None) or [node.target]
+        for target in targets:
+            if isinstance(target, ast.Name) and target.id == '__path__':
+                return True
+    return False
+
+
+def _parse(modules):
+    """Return the importable module names, or None if any are dynamic."""
+    found = []
+    for module, path in modules:
+        if not path.endswith(SOURCE_SUFFIX):
+            found.append(module)
+            continue
+
+        try:
+            with open(path, 'rb') as source:
+                tree = ast.parse(source.read(), filename=path)
+        except (SyntaxError, ValueError) as err:
+            # collect_submodules() would also skip a module failing import
+            logger.warning("Skipping module that can't be parsed: %s", err)
+            continue
+
+        if path.endswith(INIT_FILE) and _sets_path(tree):
+            logger.info("Package extends its __path__: %s", module)
+            return None
+
+        found.append(module)
+
+    return sorted(found)
+
+
+def find_submodules(pkg_path, cache_dir=None):
+    """
+    Find a package and all its submodules without importing them.
+
+    Args:
+        pkg_path: A str of the package directory (containing __init__.py).
+        cache_dir: An optional str directory where results are cached.
+
+    Returns:
+        A sorted list of str dotted module names, including the package
+        itself, or None if the package can't be discovered statically.
+    """
+    if not os.path.isfile(os.path.join(pkg_path, INIT_FILE)):
+        logger.info("Not a regular package: %s", pkg_path)
+        return None
+
+    modules = package_modules(pkg_path)
+
+    cache_file = None
+    if cache_dir is not None:
+        stats = []
+        for module, path in modules:
+            stat = os.stat(path)
+            stats.append([module, stat.st_size, stat.st_mtime_ns])
+        cache_file = os.path.join(
+            cache_dir, compute_key({'modules': stats}) + '.json')
+
+        if os.path.isfile(cache_file):
+            with open(cache_file, "r", encoding="utf8") as found_file:
+                return json.loads(found_file.read())['submodules']
+
+    submodules = _parse(modules)
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_file = cache_file + '.' + str(os.getpid())
+        with open(temp_file, "w", encoding="utf8") as found_file:
+            found_file.write(json.dumps({'submodules': submodules}))
+        os.replace(temp_file, cache_file)
+
+    return submodules
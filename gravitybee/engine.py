@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""Engines that run PyInstaller for gravitybee.
+
+Every engine takes the same command list gravitybee.PackageGenerator builds
+for the ``pyinstaller`` console script and reports PyInstaller's output one
+line at a time through a callback.
+
+* ``subprocess`` starts a fresh ``pyinstaller`` process for each build.
+* ``inprocess`` calls PyInstaller's Python entry point in the current
+  process, so PyInstaller is only imported once when many builds run back to
+  back.
+* ``worker`` keeps one long-running child process around and runs builds in
+  it in-process. It gets the warm imports of ``inprocess`` while keeping
+  PyInstaller's global state out of the calling process.
+
+The modules an engine needs are imported when it first runs, so PyInstaller
+isn't loaded until a build needs it.
+"""
+
+import logging
+import os
+import signal
+import traceback
+from types import SimpleNamespace
+
+from gravitybee import ENGINE_INPROCESS, ENGINE_SUBPROCESS, ENGINE_WORKER
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+# matches PyInstaller's own log format so output looks the same everywhere
+PYINSTALLER_LOG_FORMAT = '%(relativeCreated)d %(levelname)s: %(message)s'
+
+
+def _self_rusage():
+    try:
+        import resource     # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF)
+
+
+def _rusage_delta(before, after):
+    """Return CPU time used between two rusage snapshots of this process."""
+    if before is None or after is None:
+        return None
+    return SimpleNamespace(
+        ru_utime=after.ru_utime - before.ru_utime,
+        ru_stime=after.ru_stime - before.ru_stime,
+        ru_maxrss=after.ru_maxrss,
+    )
+
+
+class SubprocessEngine():      # pylint: disable=too-few-public-methods
+    """Run PyInstaller as a child process."""
+
+    name = ENGINE_SUBPROCESS
+
+    @staticmethod
+    def run(commands, on_line):
+        """
+        Run PyInstaller.
+
+        Args:
+            commands: A list of str making up the pyinstaller command.
+            on_line: A callable receiving each line of output.
+
+        Returns:
+            A tuple of the int return code and the child's rusage (or None
+            if not available on this platform).
+        """
+        import subprocess   # pylint: disable=import-outside-toplevel
+
+        rusage = None
+
+        # PyInstaller logs to stderr so both streams are read as one
+        with subprocess.Popen(
+            commands,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+        ) as proc:
+            for line in proc.stdout:
+                on_line(line.rstrip())
+
+            # reap the child ourselves to get its resource usage, Popen
+            # skips waiting once returncode is set
+            if hasattr(os, 'wait4'):
+                _, status, rusage = os.wait4(proc.pid, 0)
+                proc.returncode = os.WEXITSTATUS(status) \
+                    if os.WIFEXITED(status) else -os.WTERMSIG(status)
+
+        return proc.returncode, rusage
+
+
+class _LineHandler(logging.Handler):
+    """Logging handler passing formatted records to a callback."""
+
+    def __init__(self, on_line):
+        super().__init__()
+        self.on_line = on_line
+        self.setFormatter(logging.Formatter(PYINSTALLER_LOG_FORMAT))
+
+    def emit(self, record):
+        try:
+            for line in self.format(record).splitlines():
+                self.on_line(line)
+        except Exception:       # pylint: disable=broad-except
+            self.handleError(record)
+
+
+def _reset_targets():
+    """Number PyInstaller's build targets from zero again."""
+    # PyInstaller names the TOC files it caches its analysis in with a
+    # counter of the targets created in the process, so without this a
+    # second build in the same process never finds the first one's caches
+    try:
+        # pylint: disable=import-outside-toplevel
+        from PyInstaller.building.datastruct import Target
+    except ImportError:
+        return
+
+    pending = [Target]
+    while pending:
+        target_class = pending.pop()
+        target_class.invcnum = 0
+        pending.extend(target_class.__subclasses__())
+
+
+class InProcessEngine():       # pylint: disable=too-few-public-methods
+    """Run PyInstaller through its Python entry point in this process."""
+
+    name = ENGINE_INPROCESS
+
+    @staticmethod
+    def run(commands, on_line):
+        """
+        Run PyInstaller.
+
+        Args:
+            commands: A list of str making up the pyinstaller command. The
+                first item (the console script name) is ignored.
+            on_line: A callable receiving each line of output.
+
+        Returns:
+            A tuple of the int return code and the CPU time used by this
+            process during the build (or None if not available).
+        """
+        # pylint: disable=import-outside-toplevel
+        import PyInstaller.__main__
+
+        pyi_logger = logging.getLogger('PyInstaller')
+        handler = _LineHandler(on_line)
+        propagate = pyi_logger.propagate
+        pyi_logger.addHandler(handler)
+        pyi_logger.propagate = False
+
+        _reset_targets()
+
+        before = _self_rusage()
+        returncode = 0
+        try:
+            PyInstaller.__main__.run(list(commands[1:]))
+        except SystemExit as err:
+            if isinstance(err.code, int):
+                returncode = err.code
+            elif err.code is not None:
+                on_line(str(err.code))
+                returncode = 1
+        except Exception:       # pylint: disable=broad-except
+            for line in traceback.format_exc().splitlines():
+                on_line(line)
+            returncode = 1
+        finally:
+            pyi_logger.removeHandler(handler)
+            pyi_logger.propagate = propagate
+
+        return returncode, _rusage_delta(before, _self_rusage())
+
+
+def _worker_loop(conn):
+    """Run builds sent over a pipe until told to stop."""
+    # Ctrl+C is left to the caller, which stops the worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+
+        if request is None:
+            break
+
+        # relative paths in the commands are relative to the caller
+        cwd, commands = request
+        os.chdir(cwd)
+        returncode, rusage = InProcessEngine.run(
+            commands, lambda line: conn.send(('line', line)))
+
+        if rusage is not None:
+            rusage = (rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss)
+        conn.send(('done', returncode, rusage))
+
+    conn.close()
+
+
+class WorkerEngine():
+    """Run PyInstaller in a reusable worker process."""
+
+    name = ENGINE_WORKER
+
+    def __init__(self):
+        self._process = None
+        self._conn = None
+
+    def _start(self):
+        import multiprocessing  # pylint: disable=import-outside-toplevel
+
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_worker_loop, args=(child_conn,), daemon=True)
+        self._process.start()
+        child_conn.close()
+        logger.info("Started PyInstaller worker: %s", self._process.pid)
+
+    def run(self, commands, on_line):
+        """
+        Run PyInstaller.
+
+        Args:
+            commands: A list of str making up the pyinstaller command.
+            on_line: A callable receiving each line of output.
+
+        Returns:
+            A tuple of the int return code and the CPU time used by the
+            worker during the build (or None if not available).
+        """
+        if self._process is None or not self._process.is_alive():
+            self._start()
+
+        self._conn.send((os.getcwd(), list(commands)))
+
+        while True:
+            try:
+                message = self._conn.recv()
+            except EOFError:
+                on_line("PyInstaller worker exited unexpectedly")
+                self.close()
+                return 1, None
+
+            if message[0] == 'line':
+                on_line(message[1])
+            else:
+                break
+
+        _, returncode, rusage = message
+        if rusage is not None:
+            rusage = SimpleNamespace(
+                ru_utime=rusage[0], ru_stime=rusage[1], ru_maxrss=rusage[2])
+        return returncode, rusage
+
+    def close(self):
+        """Stop the worker process."""
+        if self._process is None:
+            return
+
+        if self._process.is_alive():
+            try:
+                self._conn.send(None)
+            except OSError:
+                pass
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+
+        self._conn.close()
+        self._process = None
+        self._conn = None
+
+
+ENGINES = {
+    ENGINE_SUBPROCESS: SubprocessEngine,
+    ENGINE_INPROCESS: InProcessEngine,
+    ENGINE_WORKER: WorkerEngine,
+}
+
+_engines = {}
+
+
+def get_engine(name):
+    """Return the shared engine instance for a name."""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown PyInstaller engine: {name}")
+
+    if name not in _engines:
+        _engines[name] = ENGINES[name]()
+    return _engines[name]
+
+
+def close_engines():
+    """Stop any worker processes started by shared engines."""
+    for engine in _engines.values():
+        if hasattr(engine, 'close'):
+            engine.close()
+    _engines.clear()
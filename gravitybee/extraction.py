@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Self-extracting executables that unpack into a persistent cache.
+
+A PyInstaller onefile executable unpacks its whole archive into a new
+temporary directory every time it is launched, and removes it on exit. For
+command line tools that are run often, most of their startup goes to this.
+
+Instead, the application is built as a directory, archived, and appended to
+a small POSIX shell bootstrap (see ``bootstrap-template``). On its first
+launch the bootstrap extracts the archive into a cache directory named
+after the archive's SHA256, publishing it with an atomic rename so that
+concurrent launches never see a partial extraction. Later launches run the
+cached copy directly. When a new version is extracted, versions that have
+not been launched for a while are evicted, after first being renamed out of
+the way.
+
+The bootstrap needs ``sh``, ``gzip`` and ``tar``, so it isn't available on
+Windows.
+"""
+
+import logging
+import math
+import os
+import shutil
+import tarfile
+from string import Template
+
+from gravitybee import hashing, workdir
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+BOOTSTRAP_TEMPLATE = os.path.join(
+    os.path.dirname(__file__), 'bootstrap-template')
+DEFAULT_MAX_AGE = '7d'
+ARCHIVE_SUFFIX = '.tar.gz'
+DAY_SECONDS = 86400
+
+
+class _ShellTemplate(Template):
+    """A template whose placeholders don't clash with shell variables."""
+
+    delimiter = '%%'
+
+
+def _archive(src_dir, archive_path):
+    """Write a gzipped tar of the contents of a directory."""
+    with tarfile.open(archive_path, 'w:gz', compresslevel=6) as archive:
+        for name in sorted(os.listdir(src_dir)):
+            archive.add(os.path.join(src_dir, name), arcname=name)
+
+
+def max_age_days(max_age):
+    """Return the find -mtime days for an age like "7d" (at least 0)."""
+    seconds = workdir.parse_age(max_age or DEFAULT_MAX_AGE)
+    return max(math.ceil(seconds / DAY_SECONDS) - 1, 0)
+
+
+def make_bootstrap(src_dir, dst, app_name, app_version, max_age=None):
+    """
+    Package an application directory as a self-extracting executable.
+
+    Args:
+        src_dir: A str of the directory built by PyInstaller --onedir,
+            containing an executable with the same name.
+        dst: A str path of the self-extracting executable to write.
+        app_name: A str of the application's name, used for its cache dir.
+        app_version: A str of the application's version.
+        max_age: An optional number of seconds, or a str like "7d", after
+            which cached versions that haven't been launched are evicted.
+
+    Returns:
+        A str of the SHA256 of the archive, which names its cache dir.
+    """
+    archive_path = dst + ARCHIVE_SUFFIX
+    _archive(src_dir, archive_path)
+
+    try:
+        key = hashing.hash_file(archive_path)[hashing.DEFAULT_ALGORITHM]
+
+        with open(BOOTSTRAP_TEMPLATE, 'r', encoding='utf8') as template:
+            bootstrap = _ShellTemplate(template.read()).substitute(
+                app_name=app_name,
+                app_version=app_version,
+                key=key,
+                executable=os.path.basename(os.path.normpath(src_dir)),
+                archive_size=os.path.getsize(archive_path),
+                max_age_days=max_age_days(max_age),
+            )
+
+        with open(dst, 'wb') as dst_file:
+            dst_file.write(bootstrap.encode('utf8'))
+            with open(archive_path, 'rb') as archive:
+                shutil.copyfileobj(archive, dst_file)
+    finally:
+        os.remove(archive_path)
+
+    os.chmod(dst, 0o755)
+    logger.info("Created self-extracting executable: %s (%s)", dst, key)
+    return key
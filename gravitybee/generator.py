@@ -0,0 +1,2146 @@
+# -*- coding: utf-8 -*-
+"""Generation of standalone applications.
+
+Arguments gathers the configuration of a build and PackageGenerator runs
+it. Both are also available from the gravitybee package itself, which
+imports this module the first time they are used.
+"""
+# pylint: disable=too-many-lines
+
+import ast
+import collections
+import contextlib
+import glob
+import json
+import logging
+import os
+import platform
+import re
+import shlex
+import shutil
+import sys
+import sysconfig
+import time
+import uuid
+from string import Template
+from gravitybee import __version__, BUILD_DIR, BUILD_DEBUG, \
+    BUILD_RELEASE, EXIT_NOT_OKAY, EXIT_OKAY, FILE_DIR, SHA_FILE, SHA_INFO, \
+    configure_logging
+from gravitybee import benchmark, discovery, engine, extraction, hashing, \
+    remote, requirements, staging, treeshake, workdir
+from gravitybee.cache import BuildCache, compute_key, file_digest, \
+    installed_version, tree_digest
+from gravitybee.distutils_utils import fix_distutils
+
+configure_logging()
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+
+class Arguments():
+    """
+    A class representing the configuration information needed by the
+    gravitybee.PackageGenerator class.
+
+    Attributes:
+        flags: A dict of bools for flags including "clean" (T: whether to clean
+            after generation), "dont_write_file" (F: whether to write files),
+            "one_dir" (F: whether to package as a directory or app),
+            "with_latest" (F: whether to also create a "latest" dir),
+            "cache" (F: whether to reuse cached builds, always T with a
+            remote cache), "incremental" (F:
+            whether to reuse a stable work dir across builds), "profile" (F:
+            whether to record build timings in the info file),
+            "precompute_metadata" (F: whether to resolve dependency metadata,
+            transitively, for the hook), "tree_shake" (F: whether to exclude
+            modules of third-party packages the app never imports),
+            "extract_cache" (F: whether a onefile app extracts once into a
+            persistent cache instead of on every launch), "plan" (F:
+            whether to only resolve and validate the build), "strip" (F:
+            whether release builds strip symbols from binaries, except on
+            Windows).
+        directories: A dict of strings for directories used in generation
+            including "pkg" (where setup.py lives), "src" (path to source),
+            "work" (where work files will be put), "staging" (where artifacts
+            are staged), "cache" (where cached builds are kept), "info"
+            (where info files are written), "wheelhouse" (local wheels to
+            install extra packages from instead of an index).
+        formats: A dict of strings for output formats in the str.format()
+            notation including "name" (format used in naming generated
+            application), "sha" (format used in naming generated SHA file for
+            the application), "label" (format used for generated application's
+            label).
+        extra: A dict of strings for extra material to include with the
+            generated application including "data" (data to include), "pkgs"
+            (extra packages to include in the application), "modules" (extra
+            modules to include in the application).
+        info: A dict of strings with general information about the process
+            including "sha" (enumeration to specify creating a file with the
+            SHA hash or just include in output information), "console_scripts"
+            (where the existing app's console scripts are located),
+            "app_version" (the version of the app), "app_name" (name of the
+            app), "pkg_name" (name of the package the existing app lives in),
+            "script_path" (path to the script installed by pip),
+            "operating_system" (operating system currently running),
+            "machine_type" (machine type currently running), "log_file"
+            (where to also write PyInstaller's output), "remote_cache" (URL
+            or shared directory of a build cache used by several machines,
+            see gravitybee.remote), "engine" (how
+            PyInstaller is run: "subprocess", "inprocess" or "worker"),
+            "build_profile" ("release" for binaries without UPX or
+            "debug" for PyInstaller's debug bootloader and import tracing),
+            "optimize" (int bytecode optimization level of bundled modules:
+            0, 1 to drop asserts or 2 to also drop docstrings),
+            "hash_algorithms" (digests to compute for the standalone,
+            always starting with sha256), "latest_strategy" (how artifacts
+            are placed in the latest dir: "copy", "hardlink", "reflink" or
+            "symlink"), "staging_mode" ("clean" to replace the staging dir
+            or "incremental" to keep earlier versions), "keep_versions"
+            (int number of versions kept in incremental mode) and
+            "max_staging_size" (int bytes the staging dir is pruned to in
+            incremental mode), "gc_max_age" (seconds after which work dirs
+            left in the build dir are removed), "gc_max_size" (int bytes
+            the build dir is pruned to), "benchmark_runs" (int number of
+            times to run the standalone to measure its startup, 0 for
+            none), "benchmark_args" (list of arguments it is run with),
+            "benchmark_timeout" (seconds after which a run is killed),
+            "runtime_tmpdir" (where onefile apps extract on each launch,
+            None for the system temp dir) and "extract_max_age"
+            (seconds after which unused cached extractions are evicted).
+        pyppy: An instance of pyppyn.ConfigRep for gathering application
+            information. With the build cache, its configuration is reused
+            from earlier runs while the setup files are unchanged.
+    """
+
+    OPTION_SHA_INFO = SHA_INFO
+    OPTION_SHA_FILE = SHA_FILE
+    OPTION_BUILD_RELEASE = BUILD_RELEASE
+    OPTION_BUILD_DEBUG = BUILD_DEBUG
+    OPTION_ENGINE_SUBPROCESS = engine.ENGINE_SUBPROCESS
+    OPTION_ENGINE_INPROCESS = engine.ENGINE_INPROCESS
+    OPTION_ENGINE_WORKER = engine.ENGINE_WORKER
+    OPTION_LATEST_COPY = staging.STRATEGY_COPY
+    OPTION_LATEST_HARDLINK = staging.STRATEGY_HARDLINK
+    OPTION_LATEST_REFLINK = staging.STRATEGY_REFLINK
+    OPTION_LATEST_SYMLINK = staging.STRATEGY_SYMLINK
+    OPTION_STAGING_CLEAN = staging.MODE_CLEAN
+    OPTION_STAGING_INCREMENTAL = staging.MODE_INCREMENTAL
+
+    def __init__(self, **kwargs):   # pylint: disable=too-many-statements
+        """Instantiation"""
+
+        if not os.environ.get('VIRTUAL_ENV'):
+            logger.error("No virtual environment directory detected!")
+            raise NotADirectoryError
+
+        # read before removing unused options, where "" would be lost
+        runtime_tmpdir = kwargs.get('runtime_tmpdir')
+
+        # Remove unused options
+        empty_keys = [key for key, value in kwargs.items() if not value]
+        for key in empty_keys:
+            del kwargs[key]
+
+        # arguments that do NOT depend on pyppyn
+        self.flags = {}
+        self.flags["clean"] = kwargs.get('clean', False)
+
+        self.directories = {}
+        self.directories["pkg"] = kwargs.get(
+            'pkg_dir',
+            os.environ.get(
+                'GB_PKG_DIR',
+                '.'
+            )
+        )
+
+        self.directories["src"] = kwargs.get(
+            'src_dir',
+            os.environ.get(
+                'GB_SRC_DIR',
+                '.'
+            )
+        )
+
+        self.formats = {}
+        self.formats["name"] = kwargs.get(
+            'name_format',
+            os.environ.get(
+                'GB_NAME_FORMAT',
+                '{an}-{v}-standalone-{os}-{m}'
+            )
+        )
+
+        self.formats["sha"] = kwargs.get(
+            'sha_format',
+            os.environ.get(
+                'GB_SHA_FORMAT',
+                '{an}-{v}-sha256-{os}-{m}.json'
+            )
+        )
+
+        self.formats["label"] = kwargs.get(
+            'label_format',
+            os.environ.get(
+                'GB_LABEL_FORMAT',
+                '{An} {v} {ft} for {os} [GravityBee Build]'
+            )
+        )
+
+        self.extra = {}
+        self.extra["data"] = kwargs.get(
+            'extra_data',
+            None
+        )
+
+        self.extra["pkgs"] = kwargs.get(
+            'extra_pkgs',
+            []
+        )
+
+        self.extra["modules"] = kwargs.get(
+            'extra_modules',
+            []
+        )
+
+        self.directories["wheelhouse"] = kwargs.get(
+            'wheelhouse',
+            os.environ.get(
+                'GB_WHEELHOUSE',
+                None
+            )
+        )
+
+        self.flags["dont_write_file"] = kwargs.get(
+            'no_file',
+            False
+        )
+
+        self.flags["incremental"] = kwargs.get(
+            'incremental',
+            os.environ.get(
+                'GB_INCREMENTAL',
+                False
+            )
+        )
+
+        self.directories["work"] = kwargs.get(
+            'work_dir',
+            os.environ.get(
+                'GB_WORK_DIR',
+                os.path.join(
+                    BUILD_DIR,
+                    uuid.uuid1().hex[:16]
+                )
+            )
+        )
+
+        if os.path.exists(self.directories["work"]) \
+                and not self.flags["incremental"]:
+            logger.error("work_dir must not exist. It may be deleted.")
+            raise FileExistsError
+
+        self.flags["include_setup_extras"] = kwargs.get(
+            'include_setup_extras',
+            os.environ.get(
+                'GB_INCLUDE_SETUP_EXTRAS',
+                False
+            )
+        )
+
+        self.flags["one_dir"] = kwargs.get(
+            'onedir',
+            os.environ.get(
+                'GB_ONEDIR',
+                False
+            )
+        )
+
+        self.directories["staging"] = kwargs.get(
+            'staging_dir',
+            os.environ.get(
+                'GB_STAGING_DIR',
+                os.path.join(FILE_DIR, 'dist')
+            )
+        )
+
+        self.flags["with_latest"] = kwargs.get(
+            'with_latest',
+            False
+        )
+
+        self.directories["info"] = kwargs.get(
+            'info_dir',
+            os.environ.get(
+                'GB_INFO_DIR',
+                FILE_DIR
+            )
+        )
+
+        self.flags["profile"] = kwargs.get(
+            'profile',
+            os.environ.get(
+                'GB_PROFILE',
+                False
+            )
+        )
+
+        self.flags["cache"] = kwargs.get(
+            'cache',
+            os.environ.get(
+                'GB_CACHE',
+                False
+            )
+        )
+
+        self.flags["plan"] = kwargs.get(
+            'plan',
+            os.environ.get(
+                'GB_PLAN',
+                False
+            )
+        )
+
+        self.flags["precompute_metadata"] = kwargs.get(
+            'precompute_metadata',
+            os.environ.get(
+                'GB_PRECOMPUTE_METADATA',
+                False
+            )
+        )
+
+        self.flags["tree_shake"] = kwargs.get(
+            'tree_shake',
+            os.environ.get(
+                'GB_TREE_SHAKE',
+                False
+            )
+        )
+
+        self.flags["extract_cache"] = kwargs.get(
+            'extract_cache',
+            os.environ.get(
+                'GB_EXTRACT_CACHE',
+                False
+            )
+        )
+
+        self.directories["cache"] = kwargs.get(
+            'cache_dir',
+            os.environ.get(
+                'GB_CACHE_DIR',
+                os.path.join(FILE_DIR, 'cache')
+            )
+        )
+
+        self.info = {}
+        self.info["sha"] = kwargs.get(
+            'sha',
+            Arguments.OPTION_SHA_INFO
+        )
+
+        self.info["hash_algorithms"] = hashing.normalize_algorithms(
+            kwargs.get(
+                'hash_algorithms',
+                os.environ.get(
+                    'GB_HASH_ALGORITHMS',
+                    ''
+                ).split()
+            )
+        )
+
+        self.info["latest_strategy"] = kwargs.get(
+            'latest_strategy',
+            os.environ.get(
+                'GB_LATEST_STRATEGY',
+                Arguments.OPTION_LATEST_COPY
+            )
+        )
+
+        if self.info["latest_strategy"] not in staging.STRATEGIES:
+            raise ValueError(
+                "Unknown latest strategy: " + self.info["latest_strategy"])
+
+        self.info["staging_mode"] = kwargs.get(
+            'staging_mode',
+            os.environ.get(
+                'GB_STAGING_MODE',
+                Arguments.OPTION_STAGING_CLEAN
+            )
+        )
+
+        if self.info["staging_mode"] not in staging.MODES:
+            raise ValueError(
+                "Unknown staging mode: " + self.info["staging_mode"])
+
+        self.info["keep_versions"] = kwargs.get(
+            'keep_versions',
+            os.environ.get(
+                'GB_KEEP_VERSIONS',
+                None
+            )
+        )
+
+        if self.info["keep_versions"] is not None:
+            self.info["keep_versions"] = int(self.info["keep_versions"])
+
+        self.info["max_staging_size"] = staging.parse_size(kwargs.get(
+            'max_staging_size',
+            os.environ.get(
+                'GB_MAX_STAGING_SIZE',
+                None
+            )
+        ))
+
+        self.info["gc_max_age"] = workdir.parse_age(kwargs.get(
+            'gc_max_age',
+            os.environ.get(
+                'GB_GC_MAX_AGE',
+                None
+            )
+        ))
+
+        self.info["gc_max_size"] = staging.parse_size(kwargs.get(
+            'gc_max_size',
+            os.environ.get(
+                'GB_GC_MAX_SIZE',
+                None
+            )
+        ))
+
+        self.info["benchmark_runs"] = int(kwargs.get(
+            'benchmark',
+            os.environ.get(
+                'GB_BENCHMARK',
+                0
+            )
+        ))
+
+        self.info["benchmark_args"] = kwargs.get(
+            'benchmark_args',
+            os.environ.get(
+                'GB_BENCHMARK_ARGS',
+                '--help'
+            )
+        )
+
+        if isinstance(self.info["benchmark_args"], str):
+            self.info["benchmark_args"] = shlex.split(
+                self.info["benchmark_args"])
+
+        self.info["benchmark_timeout"] = float(kwargs.get(
+            'benchmark_timeout',
+            os.environ.get(
+                'GB_BENCHMARK_TIMEOUT',
+                benchmark.DEFAULT_TIMEOUT
+            )
+        ))
+
+        self.info["engine"] = kwargs.get(
+            'engine',
+            os.environ.get(
+                'GB_ENGINE',
+                Arguments.OPTION_ENGINE_SUBPROCESS
+            )
+        )
+
+        self.info["build_profile"] = kwargs.get(
+            'build_profile',
+            os.environ.get(
+                'GB_BUILD_PROFILE',
+                Arguments.OPTION_BUILD_RELEASE
+            )
+        )
+
+        if self.info["build_profile"] not in (
+                Arguments.OPTION_BUILD_RELEASE, Arguments.OPTION_BUILD_DEBUG):
+            raise ValueError(
+                "Unknown build profile: " + self.info["build_profile"])
+
+        self.flags["strip"] = kwargs.get(
+            'strip',
+            os.environ.get(
+                'GB_STRIP',
+                False
+            )
+        )
+
+        self.info["optimize"] = int(kwargs.get(
+            'optimize',
+            os.environ.get(
+                'GB_OPTIMIZE',
+                0
+            )
+        ))
+
+        if self.info["optimize"] not in (0, 1, 2):
+            raise ValueError(
+                "Unknown optimization level: " + str(self.info["optimize"]))
+
+        self.info["log_file"] = kwargs.get(
+            'log_file',
+            os.environ.get(
+                'GB_LOG_FILE',
+                None
+            )
+        )
+
+        self.info["remote_cache"] = kwargs.get(
+            'remote_cache',
+            os.environ.get(
+                'GB_REMOTE_CACHE',
+                None
+            )
+        )
+
+        # remote entries are fetched into and published from the local cache
+        self.flags["cache"] = self.flags["cache"] \
+            or bool(self.info["remote_cache"])
+
+        # arguments that DO depend on pyppyn, plans are meant to be quick
+        # so they always reuse resolved configurations
+        self.pyppy = requirements.load_config_rep(
+            self.directories["pkg"],
+            os.path.join(self.directories["cache"], 'requirements')
+            if self.flags["cache"] or self.flags["plan"] else None
+        )
+        self._required = None
+
+        self.info["console_script"] = self.pyppy.get_config_attr(
+            'console_scripts'
+        )
+        self.info["app_version"] = self.pyppy.get_config_attr('version')
+
+        # Initial values
+        self.info["app_name"] = kwargs.get(
+            'app_name',
+            os.environ.get(
+                'GB_APP_NAME',
+                self.pyppy.config['app_name']
+            )
+        )
+
+        # incremental builds share a stable, per-app work dir
+        if self.flags["incremental"] and not kwargs.get(
+                'work_dir', os.environ.get('GB_WORK_DIR')):
+            self.directories["work"] = os.path.join(
+                BUILD_DIR,
+                'incremental-' + self.info["app_name"]
+            )
+
+        self.info["pkg_name"] = kwargs.get(
+            'pkg_name',
+            os.environ.get(
+                'GB_PKG_NAME',
+                self.pyppy.get_config_attr('packages')
+            )
+        )
+
+        self.info["script_path"] = kwargs.get(
+            'script_path',
+            os.environ.get(
+                'GB_SCRIPT',
+                self.find_script()
+            )
+        )
+
+        self.info["hook_template"] = kwargs.get(
+            'hook_template',
+            os.environ.get(
+                'GB_HOOK_TEMPLATE',
+                os.path.join(
+                    os.path.dirname(__file__),
+                    "hook-template"
+                )
+            )
+        )
+
+        pl_sys = platform.system().lower()
+        self.info["operating_system"] = pl_sys if pl_sys != 'darwin' else 'osx'
+
+        self.info["machine_type"] = platform.machine().lower()
+
+        self.info["extract_max_age"] = workdir.parse_age(kwargs.get(
+            'extract_max_age',
+            os.environ.get(
+                'GB_EXTRACT_MAX_AGE',
+                None
+            )
+        ) or extraction.DEFAULT_MAX_AGE)
+
+        # an empty value means the system temp dir
+        self.info["runtime_tmpdir"] = runtime_tmpdir
+        if self.info["runtime_tmpdir"] is None:
+            self.info["runtime_tmpdir"] = os.environ.get(
+                'GB_RUNTIME_TMPDIR',
+                '.' if self.info["operating_system"] != 'windows' else None
+            )
+        self.info["runtime_tmpdir"] = self.info["runtime_tmpdir"] or None
+
+        if self.flags["extract_cache"] and (
+                self.info["operating_system"] == 'windows'
+                or self.flags["one_dir"]):
+            logger.warning(
+                "The extract cache needs a POSIX onefile build, ignoring it")
+            self.flags["extract_cache"] = False
+
+        self.run_info()
+
+    def run_info(self):
+        """Log all the attributes of this run."""
+        logger.info("Arguments:")
+        logger.info("app_name: %s", self.info["app_name"])
+        logger.info("app_version: %s", self.info["app_version"])
+        logger.info("operating_system: %s", self.info["operating_system"])
+        logger.info("machine_type: %s", self.info["machine_type"])
+        logger.info("console_script: %s", self.info["console_script"])
+        logger.info("pkg_name: %s", self.info["pkg_name"])
+        logger.info("script_path: %s", self.info["script_path"])
+        logger.info("pkg_dir: %s", self.directories["pkg"])
+        logger.info("src_dir: %s", self.directories["src"])
+        logger.info("name_format: %s", self.formats["name"])
+        logger.info("clean: %s", self.flags["clean"])
+        logger.info("work_dir: %s", self.directories["work"])
+        logger.info("incremental: %s", self.flags["incremental"])
+        logger.info("onedir: %s", self.flags["one_dir"])
+        logger.info(
+            "include_setup_extras: %s",
+            self.flags["include_setup_extras"]
+        )
+        logger.info("staging_dir: %s", self.directories["staging"])
+        logger.info("staging_mode: %s", self.info["staging_mode"])
+        logger.info("keep_versions: %s", self.info["keep_versions"])
+        logger.info("max_staging_size: %s", self.info["max_staging_size"])
+        logger.info("wheelhouse: %s", self.directories["wheelhouse"])
+        logger.info("info_dir: %s", self.directories["info"])
+        logger.info("with_latest: %s", self.flags["with_latest"])
+        logger.info("latest_strategy: %s", self.info["latest_strategy"])
+        logger.info("sha: %s", self.info["sha"])
+        logger.info("hash_algorithms: %s", self.info["hash_algorithms"])
+        logger.info("hook_template: %s", self.info["hook_template"])
+        logger.info("log_file: %s", self.info["log_file"])
+        logger.info("engine: %s", self.info["engine"])
+        logger.info("build_profile: %s", self.info["build_profile"])
+        logger.info("strip: %s", self.flags["strip"])
+        logger.info("optimize: %s", self.info["optimize"])
+        logger.info("gc_max_age: %s", self.info["gc_max_age"])
+        logger.info("gc_max_size: %s", self.info["gc_max_size"])
+        logger.info("benchmark_runs: %s", self.info["benchmark_runs"])
+        logger.info("benchmark_args: %s", self.info["benchmark_args"])
+        logger.info("benchmark_timeout: %s", self.info["benchmark_timeout"])
+        logger.info("profile: %s", self.flags["profile"])
+        logger.info("cache: %s", self.flags["cache"])
+        logger.info("plan: %s", self.flags["plan"])
+        logger.info(
+            "precompute_metadata: %s",
+            self.flags["precompute_metadata"]
+        )
+        logger.info("tree_shake: %s", self.flags["tree_shake"])
+        logger.info("runtime_tmpdir: %s", self.info["runtime_tmpdir"])
+        logger.info("extract_cache: %s", self.flags["extract_cache"])
+        logger.info("extract_max_age: %s", self.info["extract_max_age"])
+        logger.info("cache_dir: %s", self.directories["cache"])
+        logger.info("remote_cache: %s", self.info["remote_cache"])
+
+        if self.extra["data"] is not None:
+            for extra_data in self.extra["data"]:
+                logger.info("extra_data: %s", extra_data)
+
+    def get_required(self):
+        """Return the packages the application requires, resolved once."""
+        if self._required is None:
+            self._required = self.pyppy.get_required(
+                self.flags["include_setup_extras"]
+            )
+        return list(self._required)
+
+    def find_script(self):
+        """Search likely places to find the console script for app."""
+        # Windows example: C:\venv\Scripts\<console-script>-script.py
+
+        possible_paths = []
+
+        # likely posix
+        possible_paths.append(os.path.join(
+            os.environ.get('VIRTUAL_ENV'),
+            'bin',
+            self.info["console_script"]
+        ))
+
+        # likely windows
+        possible_paths.append(os.path.join(
+            os.environ.get('VIRTUAL_ENV'),
+            'Scripts',
+            self.info["console_script"] + '-script.py'
+        ))
+
+        # other windows
+        possible_paths.append(os.path.join(
+            os.environ.get('VIRTUAL_ENV'),
+            'Scripts',
+            self.info["console_script"] + '.py'
+        ))
+
+        # unlikely posix
+        possible_paths.append(os.path.join(
+            os.environ.get('VIRTUAL_ENV'),
+            'bin',
+            self.info["console_script"] + '-script.py'
+        ))
+
+        # without virtual env dir
+        possible_paths.append(os.path.join(
+            'bin',
+            self.info["console_script"]
+        ))
+
+        possible_paths.append(os.path.join(
+            'bin',
+            self.info["console_script"] + '-script.py'
+        ))
+
+        possible_paths.append(os.path.join(
+            'Scripts',
+            self.info["console_script"] + '-script.py'
+        ))
+
+        possible_paths.append(os.path.join(
+            'Scripts',
+            self.info["console_script"]
+        ))
+
+        # for conda envs, as long as you have set the env variable
+        possible_paths.append(os.path.join(
+            os.path.expanduser(os.environ.get('VIRTUAL_ENV')),
+            'Lib',
+            'site-packages',
+            self.info['pkg_name'],
+            self.info["console_script"] + '.py'
+        ))
+
+        for path in possible_paths:
+            if os.path.exists(path):
+                return path
+
+        return None
+
+
+class PackageGenerator():   # pylint: disable=too-many-instance-attributes
+    """
+    Utility for generating standalone executable versions of python
+    programs that are already packaged in a standard setuptools
+    package.
+
+    Attributes:
+        args: An instance of gravitybee.Arguments containing
+            the configuration information for GravityBee.
+        operating_system: A str of the os. This is automatically
+            determined.
+        machine_type: A str of the machine (e.g., x86_64)
+        standalone_name: A str that will be the name of the
+            standalone application.
+        gb_dir: A str of the GravityBee runtime package directory.
+        gb_filename: A str of the runtime filename.
+        gen_file: A str with name of file of the standalone
+            application created.
+        gen_file_w_path: A str with absolute path and name of file of
+            the standalone application created.
+        sha_file: A str with name of file to use in generating the SHA.
+        file_sha: A str with hash of the sha_file file.
+        file_digests: A dict of hash algorithm to hex digest of the
+            standalone application, always including sha256.
+        file_manifest: In onedir mode, a dict of relative path to SHA256
+            digest of every file. file_sha is then the Merkle root.
+        progress: An optional callable receiving the name, number and total
+            number of PyInstaller phases as they start.
+        cache: A dict with "key" (str digest of the build inputs when the
+            build cache is used), "hit" (bool indicating whether the build
+            was restored from the build cache instead of running
+            PyInstaller) and "source" ("local" or "remote" for the cache
+            that had the build, None on a miss).
+        profile: A dict with "timings" (dict of wall-clock seconds per build
+            stage) and "pyinstaller" (dict of CPU time and peak RSS of the
+            PyInstaller process, if available).
+        extract_key: With the extract cache, a str SHA256 of the archive
+            in the self-extracting executable, naming its cache dir.
+        startup: A dict of the startup benchmark (see
+            gravitybee.benchmark.benchmark()) when one was run.
+        optimization: A dict with "pyz_size" (int bytes of the PYZ archive
+            of bundled modules, None if PyInstaller didn't run), and, when
+            optimizing and a baseline is known, "pyz_size_delta" and
+            "startup_delta_seconds" compared with the last build of the
+            app without --optimize but otherwise built the same way.
+    """
+
+    ENVIRON_PREFIX = 'GB_ENV_'
+    BASELINE_DIR = 'baseline'
+    INFO_FILE = os.path.join(FILE_DIR, 'gravitybee-info.json')
+    TREE_SHAKE_FILE = os.path.join(FILE_DIR, 'gravitybee-treeshake.json')
+    FILES_FILE = os.path.join(FILE_DIR, 'gravitybee-files.json')
+    ENVIRON_SCRIPT = os.path.join(FILE_DIR, 'gravitybee-environs')
+    ENVIRON_SCRIPT_POSIX_EXT = '.sh'
+    ENVIRON_SCRIPT_WIN_EXT = '.bat'
+    ENVIRON_SCRIPT_POSIX_ENCODE = 'utf-8'
+    ENVIRON_SCRIPT_WIN_ENCODE = 'cp1252'
+
+    # 'html.parser' hidden import is introduced by botocore.
+    # We won't need this when this issue is resolved:
+    # https://github.com/pyinstaller/pyinstaller/issues/1844
+
+    # 'configparser' hidden import is also introduced by botocore.
+    # It appears to be related to this issue:
+    # https://github.com/pyinstaller/pyinstaller/issues/1935
+
+    # build steps PyInstaller reports in its log, in order
+    PYINSTALLER_PHASES = ('Analysis', 'PYZ', 'PKG', 'EXE', 'COLLECT')
+    PYINSTALLER_PHASE_RE = re.compile(
+        r'INFO: (?:checking|Building) (' + '|'.join(PYINSTALLER_PHASES)
+        + r')\b')
+    PYINSTALLER_ERROR_LINES = 40
+    # first PyInstaller with --optimize; older ones use the level they run at
+    PYINSTALLER_OPTIMIZE_VERSION = (6, 6)
+
+    EXTRA_REQD_PACKAGES = [
+        # 'packaging',
+        # 'configparser',
+        # 'setuptools'
+    ]
+
+    EXTRA_REQD_MODULES = [
+        # 'packaging',
+        # 'configparser',
+        # 'packaging.version',
+        # 'packaging.specifiers',
+        # 'pkg_resources',
+        # 'html.parser',
+        # 'distutils'
+        'pkg_resources.py2_warn'
+    ]
+
+    @classmethod
+    def get_hash(cls, filename):
+        """
+        Finds a SHA256 for the given file.
+
+        Args:
+            filename: A str representing a file.
+        """
+
+        digests = hashing.hash_file(filename)
+        if digests is not None:
+            return digests[hashing.DEFAULT_ALGORITHM]
+
+        return None
+
+    def __init__(self, args=None, progress=None):
+
+        self.args = args
+        self.progress = progress
+
+        self.files = {}
+
+        self.files["gen"] = None            # not set until file is created
+        self.files["gen_w_path"] = None     # not set until file is created
+        self.files["sha"] = None            # not set until file is created
+        self.files["sha_w_path"] = None     # not set until file is created
+        self.files["stage_root"] = None     # not set until staging
+        self.files["hook"] = None
+
+        # output files keep their default names but may live elsewhere
+        self.files["info"] = os.path.join(
+            self.args.directories["info"],
+            os.path.basename(PackageGenerator.INFO_FILE))
+        self.files["files"] = os.path.join(
+            self.args.directories["info"],
+            os.path.basename(PackageGenerator.FILES_FILE))
+        self.files["environ"] = os.path.join(
+            self.args.directories["info"],
+            os.path.basename(PackageGenerator.ENVIRON_SCRIPT))
+        self.files["tree_shake"] = os.path.join(
+            self.args.directories["info"],
+            os.path.basename(PackageGenerator.TREE_SHAKE_FILE))
+
+        self.file_sha = None
+        self.file_digests = None
+        self.file_manifest = None
+        self.tree_shake = None
+        self.startup = None
+        self.extract_key = None
+        self.optimization = {"pyz_size": None}
+        self.cache = {}
+        self.cache["key"] = None
+        self.cache["hit"] = False
+        self.cache["source"] = None
+
+        self.profile = {}
+        self.profile["timings"] = {}
+        self.profile["pyinstaller"] = None
+
+        self.standalone_name = self.args.formats["name"].format(
+            an=self.args.info["app_name"],
+            v=self.args.info["app_version"],
+            os=self.args.info["operating_system"],
+            m=self.args.info["machine_type"]
+        )
+
+        self.gb_dir, self.gb_filename = os.path.split(__file__)
+
+        if not os.path.exists(self.args.directories["work"]):
+            os.makedirs(self.args.directories["work"])
+
+        if not os.path.exists(
+                os.path.join(self.args.directories["work"], 'hooks')):
+            os.makedirs(os.path.join(self.args.directories["work"], 'hooks'))
+
+        if not os.path.exists(FILE_DIR):
+            os.makedirs(FILE_DIR)
+
+        if not os.path.exists(self.args.directories["info"]):
+            os.makedirs(self.args.directories["info"])
+
+        # PyInstaller's caches are keyed on the script path so incremental
+        # builds need a stable name
+        script_prefix = uuid.uuid1().hex[:16] + '_'
+        if self.args.flags["incremental"]:
+            script_prefix = ''
+
+        self._temp_script = os.path.join(
+            self.args.directories["work"],
+            script_prefix + self.args.info["console_script"] + '.py'
+        )
+
+        # parts of the hook that are found once per build
+        self._hidden = None
+        self._metadata = None
+
+        logger.info("Package generator:")
+        logger.info("standalone_name: %s", self.standalone_name)
+
+    def _hiddenimports(self):
+        """Return the hook's hiddenimports as Python source."""
+        if self._hidden is None:
+            submodules = discovery.find_submodules(
+                self._pkg_source_dir(),
+                os.path.join(self.args.directories["cache"], 'submodules')
+            )
+
+            if submodules is None:
+                # let PyInstaller import the package to find them
+                self._hidden = "collect_submodules('" \
+                    + self.args.info["pkg_name"] + "')"
+            else:
+                self._hidden = "[\n" + "".join(
+                    "    '" + module + "',\n" for module in submodules
+                ) + "]"
+
+        return self._hidden
+
+    def _precomputed_metadata(self):
+        """Return hook lines adding dependency metadata dirs directly."""
+        if self._metadata is None:
+            datas, unresolved = requirements.metadata_datas(
+                self.args.get_required(),
+                os.path.join(self.args.directories["cache"], 'metadata')
+            )
+
+            self._metadata = "\ndatas += [\n" + "".join(
+                "    ('" + source.replace("\\", "/") + "', '"
+                + destination + "'),\n"
+                for source, destination in datas
+            ) + "]"
+
+            # no metadata dir found, let PyInstaller look for it
+            for package in unresolved:
+                self._metadata += \
+                    "\ndatas += copy_metadata('" + package + "')"
+
+        return self._metadata
+
+    def _generate_hook_text_from_template(self):
+        # get the hook ready
+        with open(
+            self.args.info["hook_template"], "r", encoding="utf8"
+        ) as hook_fh:
+            template = Template(hook_fh.read())
+
+        hook = template.safe_substitute(
+            {
+                'app_name': self.args.info["app_name"],
+                'pkg_name': self.args.info["pkg_name"],
+                'hiddenimports': self._hiddenimports()
+            })
+
+        # 1 - extra data
+        hook += "# collection extra data, if any (using --extra-data option)"
+        for data in self.args.extra.get("data") or []:
+            extradir = self._pkg_source_dir() + os.sep + data
+            # handle relative paths for extra data
+            pkg = os.path.normpath(
+                self.args.info["pkg_name"] + "/" + data
+            ).replace("\\", "/")
+            # Normalize the path, replace backslashes with forward slashes
+            # Otherwise, we risk character literals (like \t) being in the
+            # path string
+            extradir = os.path.normpath(extradir).replace("\\", "/")
+            hook += "\ndatas.append(('"
+            hook += extradir
+            hook += "', '" + pkg + "'))"
+            hook += "\n\n"
+
+        # 2 - package metadata
+        hook += "# add dependency metadata"
+        if self.args.flags["precompute_metadata"]:
+            hook += self._precomputed_metadata()
+        else:
+            for package in self.args.get_required():
+                # datas += copy_metadata(pkg)
+                hook += "\ndatas += copy_metadata('" + package + "')"
+
+        hook += "\n"
+        return hook
+
+    def _create_hook(self):
+        hook = self._generate_hook_text_from_template()
+
+        # 3 - write file
+        self.files["hook"] = os.path.join(
+            self.args.directories["work"],
+            'hooks',
+            "hook-" + self.args.info["pkg_name"] + ".py"
+        )
+        with open(self.files["hook"], "w+", encoding="utf8") as hook_file:
+            hook_file.write(hook)
+
+        logger.info("Created hook file: %s", self.files["hook"])
+
+    def _latest_name(self, name_format, extension=''):
+        """Return a file name in the 'latest' dir."""
+        return name_format.format(
+            an=self.args.info["app_name"],
+            v='latest',
+            os=self.args.info["operating_system"],
+            m=self.args.info["machine_type"]
+        ) + extension
+
+    def _process_sha(self):
+
+        logger.info("Processing SHA256 hash info...")
+
+        if self.args.flags["one_dir"]:
+            # one digest for the whole tree, files compared by manifest
+            self.file_sha, self.file_manifest = hashing.hash_tree(
+                self.files["gen_w_path"])
+            logger.info(
+                "Merkle root of %s files: %s",
+                len(self.file_manifest),
+                self.file_sha
+            )
+
+        # staging only hashes what it had to copy
+        elif self.file_digests is None:
+            self.file_digests = hashing.hash_file(
+                self.files["gen_w_path"],
+                self.args.info["hash_algorithms"]
+            )
+        if self.file_digests is not None:
+            self.file_sha = self.file_digests[hashing.DEFAULT_ALGORITHM]
+
+        if self.args.info["sha"] == Arguments.OPTION_SHA_FILE:
+
+            # in memory version of file contents
+            sha_dict = {}
+            sha_dict[self.files["gen"]] = self.file_sha
+
+            if self.file_manifest is not None:
+                sha_dict['manifest'] = self.file_manifest
+
+            # other digests only when asked for to keep the format
+            elif len(self.file_digests) > 1:
+                sha_dict['digests'] = self.file_digests
+
+            # file name
+            self.files["sha"] = self.args.formats["sha"].format(
+                an=self.args.info["app_name"],
+                v=self.args.info["app_version"],
+                os=self.args.info["operating_system"],
+                m=self.args.info["machine_type"]
+            )
+
+            self.files["sha_w_path"] = os.path.join(
+                os.path.dirname(self.files["gen_w_path"]),
+                self.files["sha"]
+            )
+
+            logger.info("SHA artifact: %s", self.files["sha_w_path"])
+
+            with open(
+                self.files["sha_w_path"], 'w', encoding="utf8"
+            ) as sha_file:
+                sha_file.write(json.dumps(sha_dict))
+
+            if self.args.flags["with_latest"]:
+
+                latest_sha_file = os.path.join(
+                    self.files["stage_root"],
+                    staging.LATEST_DIR,
+                    self._latest_name(self.args.formats["sha"])
+                )
+
+                staging.stage_file(
+                    self.files["sha_w_path"],
+                    latest_sha_file,
+                    self.args.info["latest_strategy"]
+                )
+
+                logger.info("Latest SHA artifact: %s", latest_sha_file)
+
+    def _stage_artifacts(self):
+
+        logger.info("Staging artifacts...")
+
+        # create directories
+        if self.args.info["staging_mode"] == \
+                Arguments.OPTION_STAGING_INCREMENTAL:
+            # staged beside earlier versions, published by renaming
+            if not os.path.exists(self.args.directories["staging"]):
+                os.makedirs(self.args.directories["staging"])
+            self.files["stage_root"] = staging.temp_dir(
+                self.args.directories["staging"])
+        else:
+            if os.path.exists(self.args.directories["staging"]):
+                logger.info(
+                    "Removing staging directory: %s",
+                    self.args.directories["staging"])
+                shutil.rmtree(self.args.directories["staging"])
+
+            os.makedirs(self.args.directories["staging"])
+            self.files["stage_root"] = self.args.directories["staging"]
+
+        # version-based dir
+        version_dst = os.path.join(
+            self.files["stage_root"],
+            self.args.info["app_version"]
+        )
+        if not os.path.exists(version_dst):
+            os.makedirs(version_dst)
+
+        # a rename reads nothing, only a copy across filesystems is hashed
+        if self.args.flags["one_dir"]:
+            shutil.move(self.files["gen_w_path"], version_dst)
+        else:
+            self.file_digests = hashing.move_and_hash(
+                self.files["gen_w_path"],
+                version_dst,
+                self.args.info["hash_algorithms"]
+            )
+
+        # update path
+        self.files["gen_w_path"] = os.path.join(
+            version_dst,
+            self.files["gen"]
+        )
+
+        logger.info("Main artifact: %s", self.files["gen_w_path"])
+
+        # dir just called 'latest'
+        if self.args.flags["with_latest"]:
+
+            logger.info("Creating latest dir...")
+
+            latest_dst = os.path.join(
+                self.files["stage_root"],
+                staging.LATEST_DIR
+            )
+            if not os.path.exists(latest_dst):
+                os.makedirs(latest_dst)
+
+            latest_standalone = os.path.join(
+                latest_dst,
+                self._latest_name(
+                    self.args.formats["name"],
+                    ".exe" if self.files["gen"].endswith(".exe") else ""
+                )
+            )
+
+            logger.info(
+                "Staging latest (%s)...", self.args.info["latest_strategy"])
+
+            if self.args.flags["one_dir"]:
+                staging.stage_tree(
+                    self.files["gen_w_path"],
+                    latest_standalone,
+                    self.args.info["latest_strategy"]
+                )
+            elif not staging.link(
+                    self.files["gen_w_path"],
+                    latest_standalone,
+                    self.args.info["latest_strategy"]):
+                # hash while copying, checking against any earlier digests
+                self.file_digests = hashing.copy_and_hash(
+                    self.files["gen_w_path"],
+                    latest_standalone,
+                    self.args.info["hash_algorithms"],
+                    expected=self.file_digests
+                )
+
+            logger.info("Latest artifact: %s", latest_standalone)
+
+    def _publish_artifacts(self):
+        """Swap incrementally staged artifacts into place and prune."""
+        if self.files["stage_root"] == self.args.directories["staging"]:
+            return
+
+        logger.info("Publishing staged artifacts...")
+
+        for name in os.listdir(self.files["stage_root"]):
+            staging.swap_in(
+                os.path.join(self.files["stage_root"], name),
+                os.path.join(self.args.directories["staging"], name)
+            )
+        os.rmdir(self.files["stage_root"])
+
+        for key in ("gen_w_path", "sha_w_path"):
+            if self.files[key] is not None:
+                self.files[key] = os.path.join(
+                    self.args.directories["staging"],
+                    os.path.relpath(self.files[key], self.files["stage_root"])
+                )
+        self.files["stage_root"] = self.args.directories["staging"]
+
+        logger.info("Main artifact: %s", self.files["gen_w_path"])
+
+        staging.prune_versions(
+            self.args.directories["staging"],
+            keep=self.args.info["keep_versions"],
+            max_size=self.args.info["max_staging_size"],
+            protect=(self.args.info["app_version"],)
+        )
+
+    def _discard_staged(self):
+        """Remove incrementally staged artifacts that weren't published."""
+        stage_root = self.files["stage_root"]
+        if stage_root is None \
+                or stage_root == self.args.directories["staging"]:
+            return
+
+        logger.info("Removing unpublished staged artifacts: %s", stage_root)
+        shutil.rmtree(stage_root, ignore_errors=True)
+        self.files["stage_root"] = None
+
+    def _gather_info(self):     # pylint: disable=too-many-statements
+        # GATHER INFO -------------------------------------------
+        gb_info = {}
+        gb_info['app_name'] = self.args.info["app_name"]
+        gb_info['app_version'] = self.args.info["app_version"]
+        gb_info['operating_system'] = self.args.info["operating_system"]
+        gb_info['machine_type'] = self.args.info["machine_type"]
+        gb_info['console_script'] = self.args.info["console_script"]
+        gb_info['script_path'] = self.args.info["script_path"]
+        gb_info['pkg_dir'] = self.args.directories["pkg"]
+        gb_info['src_dir'] = self.args.directories["src"]
+        gb_info['name_format'] = self.args.formats["name"]
+        gb_info['clean'] = self.args.flags["clean"]
+        gb_info['work_dir'] = self.args.directories["work"]
+        gb_info['incremental'] = self.args.flags["incremental"]
+        gb_info['onedir'] = self.args.flags["one_dir"]
+        gb_info['build_profile'] = self.args.info["build_profile"]
+        gb_info['optimize'] = self.args.info["optimize"]
+        gb_info.update(self.optimization)
+        gb_info['runtime_tmpdir'] = self.args.info["runtime_tmpdir"]
+        gb_info['extract_cache'] = self.args.flags["extract_cache"]
+        if self.extract_key is not None:
+            gb_info['extract_key'] = self.extract_key
+        gb_info['include_setup_extras'] = self.args.flags[
+            "include_setup_extras"
+        ]
+        gb_info['staging_dir'] = self.args.directories["staging"]
+        gb_info['staging_mode'] = self.args.info["staging_mode"]
+        gb_info['info_dir'] = self.args.directories["info"]
+        gb_info['with_latest'] = self.args.flags["with_latest"]
+        gb_info['latest_strategy'] = self.args.info["latest_strategy"]
+        gb_info['gen_file'] = self.files["gen"]
+        gb_info['gen_file_w_path'] = self.files["gen_w_path"]
+
+        if self.tree_shake is not None:
+            gb_info['tree_shake_excluded'] = len(self.tree_shake['excluded'])
+            gb_info['tree_shake_source_bytes'] = \
+                self.tree_shake['source_bytes']
+
+        if self.args.flags["cache"]:
+            gb_info['cache_key'] = self.cache["key"]
+            gb_info['cache_hit'] = self.cache["hit"]
+            gb_info['cache_source'] = self.cache["source"]
+
+        gb_info['file_sha'] = self.file_sha
+
+        if self.startup is not None:
+            gb_info['benchmark'] = self.startup
+
+        if self.args.flags["one_dir"]:
+            gb_info['file_manifest'] = self.file_manifest
+        else:
+            gb_info['file_digests'] = self.file_digests
+
+        if self.args.info["sha"] == Arguments.OPTION_SHA_FILE:
+            gb_info['sha_file'] = self.files["sha"]
+            gb_info['sha_file_w_path'] = self.files["sha_w_path"]
+            gb_info['sha_format'] = self.args.formats["sha"]
+
+        gb_info['extra_data'] = []
+
+        if self.args.extra["data"] is not None:
+            for extra_data in self.args.extra["data"]:
+                gb_info['extra_data'].append(extra_data)
+
+        # INFO file ---------------------------------------------
+        logger.info(
+            "Writing information file: %s",
+            self.files["info"]
+        )
+        with open(
+            self.files["info"], 'w', encoding="utf8"
+        ) as info_file:
+            info_file.write(json.dumps(gb_info))
+
+        return gb_info
+
+    def _write_info_files(self):
+
+        if not self.args.flags["dont_write_file"]:
+
+            gb_info = self._gather_info()
+
+            # FILES file --------------------------------------------
+
+            # create memory structure
+            gb_files = []
+            gb_file = {}
+            gb_file['filename'] = self.files["gen"]
+            gb_file['path'] = self.files["gen_w_path"]
+            if self.files["gen"].endswith(".exe"):
+                gb_file['mime-type'] = \
+                    'application/vnd.microsoft.portable-executable'
+            else:
+                gb_file['mime-type'] = 'application/x-executable'
+            os_label = self.args.info["operating_system"].title()
+            if self.args.info["operating_system"] == 'osx':
+                os_label = self.args.info["operating_system"].upper()
+            gb_file['label'] = self.args.formats["label"].format(
+                An=self.args.info["app_name"].title(),
+                an=self.args.info["app_name"],
+                v=self.args.info["app_version"],
+                os=os_label,
+                m=self.args.info["machine_type"],
+                ft="Standalone Executable"
+            )
+            gb_files.append(gb_file)
+
+            if self.args.info["sha"] == Arguments.OPTION_SHA_FILE:
+
+                sha_file_info = {}
+                sha_file_info['filename'] = self.files["sha"]
+                sha_file_info['path'] = self.files["sha_w_path"]
+                sha_file_info['mime-type'] = 'application/json'
+                sha_file_info['label'] = self.args.formats["label"].format(
+                    An=self.args.info["app_name"].title(),
+                    an=self.args.info["app_name"],
+                    v=self.args.info["app_version"],
+                    os=os_label,
+                    m=self.args.info["machine_type"],
+                    ft="Standalone Executable SHA256 Hash"
+                )
+                gb_files.append(sha_file_info)
+
+            # write to disk
+            logger.info(
+                "Writing files file: %s",
+                self.files["files"]
+            )
+            with open(
+                self.files["files"], 'w', encoding="utf8"
+            ) as file_file:
+                file_file.write(json.dumps(gb_files))
+
+            # ENVIRONS ----------------------------------------------
+
+            # remove attributes that aren't useful as exported
+            # environs
+            del gb_info['extra_data']
+            gb_info.pop('file_digests', None)
+            gb_info.pop('file_manifest', None)
+            gb_info.pop('benchmark', None)
+            del gb_info['name_format']
+            del gb_info['clean']
+
+            try:
+                del gb_info['sha_format']
+            except KeyError:
+                pass
+
+            logger.info(
+                "Writing environ script: %s",
+                self.files["environ"]
+                + PackageGenerator.ENVIRON_SCRIPT_POSIX_EXT
+            )
+            with open(
+                self.files["environ"]
+                + PackageGenerator.ENVIRON_SCRIPT_POSIX_EXT,
+                mode="w",
+                encoding=PackageGenerator.ENVIRON_SCRIPT_POSIX_ENCODE,
+            ) as shell:
+                for key, value in gb_info.items():
+                    shell.write("export ")
+                    shell.write(PackageGenerator.ENVIRON_PREFIX + key.upper())
+                    shell.write('="')
+                    shell.write(str(value))
+                    shell.write('"\n')
+
+            logger.info(
+                "Writing environ script: %s%s",
+                self.files["environ"],
+                PackageGenerator.ENVIRON_SCRIPT_WIN_EXT
+            )
+
+            with open(
+                self.files["environ"]
+                + PackageGenerator.ENVIRON_SCRIPT_WIN_EXT,
+                mode="w",
+                encoding=PackageGenerator.ENVIRON_SCRIPT_WIN_ENCODE,
+            ) as bat:
+                for key, value in gb_info.items():
+                    bat.write("set ")
+                    bat.write(PackageGenerator.ENVIRON_PREFIX + key.upper())
+                    bat.write("=")
+                    bat.write(str(value))
+                    bat.write("\r\n")
+
+    def _cleanup(self):
+
+        if self.args.flags["clean"] and self.args.flags["incremental"]:
+            logger.info(
+                "Keeping incremental work dir: %s",
+                self.args.directories["work"])
+        elif self.args.flags["clean"]:
+            logger.info("Cleaning up...")
+
+            # clean work dir in a detached process, off the critical path
+            if os.path.isdir(self.args.directories["work"]):
+                logger.info(
+                    "Deleting working dir: %s",
+                    self.args.directories["work"])
+                workdir.remove_tree(
+                    self.args.directories["work"], trash_dir=BUILD_DIR)
+
+        # kept work dirs are aged from when they were last used
+        if os.path.isdir(self.args.directories["work"]):
+            os.utime(self.args.directories["work"])
+
+        if self.args.info["gc_max_age"] is not None \
+                or self.args.info["gc_max_size"] is not None:
+            logger.info("Collecting old work dirs: %s", BUILD_DIR)
+            workdir.collect_garbage_later(
+                BUILD_DIR,
+                max_age=self.args.info["gc_max_age"],
+                max_size=self.args.info["gc_max_size"],
+                protect=(self.args.directories["work"],)
+            )
+
+    def _pyinstaller_commands(self):
+        commands = [
+            'pyinstaller',
+            '--noconfirm',
+            '--name', self.standalone_name,
+            '--paths', self.args.directories["src"],
+            '--additional-hooks-dir', os.path.join(
+                self.args.directories["work"], 'hooks'),
+            '--specpath', self.args.directories["work"],
+            '--workpath', os.path.join(self.args.directories["work"], 'build'),
+            '--distpath', os.path.join(self.args.directories["work"], 'dist'),
+            '--hidden-import', self.args.info["pkg_name"],
+        ]
+
+        insert_point = commands.index('--noconfirm') + 1
+        if self.args.flags["one_dir"]:
+            commands[insert_point:insert_point] = ['--onedir']
+        elif self.args.flags["extract_cache"]:
+            # packaged into a self-extracting executable after the build
+            commands[insert_point:insert_point] = ['--onedir']
+        else:
+            commands[insert_point:insert_point] = ['--onefile']
+
+        insert_point = commands.index('--noconfirm') + 1
+        commands[insert_point:insert_point] = self._profile_options()
+
+        if self.args.info["optimize"]:
+            level = self.args.info["optimize"]
+            if self._pyinstaller_optimizes():
+                commands[insert_point:insert_point] = [
+                    '--optimize', str(level)]
+            else:
+                commands[0:1] = [
+                    sys.executable, '-' + 'O' * level, '-m', 'PyInstaller']
+
+        insert_point = commands.index('--noconfirm') + 1
+        if self.args.flags["clean"] and not self.args.flags["incremental"]:
+            commands[insert_point:insert_point] = ['--clean']
+
+        for extra_module in list(
+                set(self.EXTRA_REQD_MODULES) | set(self.args.extra["modules"])
+        ):
+            commands += ['--hidden-import', extra_module]
+
+        if self.tree_shake is not None:
+            for module in self.tree_shake['excluded']:
+                commands += ['--exclude-module', module]
+
+        commands += [
+            self._temp_script
+        ]
+
+        if self.args.info["runtime_tmpdir"] \
+                and not self.args.flags["extract_cache"]:
+            insert_point = commands.index('--noconfirm') + 1
+            commands[insert_point:insert_point] = [
+                '--runtime-tmpdir', self.args.info["runtime_tmpdir"]]
+
+        return commands
+
+    def _profile_options(self):
+        """Return the PyInstaller options of the build profile."""
+        if self.args.info["build_profile"] == Arguments.OPTION_BUILD_DEBUG:
+            return ['--debug', 'all']
+
+        # UPX saves space but every launch pays to decompress
+        if self.args.flags["strip"] \
+                and self.args.info["operating_system"] != 'windows':
+            return ['--strip', '--noupx']
+        return ['--noupx']
+
+    @classmethod
+    def _pyinstaller_optimizes(cls):
+        """Return True if PyInstaller has the --optimize option."""
+        match = re.match(
+            r'(\d+)\.(\d+)', installed_version('pyinstaller') or '')
+        return match is not None and tuple(
+            int(part) for part in match.groups()
+        ) >= cls.PYINSTALLER_OPTIMIZE_VERSION
+
+    def install_extra_packages(self):
+        """Install extra packages that the application does not require."""
+        required = self.args.get_required()
+        extra_packages = sorted(
+            (set(self.EXTRA_REQD_PACKAGES) | set(self.args.extra["pkgs"]))
+            - set(required)
+        )
+        requirements.install_packages(
+            extra_packages, self.args.directories["wheelhouse"])
+
+    def _tree_shake(self):
+        """Find modules of third-party packages the app never imports."""
+        logger.info("Analyzing imports...")
+
+        graph = treeshake.ImportGraph(
+            [os.path.abspath(os.path.dirname(self._pkg_source_dir()))]
+            + sys.path
+        )
+        graph.add_script(self._temp_script)
+
+        # everything the hook and command line add is reachable too
+        graph.add_modules(
+            [self.args.info["pkg_name"]]
+            + [module for module, _ in discovery.package_modules(
+                self._pkg_source_dir())]
+            + self.EXTRA_REQD_MODULES + list(self.args.extra["modules"])
+        )
+
+        self.tree_shake = treeshake.unreachable(
+            graph, keep=[self.args.info["pkg_name"]])
+
+        logger.info(
+            "Excluding %s modules (%s bytes of source), report: %s",
+            len(self.tree_shake['excluded']),
+            self.tree_shake['source_bytes'],
+            self.files["tree_shake"]
+        )
+
+        with open(self.files["tree_shake"], 'w', encoding="utf8") as report:
+            report.write(json.dumps(self.tree_shake))
+
+    def _pkg_source_dir(self):
+        """Return the path of the application package's source."""
+        source_dir = self.args.directories["pkg"] + os.sep
+        if self.args.directories["src"] != ".":
+            source_dir += self.args.directories["src"] + os.sep
+        return source_dir + self.args.info["pkg_name"]
+
+    def _placeholders(self):
+        """
+        Return paths that differ between runs and machines.
+
+        Returns:
+            A list of tuples of a str path and its placeholder, longest
+            path first so that nested paths are replaced first.
+        """
+        # work dir and temp script names are unique per run, and the
+        # interpreter and site-packages depend on where the venv is
+        paths = {
+            self._temp_script: '$script',
+            self.args.directories["work"]: '$work',
+            sys.executable: '$python',
+            os.path.abspath(self.args.directories["pkg"]): '$pkg',
+        }
+        for name in ('purelib', 'platlib'):
+            paths[sysconfig.get_paths()[name]] = '$site'
+
+        # the hook writes paths with forward slashes
+        for path, placeholder in list(paths.items()):
+            paths[path.replace("\\", "/")] = placeholder
+
+        return sorted(
+            ((path, placeholder) for path, placeholder in paths.items()
+             if path),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+
+    def _build_inputs(self, commands):
+        """Collect everything that determines the output of PyInstaller."""
+        # replaced with placeholders so the key is stable across runs and
+        # can be shared by machines with their venvs in different places
+        placeholders = self._placeholders()
+
+        def normalize(text):
+            for path, placeholder in placeholders:
+                text = text.replace(path, placeholder)
+            return text
+
+        required = sorted(
+            set(self.args.get_required())
+            | set(self.EXTRA_REQD_PACKAGES) | set(self.args.extra["pkgs"])
+        )
+
+        extra_data = {}
+        for data in self.args.extra.get("data") or []:
+            extra_data[data] = tree_digest(
+                os.path.join(self._pkg_source_dir(), data))
+
+        return {
+            'gravitybee': __version__,
+            'python': sys.version,
+            'pyinstaller': installed_version('pyinstaller'),
+            'operating_system': self.args.info["operating_system"],
+            'machine_type': self.args.info["machine_type"],
+            'hook': normalize(self._generate_hook_text_from_template()),
+            'script': file_digest(self._temp_script),
+            'required': {
+                package: installed_version(package) for package in required
+            },
+            'commands': [normalize(command) for command in commands],
+            'source': tree_digest(self._pkg_source_dir()),
+            'extra_data': extra_data,
+        }
+
+    def _build_dir(self):
+        """Return the PyInstaller build dir (--workpath) for this app."""
+        return os.path.join(
+            self.args.directories["work"], 'build', self.standalone_name)
+
+    @staticmethod
+    def _incremental_fingerprint(build_inputs):
+        # PyInstaller tracks changes to the package source and script
+        # itself, everything else it is given requires a fresh analysis
+        return compute_key({
+            key: value for key, value in build_inputs.items()
+            if key not in ('source', 'script')
+        })
+
+    @contextlib.contextmanager
+    def _timed(self, stage):
+        """Record the wall-clock time spent in a stage of the build."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.profile["timings"][stage] = round(
+                time.perf_counter() - start, 6)
+
+    def _record_rusage(self, rusage):
+        # ru_maxrss is in kilobytes except on macOS where it is in bytes
+        # for in-process engines the values are for the running process
+        rss_scale = 1 if sys.platform == 'darwin' else 1024
+        self.profile["pyinstaller"] = {
+            'user_cpu_seconds': round(rusage.ru_utime, 6),
+            'system_cpu_seconds': round(rusage.ru_stime, 6),
+            'max_rss_bytes': rusage.ru_maxrss * rss_scale,
+        }
+
+    def _phase(self, line, seen):
+        """Report a PyInstaller phase the first time it shows up."""
+        match = PackageGenerator.PYINSTALLER_PHASE_RE.search(line)
+        if match is None or match.group(1) in seen:
+            return
+
+        seen.append(match.group(1))
+        phases = PackageGenerator.PYINSTALLER_PHASES
+        if not self.args.flags["one_dir"] \
+                and not self.args.flags["extract_cache"]:
+            phases = phases[:-1]
+
+        logger.info(
+            "PyInstaller phase %s/%s: %s",
+            len(seen),
+            len(phases),
+            match.group(1)
+        )
+
+        if self.progress is not None:
+            self.progress(match.group(1), len(seen), len(phases))
+
+    def _run_pyinstaller(self, commands):
+        logger.info("PyInstaller commands (%s):", self.args.info["engine"])
+        logger.info(", ".join(commands))
+
+        log_file = None
+        if self.args.info["log_file"]:
+            log_file = open(        # pylint: disable=consider-using-with
+                self.args.info["log_file"], 'w', encoding="utf8")
+
+        seen = []
+        tail = collections.deque(
+            maxlen=PackageGenerator.PYINSTALLER_ERROR_LINES)
+
+        def on_line(line):
+            logger.debug(line)
+            tail.append(line)
+            if log_file is not None:
+                log_file.write(line + "\n")
+            self._phase(line, seen)
+
+        engine_name = self.args.info["engine"]
+        if commands[0] != 'pyinstaller' \
+                and engine_name != engine.ENGINE_SUBPROCESS:
+            # an in-process PyInstaller can't change its optimization level
+            logger.warning(
+                "Running PyInstaller as a subprocess to optimize bytecode")
+            engine_name = engine.ENGINE_SUBPROCESS
+
+        try:
+            returncode, rusage = engine.get_engine(engine_name).run(
+                commands, on_line)
+        finally:
+            if log_file is not None:
+                log_file.close()
+
+        if rusage is not None:
+            self._record_rusage(rusage)
+
+        if returncode != 0:
+            logger.error("\n".join(tail))
+
+        return returncode
+
+    def _benchmark(self):
+        """Measure the startup of the staged standalone application."""
+        executable = self.files["gen_w_path"]
+        if self.args.flags["one_dir"]:
+            executable = os.path.join(
+                executable,
+                self.standalone_name + (
+                    '.exe' if self.args.info["operating_system"] == 'windows'
+                    else ''
+                )
+            )
+
+        logger.info(
+            "Benchmarking startup (%s runs): %s %s",
+            self.args.info["benchmark_runs"],
+            executable,
+            ' '.join(self.args.info["benchmark_args"])
+        )
+
+        self.startup = benchmark.benchmark(
+            executable,
+            self.args.info["benchmark_args"],
+            self.args.info["benchmark_runs"],
+            self.args.info["benchmark_timeout"]
+        )
+
+        logger.info(
+            "Startup: first run %ss, warm %s, peak RSS %s bytes",
+            self.startup['first_run_seconds'],
+            self.startup['warm_seconds'],
+            self.startup['max_rss_bytes']
+        )
+
+    def _find_standalone(self):
+        # get info about standalone binary
+        for standalone in glob.glob(
+                os.path.join(
+                    self.args.directories["work"],
+                    'dist',
+                    self.standalone_name + '*'
+                )):
+            self.files["gen_w_path"] = standalone
+            self.files["gen"] = os.path.basename(self.files["gen_w_path"])
+            logger.info("Generated standalone file: %s", self.files["gen"])
+
+    def _make_bootstrap(self):
+        """Replace the built app dir with a self-extracting executable."""
+        app_dir = self.files["gen_w_path"]
+        bootstrap = app_dir + '.bootstrap'
+
+        self.extract_key = extraction.make_bootstrap(
+            app_dir,
+            bootstrap,
+            self.args.info["app_name"],
+            self.args.info["app_version"],
+            self.args.info["extract_max_age"]
+        )
+
+        shutil.rmtree(app_dir)
+        os.replace(bootstrap, app_dir)
+
+    def _pyz_size(self):
+        """Return the bytes of the PYZ archive(s) of the build, or None."""
+        archives = glob.glob(os.path.join(self._build_dir(), 'PYZ-*.pyz'))
+        if not archives:
+            return None
+        return sum(os.path.getsize(archive) for archive in archives)
+
+    def _compare_baseline(self):
+        """Compare an optimized build with the last unoptimized one."""
+        startup = None
+        if self.startup is not None:
+            startup = (self.startup['warm_seconds'] or {}).get(
+                'p50', self.startup['first_run_seconds'])
+
+        # only builds differing just in --optimize are comparable
+        baseline_dir = os.path.join(
+            self.args.directories["info"], self.BASELINE_DIR)
+        baseline_file = os.path.join(baseline_dir, '-'.join([
+            self.args.info["app_name"],
+            self.args.info["operating_system"],
+            self.args.info["machine_type"],
+            compute_key({
+                'one_dir': bool(self.args.flags["one_dir"]),
+                'extract_cache': bool(self.args.flags["extract_cache"]),
+                'build_profile': self.args.info["build_profile"],
+                'strip': bool(self.args.flags["strip"]),
+                'tree_shake': bool(self.args.flags["tree_shake"]),
+                'precompute_metadata': bool(
+                    self.args.flags["precompute_metadata"]),
+                'runtime_tmpdir': self.args.info["runtime_tmpdir"],
+                'benchmark_args': self.args.info["benchmark_args"]
+                if self.startup is not None else None,
+            })[:16],
+        ]) + '.json')
+
+        if not self.args.info["optimize"]:
+            # nothing is written with --no-file, baselines included
+            if self.optimization["pyz_size"] is not None \
+                    and not self.args.flags["dont_write_file"]:
+                os.makedirs(baseline_dir, exist_ok=True)
+                temp_file = baseline_file + '.' + str(os.getpid())
+                with open(temp_file, 'w', encoding="utf8") as baseline:
+                    baseline.write(json.dumps({
+                        'pyz_size': self.optimization["pyz_size"],
+                        'startup_seconds': startup,
+                    }))
+                os.replace(temp_file, baseline_file)
+            return
+
+        if not os.path.isfile(baseline_file):
+            logger.info("No unoptimized baseline to compare with yet")
+            return
+
+        with open(baseline_file, 'r', encoding="utf8") as baseline:
+            baseline = json.loads(baseline.read())
+
+        if None not in (self.optimization["pyz_size"], baseline['pyz_size']):
+            self.optimization["pyz_size_delta"] = \
+                self.optimization["pyz_size"] - baseline['pyz_size']
+        if None not in (startup, baseline['startup_seconds']):
+            self.optimization["startup_delta_seconds"] = round(
+                startup - baseline['startup_seconds'], 6)
+
+        logger.info("Optimization compared with baseline: %s",
+                    self.optimization)
+
+    def _write_profile(self):
+        """Log the build profile and add it to the info file."""
+        for stage, seconds in self.profile["timings"].items():
+            logger.info("Profile: %s took %.3fs", stage, seconds)
+
+        if self.profile["pyinstaller"] is not None:
+            logger.info(
+                "Profile: PyInstaller used %.3fs user and %.3fs system CPU, "
+                "peak RSS %s bytes",
+                self.profile["pyinstaller"]["user_cpu_seconds"],
+                self.profile["pyinstaller"]["system_cpu_seconds"],
+                self.profile["pyinstaller"]["max_rss_bytes"]
+            )
+
+        if self.args.flags["dont_write_file"]:
+            return
+
+        with open(self.files["info"], 'r', encoding="utf8") as info_file:
+            gb_info = json.loads(info_file.read())
+
+        gb_info['profile'] = self.profile
+
+        with open(self.files["info"], 'w', encoding="utf8") as info_file:
+            info_file.write(json.dumps(gb_info))
+
+    def _fetch_cached(self, build_cache, remote_cache=None):
+        """Restore the build from the build cache or, failing that, remote."""
+        key = self.cache["key"]
+
+        if remote_cache is not None and not build_cache.contains(key):
+            try:
+                if remote_cache.pull(key, build_cache):
+                    logger.info("Remote cache hit: %s", key)
+                    self.cache["source"] = "remote"
+                else:
+                    logger.info("Remote cache miss: %s", key)
+            except remote.ERRORS as err:
+                logger.warning(
+                    "Remote cache %s could not be read: %s",
+                    remote_cache.location,
+                    err)
+
+        self.cache["hit"] = build_cache.fetch(
+            key,
+            os.path.join(self.args.directories["work"], 'dist')
+        ) is not None
+
+        if self.cache["hit"] and self.cache["source"] is None:
+            self.cache["source"] = "local"
+
+    def _push_cached(self, build_cache, remote_cache):
+        """Publish the build, with its info files, to the remote cache."""
+        extra_files = {}
+        if not self.args.flags["dont_write_file"]:
+            for path in (self.files["info"], self.files["files"]):
+                extra_files[os.path.basename(path)] = path
+
+        try:
+            if remote_cache.push(self.cache["key"], build_cache, extra_files):
+                logger.info(
+                    "Published build to remote cache: %s", self.cache["key"])
+            else:
+                logger.info(
+                    "Build already in remote cache: %s", self.cache["key"])
+        except remote.ERRORS as err:
+            logger.warning(
+                "Remote cache %s could not be written: %s",
+                remote_cache.location,
+                err)
+
+    def _plan_hook(self, problems):
+        """Render the hook and check it compiles and its imports exist."""
+        try:
+            hook = self._generate_hook_text_from_template()
+        except (OSError, KeyError, TypeError, ValueError) as err:
+            problems.append(f"Hook could not be rendered: {err}")
+            return None
+
+        try:
+            tree = ast.parse(
+                hook, "hook-" + str(self.args.info["pkg_name"]) + ".py")
+        except SyntaxError as err:
+            problems.append(f"Hook has a syntax error: {err}")
+            return hook
+
+        graph = treeshake.ImportGraph(
+            [os.path.dirname(self._pkg_source_dir())] + sys.path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                names = [node.module]
+            else:
+                continue
+            problems.extend(
+                f"Hook imports a module that can't be found: {name}"
+                for name in names if graph.find(name) is None)
+
+        return hook
+
+    def plan(self):
+        """
+        Resolve and validate a build without running PyInstaller.
+
+        Returns:
+            A dict with "valid" (bool), "problems" (list of str) and the
+            resolved "hook", "requirements", "extra_packages", "commands"
+            and paths of the build.
+        """
+        started = time.perf_counter()
+        problems = []
+
+        paths = {
+            'script_path': self.args.info["script_path"],
+            'pkg_dir': self.args.directories["pkg"],
+            'hook_template': self.args.info["hook_template"],
+        }
+        if self.args.info["pkg_name"]:
+            paths['pkg_source'] = self._pkg_source_dir()
+            for data in self.args.extra["data"] or []:
+                paths['extra_data ' + data] = os.path.join(
+                    self._pkg_source_dir(), data)
+        else:
+            problems.append("The package name could not be resolved")
+        if self.args.directories["wheelhouse"]:
+            paths['wheelhouse'] = self.args.directories["wheelhouse"]
+
+        problems.extend(
+            f"{name} not found: {path}" for name, path in paths.items()
+            if not path or not os.path.exists(path))
+
+        hook = self._plan_hook(problems) \
+            if self.args.info["pkg_name"] else None
+
+        required = self.args.get_required()
+        problems.extend(
+            f"Requirement not installed: {requirement}"
+            for requirement in required
+            if not requirements.is_installed(requirement))
+
+        plan = {
+            'valid': not problems,
+            'problems': problems,
+            'app_name': self.args.info["app_name"],
+            'app_version': self.args.info["app_version"],
+            'pkg_name': self.args.info["pkg_name"],
+            'console_script': self.args.info["console_script"],
+            'standalone_name': self.standalone_name,
+            'paths': paths,
+            'directories': dict(self.args.directories),
+            'hook': hook,
+            'requirements': required,
+            'extra_packages': sorted(
+                set(self.EXTRA_REQD_PACKAGES) | set(self.args.extra["pkgs"])),
+            'commands': self._pyinstaller_commands(),
+        }
+
+        # nothing was built, so nothing is kept
+        if not self.args.flags["incremental"]:
+            workdir.remove_tree(
+                self.args.directories["work"], trash_dir=BUILD_DIR)
+
+        plan['seconds'] = round(time.perf_counter() - started, 6)
+        for problem in problems:
+            logger.error("Plan: %s", problem)
+
+        return plan
+
+    def generate(self):
+        """Generate the standalone application."""
+        # pylint: disable=too-many-statements,too-many-branches
+        started = time.perf_counter()
+
+        with self._timed('create_hook'):
+            self._create_hook()
+
+        fix_distutils()
+
+        try:
+            shutil.copy2(self.args.info["script_path"], self._temp_script)
+        except FileNotFoundError:
+            logger.error(
+                "application script not found: %s",
+                "\n1. Run GravityBee in a virtual env" +
+                "\n2. Use the --script option" +
+                "\n3. Install your application using pip" +
+                "\n4. Make sure your application has a console " +
+                "script entry in setup.py or setup.cfg."
+            )
+            self._cleanup()
+            return False
+
+        if self.args.flags["tree_shake"]:
+            with self._timed('tree_shake'):
+                self._tree_shake()
+
+        commands = self._pyinstaller_commands()
+
+        with self._timed('install_extra_packages'):
+            self.install_extra_packages()
+
+        build_inputs = None
+        if self.args.flags["cache"] or self.args.flags["incremental"]:
+            build_inputs = self._build_inputs(commands)
+
+        build_cache = None
+        remote_cache = None
+        if self.args.flags["cache"]:
+            build_cache = BuildCache(self.args.directories["cache"])
+            self.cache["key"] = compute_key(build_inputs)
+            remote_cache = remote.get_remote(self.args.info["remote_cache"]) \
+                if self.args.info["remote_cache"] else None
+            with self._timed('build_cache'):
+                self._fetch_cached(build_cache, remote_cache)
+
+        if not self.cache["hit"]:
+            if self.args.flags["incremental"]:
+                fingerprint = self._incremental_fingerprint(build_inputs)
+                workdir.prepare_incremental(self._build_dir(), fingerprint)
+
+            with self._timed('pyinstaller'):
+                returncode = self._run_pyinstaller(commands)
+
+            if returncode != 0:
+                logger.error(
+                    "PyInstaller exited with error code %s", returncode)
+                return EXIT_NOT_OKAY
+
+            if self.args.flags["incremental"]:
+                workdir.record_state(self._build_dir(), fingerprint)
+
+        self._find_standalone()
+        self.optimization["pyz_size"] = self._pyz_size()
+
+        if build_cache is not None and not self.cache["hit"]:
+            build_cache.store(self.cache["key"], self.files["gen_w_path"])
+
+        if self.args.flags["extract_cache"]:
+            with self._timed('bootstrap'):
+                self._make_bootstrap()
+
+        try:
+            # moves the standalone into staging, hashing whatever is copied
+            with self._timed('stage_artifacts'):
+                self._stage_artifacts()
+
+            # hashes (unless staging did) and writes the sha files
+            with self._timed('process_sha'):
+                self._process_sha()
+
+            # puts incrementally staged versions in place
+            with self._timed('publish_artifacts'):
+                self._publish_artifacts()
+        finally:
+            self._discard_staged()
+
+        # runs the staged standalone to measure its startup
+        if self.args.info["benchmark_runs"]:
+            with self._timed('benchmark'):
+                self._benchmark()
+
+        self._compare_baseline()
+
+        # write info (with paths) and sha
+        with self._timed('write_info_files'):
+            self._write_info_files()
+
+        if remote_cache is not None and not self.cache["hit"]:
+            with self._timed('remote_cache'):
+                self._push_cached(build_cache, remote_cache)
+
+        self._cleanup()
+
+        self.profile["timings"]["total"] = round(
+            time.perf_counter() - started, 6)
+        if self.args.flags["profile"]:
+            self._write_profile()
+
+        return EXIT_OKAY
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""Hashing of generated standalone applications.
+
+Standalone applications can be hundreds of megabytes. Files are memory
+mapped (or read into one large reusable buffer when they cannot be mapped)
+and every requested digest is updated from the same chunk, so computing
+several digests still reads the file only once.
+
+Files that have to be copied anyway (staging, the "latest" copy) are hashed
+while they are copied so the bytes are not read a second time just to hash
+them. The copy is checked against the number of bytes hashed and, when a
+digest is already known, against that digest.
+
+Onedir builds are hashed as a tree: every file is hashed (in a thread pool,
+since hashlib releases the GIL while hashing) into a manifest of relative
+path to digest, and the manifest is reduced to a single Merkle root.
+"""
+
+import errno
+import mmap
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from gravitybee import HASH_ALGORITHMS
+
+ALGORITHMS = HASH_ALGORITHMS
+DEFAULT_ALGORITHM = 'sha256'
+BUFFER_SIZE = 8 * 1024 * 1024
+
+
+def normalize_algorithms(algorithms=None):
+    """
+    Return a tuple of algorithms, always starting with the default.
+
+    Raises:
+        ValueError: If an algorithm is not supported.
+    """
+    normalized = [DEFAULT_ALGORITHM]
+    for algorithm in algorithms or []:
+        algorithm = algorithm.lower().replace('-', '_')
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+        if algorithm not in normalized:
+            normalized.append(algorithm)
+    return tuple(normalized)
+
+
+def _new(algorithm, data=b''):
+    # hashlib, and OpenSSL with it, is only loaded once something is hashed
+    import hashlib      # pylint: disable=import-outside-toplevel
+    return hashlib.new(algorithm, data)
+
+
+def new_hashers(algorithms=None):
+    """Return a dict of new hash objects for each algorithm."""
+    return {
+        algorithm: _new(algorithm)
+        for algorithm in normalize_algorithms(algorithms)
+    }
+
+
+def hexdigests(hashers):
+    """Return a dict of hex digests from a dict of hash objects."""
+    return {
+        algorithm: hasher.hexdigest()
+        for algorithm, hasher in hashers.items()
+    }
+
+
+def _update(hashers, data):
+    for hasher in hashers.values():
+        hasher.update(data)
+
+
+def _chunks(file_obj, buffer_size):
+    """Yield memoryview chunks of an open binary file."""
+    try:
+        mapped = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # empty files and some filesystems can't be mapped
+        mapped = None
+
+    if mapped is not None:
+        with mapped, memoryview(mapped) as view:
+            for offset in range(0, len(view), buffer_size):
+                with view[offset:offset + buffer_size] as chunk:
+                    yield chunk
+    else:
+        buffer = bytearray(buffer_size)
+        with memoryview(buffer) as view:
+            for size in iter(lambda: file_obj.readinto(buffer), 0):
+                with view[:size] as chunk:
+                    yield chunk
+
+
+def hash_file(filename, algorithms=None, buffer_size=BUFFER_SIZE):
+    """
+    Compute several digests of a file in a single pass.
+
+    Args:
+        filename: A str representing a file.
+        algorithms: An optional list of algorithm names. The default
+            algorithm (sha256) is always included.
+        buffer_size: An int number of bytes hashed at a time.
+
+    Returns:
+        A dict of algorithm name to hex digest, or None if the file does
+        not exist.
+    """
+    if not os.path.isfile(filename):
+        return None
+
+    hashers = new_hashers(algorithms)
+
+    with open(filename, "rb") as file_to_hash:
+        for chunk in _chunks(file_to_hash, buffer_size):
+            _update(hashers, chunk)
+
+    return hexdigests(hashers)
+
+
+def copy_and_hash(src, dst, algorithms=None, expected=None,
+                  buffer_size=BUFFER_SIZE):
+    """
+    Copy a file (like shutil.copy2) while computing its digests.
+
+    Args:
+        src: A str of the file to copy.
+        dst: A str of the destination file or directory.
+        algorithms: An optional list of algorithm names.
+        expected: An optional dict of known digests the copy must match.
+        buffer_size: An int number of bytes copied at a time.
+
+    Returns:
+        A dict of algorithm name to hex digest.
+
+    Raises:
+        OSError: If the copy does not match what was read or expected.
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+
+    hashers = new_hashers(algorithms)
+    copied = 0
+
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        for chunk in _chunks(src_file, buffer_size):
+            _update(hashers, chunk)
+            dst_file.write(chunk)
+            copied += len(chunk)
+        dst_file.flush()
+        written = os.fstat(dst_file.fileno()).st_size
+
+    shutil.copystat(src, dst)
+    digests = hexdigests(hashers)
+
+    mismatched = written != copied or any(
+        digests.get(algorithm, digest) != digest
+        for algorithm, digest in (expected or {}).items()
+    )
+    if mismatched:
+        os.remove(dst)
+        raise OSError(errno.EIO, "Staged copy does not match source", dst)
+
+    return digests
+
+
+def move_and_hash(src, dst, algorithms=None, buffer_size=BUFFER_SIZE):
+    """
+    Move a file, hashing it only if it has to be copied.
+
+    A rename within a filesystem reads nothing so no digests are returned.
+    Across filesystems the file is copied with copy_and_hash() and then
+    removed.
+
+    Returns:
+        A dict of algorithm name to hex digest, or None if the file was
+        renamed.
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+
+    try:
+        os.rename(src, dst)
+        return None
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+
+    digests = copy_and_hash(src, dst, algorithms, buffer_size=buffer_size)
+    os.remove(src)
+    return digests
+
+
+def _hash_tree_entry(path, algorithm):
+    # links are recorded by target rather than followed
+    if os.path.islink(path):
+        return _new(
+            algorithm, os.readlink(path).encode('utf-8')).hexdigest()
+    return hash_file(path, [algorithm])[algorithm]
+
+
+def merkle_root(manifest, algorithm=DEFAULT_ALGORITHM):
+    """
+    Return the Merkle root of a manifest.
+
+    Leaves are the hash of each relative path and file digest, in path
+    order. Pairs of nodes are hashed together level by level and an odd
+    node is carried up unchanged.
+
+    Args:
+        manifest: A dict of relative path to hex digest.
+        algorithm: A str hash algorithm name.
+
+    Returns:
+        A str hex digest.
+    """
+    level = [
+        _new(
+            algorithm,
+            b'\x00' + path.encode('utf-8') + b'\x00' + bytes.fromhex(digest)
+        ).digest()
+        for path, digest in sorted(manifest.items())
+    ]
+
+    if not level:
+        return _new(algorithm).hexdigest()
+
+    while len(level) > 1:
+        parents = [
+            _new(algorithm, b'\x01' + left + right).digest()
+            for left, right in zip(level[0::2], level[1::2])
+        ]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+
+    return level[0].hex()
+
+
+def hash_tree(root, algorithm=DEFAULT_ALGORITHM, max_workers=None):
+    """
+    Hash every file under a directory.
+
+    Args:
+        root: A str directory.
+        algorithm: A str hash algorithm name.
+        max_workers: An optional int number of hashing threads.
+
+    Returns:
+        A tuple of the Merkle root (str) and the manifest, a dict of
+        relative path (with ``/`` separators) to hex digest.
+    """
+    algorithm = normalize_algorithms([algorithm])[-1]
+
+    paths = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames + [
+                name for name in dirnames
+                if os.path.islink(os.path.join(dirpath, name))]:
+            path = os.path.join(dirpath, name)
+            paths[os.path.relpath(path, root).replace(os.sep, '/')] = path
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        manifest = dict(zip(
+            paths,
+            executor.map(
+                lambda path: _hash_tree_entry(path, algorithm),
+                paths.values()
+            )
+        ))
+
+    return merkle_root(manifest, algorithm), manifest
+
+
+def diff_manifests(old, new):
+    """
+    Compare two manifests file by file.
+
+    Returns:
+        A dict with sorted lists of "added", "removed" and "changed"
+        relative paths.
+    """
+    return {
+        'added': sorted(set(new) - set(old)),
+        'removed': sorted(set(old) - set(new)),
+        'changed': sorted(
+            path for path in set(old) & set(new) if old[path] != new[path]
+        ),
+    }
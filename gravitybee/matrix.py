@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Build several standalone variants concurrently.
+
+A build matrix is a list of build specs. Each spec is a dict of the same
+keyword arguments accepted by gravitybee.Arguments plus an optional
+"name" identifying the variant. Build specs can be given as a list or as a
+dict with "defaults" (applied to every build) and "builds" keys.
+
+Example:
+    A spec file building a onefile and a onedir variant::
+
+        {
+            "defaults": {"src_dir": "src", "extra_data": ["gbextradata"]},
+            "builds": [
+                {"name": "onefile"},
+                {"name": "onedir", "onedir": true}
+            ]
+        }
+
+Arguments are prepared one at a time in the calling process since reading
+the setup configuration of a package is not safe to do concurrently. The
+PyInstaller runs then happen in a process pool. Unless a spec says
+otherwise, every variant gets its own work, staging and info directories
+under ``.gravitybee/matrix/<name>``. Work, staging and info directories
+given as defaults, including to ``gravitybee`` itself, would be shared by
+every variant, so each variant gets a ``<name>`` directory under them
+instead. Each variant also gets its own
+PyInstaller cache there, since concurrent builds cleaning a shared cache
+would break each other.
+"""
+
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from gravitybee import EXIT_OKAY, EXIT_NOT_OKAY, FILE_DIR
+from gravitybee.generator import Arguments, PackageGenerator
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+MATRIX_DIR = os.path.join(FILE_DIR, 'matrix')
+MATRIX_FILE = os.path.join(FILE_DIR, 'gravitybee-matrix.json')
+
+
+def load_specs(filename):
+    """Read build specs from a JSON file."""
+    with open(filename, "r", encoding="utf8") as spec_file:
+        return json.loads(spec_file.read())
+
+
+def expand_specs(specs, defaults=None):
+    """
+    Return a list of complete, named build specs.
+
+    Args:
+        specs: A list of build spec dicts or a dict with "defaults" and
+            "builds" keys.
+        defaults: An optional dict of arguments applied to every build
+            before the spec's own defaults.
+    """
+    merged_defaults = dict(defaults or {})
+    if isinstance(specs, dict):
+        merged_defaults.update(specs.get('defaults', {}))
+        specs = specs.get('builds', [])
+
+    expanded = []
+    for index, spec in enumerate(specs):
+        build = dict(merged_defaults)
+        build.update(spec)
+        build['name'] = str(build.get('name') or f'variant-{index}')
+
+        variant_dir = os.path.join(MATRIX_DIR, build['name'])
+        isolated = {
+            'work_dir': os.path.join(variant_dir, 'build'),
+            'staging_dir': os.path.join(variant_dir, 'dist'),
+            'info_dir': variant_dir,
+        }
+        for key in isolated:
+            if merged_defaults.get(key):
+                isolated[key] = os.path.join(
+                    merged_defaults[key], build['name'])
+
+        if not spec.get('work_dir'):
+            build['work_dir'] = isolated['work_dir']
+            if not build.get('incremental'):
+                build['work_dir'] = os.path.join(
+                    build['work_dir'], uuid.uuid1().hex[:16])
+        for key in ('staging_dir', 'info_dir'):
+            if not spec.get(key):
+                build[key] = isolated[key]
+        expanded.append(build)
+
+    names = [build['name'] for build in expanded]
+    if len(names) != len(set(names)):
+        raise ValueError("Build spec names must be unique")
+
+    return expanded
+
+
+def _result(name, exit_code, package_generator=None, error=None):
+    result = {
+        'name': name,
+        'exit_code': exit_code,
+        'error': error,
+    }
+
+    if package_generator is not None:
+        result['gen_file'] = package_generator.files["gen"]
+        result['gen_file_w_path'] = package_generator.files["gen_w_path"]
+        result['file_sha'] = package_generator.file_sha
+        result['staging_dir'] = package_generator.args.directories["staging"]
+        result['info_dir'] = package_generator.args.directories["info"]
+
+    return result
+
+
+def _generate(name, package_generator):
+    """Run one build. This runs in a worker process."""
+    # --clean empties PyInstaller's cache, so builds running at the same
+    # time each get their own
+    os.environ['PYINSTALLER_CONFIG_DIR'] = os.path.abspath(
+        os.path.join(MATRIX_DIR, name, 'pyinstaller'))
+
+    try:
+        exit_code = package_generator.generate()
+    except Exception as err:        # pylint: disable=broad-except
+        logger.exception("Build failed: %s", name)
+        return _result(name, EXIT_NOT_OKAY, error=str(err))
+
+    # generate() returns False when the script can't be found
+    if exit_code is False or exit_code != EXIT_OKAY:
+        return _result(name, EXIT_NOT_OKAY, package_generator)
+
+    return _result(name, EXIT_OKAY, package_generator)
+
+
+def build_matrix(specs, jobs=None, defaults=None):
+    """
+    Build every variant in a build matrix.
+
+    Args:
+        specs: A list of build spec dicts or a dict with "defaults" and
+            "builds" keys.
+        jobs: An int limiting how many builds run at once. Defaults to the
+            number of CPUs.
+        defaults: An optional dict of arguments applied to every build.
+
+    Returns:
+        A list of result dicts, in spec order, each with "name",
+        "exit_code", "error" and, when the build ran, "gen_file",
+        "gen_file_w_path", "file_sha", "staging_dir" and "info_dir".
+    """
+    results = {}
+    pending = []
+
+    for build in expand_specs(specs, defaults):
+        name = build.pop('name')
+        logger.info("Preparing build: %s", name)
+        try:
+            package_generator = PackageGenerator(Arguments(**build))
+            package_generator.install_extra_packages()
+        except Exception as err:        # pylint: disable=broad-except
+            logger.exception("Build could not be prepared: %s", name)
+            results[name] = _result(name, EXIT_NOT_OKAY, error=str(err))
+            continue
+        results[name] = None
+        pending.append((name, package_generator))
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            name: executor.submit(_generate, name, package_generator)
+            for name, package_generator in pending
+        }
+        for name, future in futures.items():
+            results[name] = future.result()
+            logger.info(
+                "Build %s finished with exit code %s",
+                name,
+                results[name]['exit_code'])
+
+    aggregated = list(results.values())
+
+    if not os.path.exists(FILE_DIR):
+        os.makedirs(FILE_DIR)
+
+    logger.info("Writing matrix file: %s", MATRIX_FILE)
+    with open(MATRIX_FILE, 'w', encoding="utf8") as matrix_file:
+        matrix_file.write(json.dumps(aggregated))
+
+    return aggregated
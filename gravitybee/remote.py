@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""Remote build caches shared by several machines.
+
+With a remote cache, a build that misses the local build cache (see
+gravitybee.cache) looks for the same key in the remote cache before running
+PyInstaller, and copies the entry it finds into the local cache. A build
+that does run PyInstaller publishes its entry, along with the
+gravitybee-info.json and gravitybee-files.json it wrote, to the remote
+cache. One CI agent's build can then serve all the others.
+
+Two kinds of remote cache are supported:
+
+* A directory, such as a network share mounted by every agent, laid out
+  like the local cache. Entries are copied to a temporary directory beside
+  the others and renamed into place, so a partial entry is never seen and
+  the first build to publish a key wins.
+* An HTTP(S) URL. Each entry is a gzipped tar at ``<url>/<key>.tar.gz``,
+  fetched with GET and published with a PUT carrying ``If-None-Match: *``
+  so that an existing entry is never replaced. ``gravitybee cache-server``
+  runs a minimal server for these, which writes each upload to a temporary
+  file and links it into place.
+
+Remote caches are an optimization, so the caller treats a remote cache that
+can't be reached like a miss.
+"""
+
+import functools
+import os
+import re
+import shutil
+import tarfile
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from http import HTTPStatus
+from http.client import HTTPException
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from gravitybee.cache import CACHE_INFO_FILE, BuildCache
+
+ENTRY_SUFFIX = '.tar.gz'
+TIMEOUT = 60
+CHUNK_SIZE = 1024 * 1024
+ENTRY_PATH = re.compile(r'^/([0-9a-f]{64})' + re.escape(ENTRY_SUFFIX) + '$')
+
+# what a remote cache that can't be used raises, connection errors included
+ERRORS = (OSError, ValueError, tarfile.TarError, HTTPException)
+
+
+def _pack(entry_dir, extra_files, archive_path):
+    """Write an entry, and any extra files, to a gzipped tar."""
+    with tarfile.open(archive_path, 'w:gz') as archive:
+        for name in sorted(os.listdir(entry_dir)):
+            archive.add(os.path.join(entry_dir, name), arcname=name)
+        for name, path in sorted((extra_files or {}).items()):
+            archive.add(path, arcname=name)
+
+
+def _unpack(archive_path, dest_dir):
+    """Extract an entry, refusing members outside of dest_dir."""
+    with tarfile.open(archive_path, 'r:gz') as archive:
+        if hasattr(tarfile, 'data_filter'):
+            archive.extractall(dest_dir, filter='data')
+            return
+
+        for member in archive.getmembers():
+            path = os.path.realpath(os.path.join(dest_dir, member.name))
+            if not path.startswith(os.path.realpath(dest_dir) + os.sep) \
+                    or member.isdev():
+                raise ValueError("Unsafe path in cache entry: " + member.name)
+        archive.extractall(dest_dir)
+
+
+class DirectoryRemote():
+    """
+    A remote cache in a directory shared by several machines.
+
+    Attributes:
+        location: A str of the directory.
+    """
+
+    def __init__(self, directory):
+        self.location = directory
+        self.cache = BuildCache(directory)
+
+    def pull(self, key, local):
+        """
+        Copy an entry into a local gravitybee.cache.BuildCache.
+
+        Returns:
+            True if the local cache now has the entry, False on a miss.
+        """
+        if not self.cache.contains(key):
+            return False
+
+        local.import_entry(key, self.cache.entry_path(key))
+        return local.contains(key)
+
+    def push(self, key, local, extra_files=None):
+        """
+        Publish an entry of a local gravitybee.cache.BuildCache.
+
+        Args:
+            key: A str cache key.
+            local: The gravitybee.cache.BuildCache holding the entry.
+            extra_files: An optional dict of str file names to str paths of
+                files published with the entry.
+
+        Returns:
+            True if the entry was published, False if it already existed.
+        """
+        return self.cache.import_entry(
+            key, local.entry_path(key), extra_files)
+
+
+class HttpRemote():
+    """
+    A remote cache served over HTTP.
+
+    Attributes:
+        location: A str of the base URL entries are under.
+    """
+
+    def __init__(self, url):
+        self.location = url.rstrip('/')
+
+    def _url(self, key):
+        return self.location + '/' + key + ENTRY_SUFFIX
+
+    def pull(self, key, local):
+        """
+        Download an entry into a local gravitybee.cache.BuildCache.
+
+        Returns:
+            True if the local cache now has the entry, False on a miss.
+        """
+        temp_dir = local.temp_dir()
+        archive_path = temp_dir + ENTRY_SUFFIX
+
+        try:
+            try:
+                with urllib.request.urlopen(
+                    self._url(key), timeout=TIMEOUT
+                ) as response, open(archive_path, 'wb') as archive:
+                    shutil.copyfileobj(response, archive, CHUNK_SIZE)
+            except urllib.error.HTTPError as err:
+                if err.code == HTTPStatus.NOT_FOUND:
+                    return False
+                raise
+
+            os.makedirs(temp_dir)
+            _unpack(archive_path, temp_dir)
+            if not os.path.isfile(os.path.join(temp_dir, CACHE_INFO_FILE)):
+                raise ValueError("Incomplete cache entry: " + self._url(key))
+            local.publish(temp_dir, key)
+        finally:
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        return local.contains(key)
+
+    def push(self, key, local, extra_files=None):
+        """
+        Upload an entry of a local gravitybee.cache.BuildCache.
+
+        Args:
+            key: A str cache key.
+            local: The gravitybee.cache.BuildCache holding the entry.
+            extra_files: An optional dict of str file names to str paths of
+                files published with the entry.
+
+        Returns:
+            True if the entry was published, False if it already existed.
+        """
+        archive_path = local.temp_dir() + ENTRY_SUFFIX
+
+        try:
+            _pack(local.entry_path(key), extra_files, archive_path)
+            with open(archive_path, 'rb') as archive:
+                request = urllib.request.Request(
+                    self._url(key),
+                    data=archive,
+                    method='PUT',
+                    headers={
+                        'Content-Length': str(os.path.getsize(archive_path)),
+                        'Content-Type': 'application/gzip',
+                        'If-None-Match': '*',
+                    },
+                )
+                try:
+                    with urllib.request.urlopen(request, timeout=TIMEOUT):
+                        pass
+                except urllib.error.HTTPError as err:
+                    # another build published the same key first
+                    if err.code == HTTPStatus.PRECONDITION_FAILED:
+                        return False
+                    raise
+        finally:
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+
+        return True
+
+
+def get_remote(location):
+    """Return a remote cache for a URL or directory."""
+    if location.startswith(('http://', 'https://')):
+        return HttpRemote(location)
+
+    if location.startswith('file:'):
+        location = urllib.request.url2pathname(
+            urllib.parse.urlparse(location).path)
+    return DirectoryRemote(location)
+
+
+class CacheRequestHandler(SimpleHTTPRequestHandler):
+    """Serve a directory of remote cache entries, accepting new ones."""
+
+    def do_PUT(self):   # pylint: disable=invalid-name
+        """Store an uploaded entry unless one exists for its key."""
+        match = ENTRY_PATH.match(self.path)
+        if match is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        path = os.path.join(self.directory, match.group(1) + ENTRY_SUFFIX)
+        if os.path.exists(path):
+            self.send_error(HTTPStatus.PRECONDITION_FAILED)
+            return
+
+        remaining = int(self.headers.get('Content-Length', 0))
+        temp_path = os.path.join(self.directory, '.tmp-' + uuid.uuid4().hex)
+        try:
+            with open(temp_path, 'wb') as temp_file:
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    temp_file.write(chunk)
+                    remaining -= len(chunk)
+
+            if remaining > 0:
+                self.send_error(HTTPStatus.BAD_REQUEST, "Incomplete upload")
+                return
+
+            # linking, unlike renaming, fails if the entry exists
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                self.send_error(HTTPStatus.PRECONDITION_FAILED)
+                return
+        finally:
+            os.remove(temp_path)
+
+        self.send_response(HTTPStatus.CREATED)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def make_server(directory, host='127.0.0.1', port=8765):
+    """Return an HTTP server for a directory of remote cache entries."""
+    os.makedirs(directory, exist_ok=True)
+    return ThreadingHTTPServer(
+        (host, port),
+        functools.partial(CacheRequestHandler, directory=directory))
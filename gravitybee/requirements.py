@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""Utilities for resolving and installing the packages a standalone
+application needs.
+
+Reading the setup configuration of a package with pyppyn builds a wheel of
+it, which is slow. The resulting configuration and requirements can be
+persisted, keyed by the size, mtime and content hash of the setup files
+along with the interpreter and platform (which pyppyn evaluates markers
+against), so later builds of an unchanged package skip that work. Values
+the setup files read from elsewhere, like ``version = attr: pkg.__version__``
+or ``file: VERSION``, are part of the key too, as are files named in
+``setup.py``, so a version bump is never hidden by a persisted one.
+
+Extra packages are checked against what is already installed first so pip
+is only started when something is actually missing. Anything missing is
+installed with a single pip invocation so dependencies are resolved once
+for all of them. A wheelhouse (a local directory of wheels) can be used
+instead of an index so installs work without network access.
+
+The metadata of the application's dependencies can also be resolved here,
+transitively, from what is installed. The hook then lists the metadata
+directories to bundle directly rather than having PyInstaller look up each
+direct dependency with ``copy_metadata()`` (and miss indirect ones).
+"""
+
+import ast
+import configparser
+import importlib
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+
+try:
+    from importlib import metadata
+except ImportError:     # Python 3.7
+    import importlib_metadata as metadata
+
+import pyppyn
+
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+except ImportError:
+    Requirement = None
+
+from gravitybee.cache import compute_key, file_digest, requirement_name
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+SETUP_FILES = ('setup.py', 'setup.cfg', 'pyproject.toml')
+# a dynamic value in pyproject.toml, such as version = {attr = "pkg.VERSION"}
+DYNAMIC_VALUE = re.compile(
+    r'^\s*[\w-]+\s*=\s*\{\s*(attr|file)\s*=\s*'
+    r'(\[[^\]]*\]|"[^"]*"|\'[^\']*\')',
+    re.MULTILINE)
+METADATA_FILES = ('METADATA', 'PKG-INFO')
+
+
+def _attr_sources(attr, roots):
+    """Return the files an "attr: module.attr" value could be read from."""
+    module_path = attr.strip().split('.')[:-1]
+    if not module_path:
+        return []
+
+    sources = []
+    for root in roots:
+        sources.append(os.path.join(root, *module_path, '__init__.py'))
+        sources.append(os.path.join(root, *module_path) + '.py')
+    return sources
+
+
+def _directive_sources(value, roots):
+    """Return the files an "attr:" or "file:" setup value is read from."""
+    kind, _, argument = value.strip().partition(':')
+    kind = kind.strip()
+    if kind == 'file':
+        return [os.path.join(roots[0], name.strip())
+                for name in argument.split(',') if name.strip()]
+    if kind == 'attr':
+        return _attr_sources(argument, roots)
+    return []
+
+
+def _string_value(node):
+    """Return the value of a str literal AST node, or None."""
+    # str literals are ast.Str, with s, before Python 3.8
+    value = node.value if hasattr(node, 'value') else getattr(node, 's', None)
+    return value if isinstance(value, str) else None
+
+
+def _setup_cfg_sources(setup_path, roots):
+    setup_cfg = configparser.ConfigParser(interpolation=None)
+    try:
+        setup_cfg.read(os.path.join(setup_path, 'setup.cfg'), encoding='utf8')
+    except configparser.Error:
+        return []
+
+    # package_dir = =src puts top-level packages somewhere else
+    package_dir = setup_cfg.get('options', 'package_dir', fallback='')
+    for line in package_dir.splitlines():
+        name, _, directory = line.partition('=')
+        if not name.strip() and directory.strip():
+            roots.insert(1, os.path.join(setup_path, directory.strip()))
+
+    sources = []
+    for section in setup_cfg.sections():
+        for value in setup_cfg[section].values():
+            sources.extend(_directive_sources(value, roots))
+    return sources
+
+
+def _pyproject_sources(setup_path, roots):
+    pyproject = os.path.join(setup_path, 'pyproject.toml')
+    if not os.path.isfile(pyproject):
+        return []
+
+    with open(pyproject, 'r', encoding='utf8') as toml_file:
+        text = toml_file.read()
+
+    sources = []
+    for kind, argument in DYNAMIC_VALUE.findall(text):
+        names = re.findall(r'["\']([^"\']+)["\']', argument)
+        sources.extend(_directive_sources(kind + ':' + ','.join(names), roots))
+    return sources
+
+
+def _setup_py_sources(setup_path):
+    setup_py = os.path.join(setup_path, 'setup.py')
+    try:
+        with open(setup_py, 'rb') as setup_file:
+            tree = ast.parse(setup_file.read(), filename=setup_py)
+    except (OSError, SyntaxError, ValueError):
+        return []
+
+    return [
+        os.path.join(setup_path, _string_value(node))
+        for node in ast.walk(tree)
+        if _string_value(node) and '\n' not in _string_value(node)
+    ]
+
+
+def dynamic_sources(setup_path):
+    """
+    Return the files, besides the setup files, that setup values come from.
+
+    These are the files of "attr:" and "file:" values in setup.cfg, and of
+    dynamic values in pyproject.toml, plus any file setup.py names with a
+    str literal. Only files that exist are returned.
+    """
+    roots = [setup_path, os.path.join(setup_path, 'src')]
+    sources = _setup_cfg_sources(setup_path, roots) \
+        + _pyproject_sources(setup_path, roots) \
+        + _setup_py_sources(setup_path)
+
+    return sorted({
+        os.path.normpath(source) for source in sources
+        if os.path.isfile(source)
+        and os.path.basename(source) not in SETUP_FILES
+    })
+
+
+def setup_key(setup_path):
+    """Return a key identifying the setup files of a package."""
+    setup_files = {}
+    for name in SETUP_FILES:
+        path = os.path.join(setup_path, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            setup_files[name] = [
+                stat.st_mtime_ns, stat.st_size, file_digest(path)]
+
+    return compute_key({
+        'setup_files': setup_files,
+        'dynamic_sources': {
+            os.path.relpath(path, setup_path): file_digest(path)
+            for path in dynamic_sources(setup_path)
+        },
+        'python': sys.version,
+        'platform': platform.system().lower(),
+        'pyppyn': pyppyn.__version__,
+    })
+
+
+def load_config_rep(setup_path, cache_dir=None):
+    """
+    Return a pyppyn.ConfigRep with its configuration loaded.
+
+    Args:
+        setup_path: A str of the directory containing setup.py.
+        cache_dir: An optional str directory where loaded configurations
+            are persisted and reused from.
+    """
+    config_rep = pyppyn.ConfigRep(setup_path=setup_path)
+    if cache_dir is None:
+        return config_rep
+
+    cache_file = os.path.join(cache_dir, setup_key(setup_path) + '.json')
+
+    if os.path.isfile(cache_file):
+        logger.info("Using resolved requirements: %s", cache_file)
+        with open(cache_file, "r", encoding="utf8") as resolved_file:
+            resolved = json.loads(resolved_file.read())
+        config_rep.config = resolved['config']
+        config_rep.reqs = resolved['reqs']
+        # pylint: disable=protected-access
+        config_rep._status["should_load"] = resolved['should_load']
+        config_rep._status["state"] = pyppyn.ConfigRep.STATE_LOAD
+        return config_rep
+
+    config_rep.load_config()
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    temp_file = cache_file + '.' + str(os.getpid())
+    with open(temp_file, "w", encoding="utf8") as resolved_file:
+        resolved_file.write(json.dumps({
+            'config': config_rep.config,
+            'reqs': config_rep.reqs,
+            # pylint: disable=protected-access
+            'should_load': config_rep._status["should_load"],
+        }))
+    os.replace(temp_file, cache_file)
+    logger.info("Saved resolved requirements: %s", cache_file)
+
+    return config_rep
+
+
+def is_installed(requirement):
+    """
+    Return True if an installed distribution satisfies a requirement.
+
+    Version specifiers are checked when packaging is available, otherwise
+    only the distribution name is.
+    """
+    try:
+        version = metadata.version(requirement_name(requirement))
+    except metadata.PackageNotFoundError:
+        return False
+
+    if Requirement is None:
+        return True
+
+    try:
+        parsed = Requirement(requirement)
+    except InvalidRequirement:
+        return True
+
+    if parsed.marker is not None and not parsed.marker.evaluate():
+        return True
+
+    return parsed.specifier.contains(version, prereleases=True)
+
+
+def missing_packages(requirements):
+    """Return the requirements that are not installed, in order."""
+    return [
+        requirement for requirement in requirements
+        if not is_installed(requirement)
+    ]
+
+
+def install_command(requirements, wheelhouse=None):
+    """Return the pip command installing requirements in one pass."""
+    commands = [sys.executable, '-m', 'pip', 'install']
+
+    if wheelhouse:
+        commands += ['--no-index', '--find-links', wheelhouse]
+
+    return commands + list(requirements)
+
+
+def install_packages(requirements, wheelhouse=None):
+    """
+    Install requirements that are missing with a single pip invocation.
+
+    Args:
+        requirements: A list of str requirements.
+        wheelhouse: An optional str directory of wheels to install from
+            instead of a package index.
+
+    Returns:
+        A list of the requirements that were installed.
+
+    Raises:
+        subprocess.CalledProcessError: If pip fails.
+    """
+    missing = missing_packages(requirements)
+    if not missing:
+        logger.info("Extra packages already installed: %s", requirements)
+        return []
+
+    logger.info("Installing extra packages: %s", missing)
+    subprocess.check_call(install_command(missing, wheelhouse))
+    importlib.invalidate_caches()
+    return missing
+
+
+def _dependencies(distribution, extras):
+    """Return the names of the installed requirements of a distribution."""
+    names = []
+    for requirement in distribution.requires or []:
+        if Requirement is None:
+            # without packaging, only unconditional requirements are known
+            if ';' not in requirement:
+                names.append((requirement_name(requirement), ()))
+            continue
+
+        try:
+            parsed = Requirement(requirement)
+        except InvalidRequirement:
+            continue
+
+        if parsed.marker is not None and not any(
+                parsed.marker.evaluate({'extra': extra})
+                for extra in list(extras) + ['']):
+            continue
+
+        names.append((parsed.name, tuple(parsed.extras)))
+    return names
+
+
+def metadata_closure(requirements):
+    """
+    Return the installed distributions requirements depend on.
+
+    Args:
+        requirements: A list of str requirements.
+
+    Returns:
+        A dict of normalized distribution name to importlib.metadata
+        Distribution, including every transitive dependency that is
+        installed.
+    """
+    found = {}
+    pending = [
+        (requirement_name(requirement), ()) for requirement in requirements
+    ]
+
+    while pending:
+        name, extras = pending.pop()
+        key = name.lower().replace('_', '-')
+        if key in found:
+            continue
+
+        try:
+            distribution = metadata.distribution(name)
+        except metadata.PackageNotFoundError:
+            logger.info("Dependency not installed: %s", name)
+            continue
+
+        found[key] = distribution
+        pending.extend(_dependencies(distribution, extras))
+
+    return found
+
+
+def _metadata_dir(distribution):
+    """Return the absolute and relative paths of a metadata dir or None."""
+    for path in distribution.files or []:
+        if path.name in METADATA_FILES and len(path.parts) == 2:
+            return (
+                os.path.normpath(str(distribution.locate_file(path.parent))),
+                path.parts[0]
+            )
+    return None
+
+
+def _environment_key(requirements):
+    # installing or removing a distribution changes its directory's mtime
+    return compute_key({
+        'requirements': sorted(requirements),
+        'python': sys.version,
+        'sys_path': [
+            [path, os.stat(path).st_mtime_ns]
+            for path in sys.path if os.path.isdir(path)
+        ],
+    })
+
+
+def metadata_datas(requirements, cache_dir=None):
+    """
+    Return the metadata dirs of requirements and their dependencies.
+
+    Args:
+        requirements: A list of str requirements.
+        cache_dir: An optional str directory where results are cached,
+            keyed by the requirements and the state of sys.path.
+
+    Returns:
+        A tuple of a sorted list of [source, destination] pairs for the
+        hook's datas, and a sorted list of distribution names whose
+        metadata dir couldn't be found (for copy_metadata() instead).
+    """
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(
+            cache_dir, _environment_key(requirements) + '.json')
+
+        if os.path.isfile(cache_file):
+            with open(cache_file, "r", encoding="utf8") as datas_file:
+                resolved = json.loads(datas_file.read())
+            return resolved['datas'], resolved['unresolved']
+
+    datas = []
+    unresolved = []
+    for name, distribution in sorted(metadata_closure(requirements).items()):
+        metadata_dir = _metadata_dir(distribution)
+        if metadata_dir is None:
+            unresolved.append(name)
+        else:
+            datas.append(list(metadata_dir))
+
+    datas.sort()
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_file = cache_file + '.' + str(os.getpid())
+        with open(temp_file, "w", encoding="utf8") as datas_file:
+            datas_file.write(json.dumps(
+                {'datas': datas, 'unresolved': unresolved}))
+        os.replace(temp_file, cache_file)
+
+    return datas, unresolved
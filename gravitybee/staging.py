@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Strategies for placing copies of artifacts in the staging area.
+
+The "latest" directory holds the same artifacts as the version directory.
+Instead of copying them, they can be hard linked, reflinked (a copy-on-write
+clone on filesystems such as Btrfs and XFS) or symlinked. When a strategy is
+not supported (for example, a hard link across filesystems or a reflink on
+ext4), the file is copied instead.
+
+In incremental staging mode, earlier version directories are kept. Each
+build is staged into a temporary directory inside the staging area and
+renamed into place, so a version directory is never seen half written.
+Old versions are then pruned according to a retention policy.
+"""
+
+import errno
+import logging
+import os
+import re
+import shutil
+import sys
+import uuid
+
+from gravitybee import LATEST_COPY, LATEST_HARDLINK, LATEST_REFLINK, \
+    LATEST_SYMLINK, STAGING_CLEAN, STAGING_INCREMENTAL
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+STRATEGY_COPY = LATEST_COPY
+STRATEGY_HARDLINK = LATEST_HARDLINK
+STRATEGY_REFLINK = LATEST_REFLINK
+STRATEGY_SYMLINK = LATEST_SYMLINK
+STRATEGIES = (
+    STRATEGY_COPY,
+    STRATEGY_HARDLINK,
+    STRATEGY_REFLINK,
+    STRATEGY_SYMLINK,
+)
+
+MODE_CLEAN = STAGING_CLEAN
+MODE_INCREMENTAL = STAGING_INCREMENTAL
+MODES = (MODE_CLEAN, MODE_INCREMENTAL)
+
+LATEST_DIR = 'latest'
+TEMP_PREFIX = '.tmp-'
+
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+# from linux/fs.h, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported", dst)
+
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.remove(dst)
+            raise
+
+    shutil.copystat(src, dst)
+
+
+def _symlink(src, dst):
+    # relative so the staging area can be moved or archived
+    os.symlink(
+        os.path.relpath(src, os.path.dirname(os.path.abspath(dst))),
+        dst,
+        target_is_directory=os.path.isdir(src)
+    )
+
+
+_LINKERS = {
+    STRATEGY_HARDLINK: os.link,
+    STRATEGY_REFLINK: _reflink,
+    STRATEGY_SYMLINK: _symlink,
+}
+
+
+def link(src, dst, strategy):
+    """
+    Place src at dst without copying it, if the strategy allows.
+
+    Args:
+        src: A str of the existing file (or, for symlinks, directory).
+        dst: A str of the path to create.
+        strategy: A str, one of STRATEGIES.
+
+    Returns:
+        True if dst was linked, False if the caller should copy instead
+        (the strategy is "copy" or it is not supported here).
+
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown staging strategy: {strategy}")
+
+    if strategy == STRATEGY_COPY:
+        return False
+
+    try:
+        _LINKERS[strategy](src, dst)
+    except (OSError, NotImplementedError) as err:
+        logger.debug(
+            "Could not %s %s, copying instead: %s", strategy, dst, err)
+        return False
+
+    return True
+
+
+def stage_file(src, dst, strategy):
+    """Link or copy a file to dst. Returns True if it was linked."""
+    if link(src, dst, strategy):
+        return True
+
+    shutil.copy2(src, dst)
+    return False
+
+
+def stage_tree(src, dst, strategy):
+    """
+    Link or copy a directory to dst.
+
+    A symlink strategy links the directory itself. Hard links and reflinks
+    are made file by file, with each unsupported file copied.
+    """
+    if strategy == STRATEGY_SYMLINK and link(src, dst, strategy):
+        return
+
+    def _stage_file(src_file, dst_file):
+        if strategy == STRATEGY_SYMLINK:
+            shutil.copy2(src_file, dst_file)
+        else:
+            stage_file(src_file, dst_file, strategy)
+
+    shutil.copytree(src, dst, symlinks=True, copy_function=_stage_file)
+
+
+def parse_size(size):
+    """
+    Return a number of bytes from an int or a str like "500M" or "2G".
+
+    Raises:
+        ValueError: If the size can't be parsed.
+    """
+    if size is None or isinstance(size, int):
+        return size
+
+    match = re.fullmatch(r'\s*(\d+)\s*([kmgt]?)i?b?\s*', str(size).lower())
+    if not match:
+        raise ValueError(f"Invalid size: {size}")
+
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+def tree_size(path):
+    """Return the total bytes of the files under path (links not followed)."""
+    if os.path.islink(path) or not os.path.isdir(path):
+        return os.lstat(path).st_size
+
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            total += os.lstat(os.path.join(dirpath, name)).st_size
+    return total
+
+
+def temp_dir(staging_dir):
+    """Create and return a temporary directory inside the staging area."""
+    path = os.path.join(staging_dir, TEMP_PREFIX + uuid.uuid4().hex[:16])
+    os.makedirs(path)
+    return path
+
+
+def swap_in(src, dst):
+    """
+    Rename a staged directory into place, replacing any existing one.
+
+    The old directory is renamed out of the way before the new one is
+    renamed in and is only deleted afterwards.
+    """
+    old = None
+    if os.path.lexists(dst):
+        old = os.path.join(
+            os.path.dirname(dst), TEMP_PREFIX + uuid.uuid4().hex[:16])
+        os.rename(dst, old)
+
+    os.rename(src, dst)
+
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def prune_versions(staging_dir, keep=None, max_size=None, protect=()):
+    """
+    Remove old version directories from a staging area.
+
+    Versions are ordered by modification time. The newest ``keep`` are
+    kept, then the oldest remaining are removed until the staging area is
+    no larger than ``max_size`` bytes. The latest dir, temporary dirs and
+    protected versions are never removed.
+
+    Args:
+        staging_dir: A str of the staging area.
+        keep: An optional int number of versions to keep.
+        max_size: An optional int maximum total bytes of the staging area.
+        protect: An iterable of str version names never to remove.
+
+    Returns:
+        A list of the str version names removed.
+    """
+    if keep is None and max_size is None:
+        return []
+
+    versions = sorted(
+        (
+            entry for entry in os.scandir(staging_dir)
+            if entry.is_dir(follow_symlinks=False)
+            and entry.name != LATEST_DIR
+            and not entry.name.startswith(TEMP_PREFIX)
+        ),
+        key=lambda entry: entry.stat(follow_symlinks=False).st_mtime,
+        reverse=True
+    )
+
+    removable = [entry for entry in versions if entry.name not in protect]
+    kept = len(versions) - len(removable)
+
+    removed = []
+    if keep is not None:
+        removed = removable[max(keep - kept, 0):]
+        removable = removable[:max(keep - kept, 0)]
+
+    if max_size is not None:
+        total = tree_size(staging_dir) - sum(
+            tree_size(entry.path) for entry in removed)
+        while removable and total > max_size:
+            entry = removable.pop()
+            total -= tree_size(entry.path)
+            removed.append(entry)
+
+    for entry in removed:
+        logger.info("Pruning staged version: %s", entry.path)
+        shutil.rmtree(entry.path)
+
+    return [entry.name for entry in removed]
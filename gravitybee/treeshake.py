@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""Static import graph analysis to leave unused modules out of builds.
+
+Starting from the console script (and anything else gravitybee tells
+PyInstaller to include), every ``import`` is followed by parsing modules
+with ``ast`` and locating them with ``PathFinder``, so nothing is imported.
+Every import statement counts, including ones inside functions,
+conditionals and ``try`` blocks.
+
+Third-party packages that are reached are then compared with what they
+contain. Subpackages and modules that are never reached (test suites,
+optional backends, and so on) are returned so they can be passed to
+PyInstaller as ``--exclude-module``.
+
+Static analysis can't see everything, so a package is never shaken when
+any of its modules imports dynamically (``__import__``,
+``importlib.import_module`` with a computed name, ``pkgutil`` walks, entry
+points), changes ``__path__``, or contains extension modules (which can
+import anything). If the application itself imports
+dynamically, nothing is shaken.
+"""
+
+import ast
+import functools
+import logging
+import os
+import sys
+import sysconfig
+from importlib.machinery import PathFinder
+
+from gravitybee.discovery import INIT_FILE, SOURCE_SUFFIX, package_modules
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+DYNAMIC_CALLS = (
+    '__import__',
+    'import_module',
+    'iter_modules',
+    'walk_packages',
+    'iter_entry_points',
+    'entry_points',
+    'load_entry_point',
+)
+
+
+def _top(name):
+    return name.split('.')[0]
+
+
+def _is_dynamic_call(node):
+    """Return True, or the module name, for calls that import by name."""
+    name = getattr(node.func, 'id', None) or getattr(node.func, 'attr', None)
+    if name not in DYNAMIC_CALLS:
+        return False
+
+    argument = node.args[0] if node.args else None
+    # ast.Str, with an s rather than a value, before Python 3.8
+    value = argument.value if hasattr(argument, 'value') \
+        else getattr(argument, 's', None)
+    if name == 'import_module' and isinstance(value, str) \
+            and not value.startswith('.'):
+        return value
+    return True
+
+
+def _sets_path(node):
+    return any(
+        getattr(target, 'id', None) == '__path__' for target in node.targets)
+
+
+class ImportGraph():
+    """
+    The modules reachable from a script, found without importing.
+
+    Attributes:
+        path: A list of str directories modules are searched for in.
+        reached: A dict of str module name to spec for every module found.
+        dynamic: A set of str top-level names of modules that import
+            dynamically.
+    """
+
+    def __init__(self, path=None):
+        self.path = list(path if path is not None else sys.path)
+        self.reached = {}
+        self.dynamic = set()
+        self._specs = {}
+
+    def find(self, name):
+        """Return the spec of a module without importing it, or None."""
+        if name not in self._specs:
+            spec = None
+            parent, _, _ = name.rpartition('.')
+            try:
+                if not parent:
+                    spec = PathFinder.find_spec(name, self.path)
+                elif self.find(parent) is not None \
+                        and self.find(parent).submodule_search_locations:
+                    spec = PathFinder.find_spec(
+                        name, self.find(parent).submodule_search_locations)
+            except (ImportError, ValueError, KeyError):
+                # KeyError: namespace packages want their parent imported
+                spec = None
+            self._specs[name] = spec
+        return self._specs[name]
+
+    def submodules(self, name):
+        """Return the direct submodules of a package."""
+        spec = self.find(name)
+        if spec is None or not spec.submodule_search_locations:
+            return []
+
+        found = []
+        for location in spec.submodule_search_locations:
+            if not os.path.isdir(location):
+                continue
+            for entry in sorted(os.listdir(location)):
+                child = entry[:-len(SOURCE_SUFFIX)] \
+                    if entry.endswith(SOURCE_SUFFIX) else entry
+                if child != '__init__' and child.isidentifier() \
+                        and self.find(name + '.' + child) is not None:
+                    found.append(name + '.' + child)
+        return found
+
+    def _from_import(self, node, package):
+        """Return the modules a from ... import statement imports."""
+        base = node.module or ''
+        if node.level:
+            parts = package.split('.')
+            parts = parts[:len(parts) - node.level + 1]
+            base = '.'.join(parts + ([node.module] if node.module else []))
+
+        if not base:
+            return set()
+
+        imports = {base}
+        for alias in node.names:
+            if alias.name == '*':
+                # all a package's direct submodules may be in __all__
+                imports.update(self.submodules(base))
+            elif self.find(base + '.' + alias.name) is not None:
+                imports.add(base + '.' + alias.name)
+        return imports
+
+    def _parse(self, module, filename, is_package):
+        """Return the modules a module imports, noting dynamic ones."""
+        try:
+            with open(filename, 'rb') as source:
+                tree = ast.parse(source.read(), filename=filename)
+        except (OSError, SyntaxError, ValueError) as err:
+            logger.debug("Could not parse %s: %s", filename, err)
+            return set()
+
+        package = module if is_package else module.rpartition('.')[0]
+        imports = set()
+        dynamic = False
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imports.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                imports.update(self._from_import(node, package))
+            elif isinstance(node, ast.Call):
+                found = _is_dynamic_call(node)
+                if isinstance(found, str):
+                    imports.add(found)
+                else:
+                    dynamic = dynamic or found
+            elif isinstance(node, ast.Assign):
+                dynamic = dynamic or _sets_path(node)
+
+        if dynamic:
+            self.dynamic.add(_top(module))
+        return imports
+
+    def add_script(self, filename, name='__main__'):
+        """Follow the imports of a script."""
+        self.add_modules(self._parse(name, filename, False))
+
+    def add_modules(self, names):
+        """Follow the imports of modules, and of their parent packages."""
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            parts = name.split('.')
+            for index in range(1, len(parts) + 1):
+                module = '.'.join(parts[:index])
+                if module in self.reached:
+                    continue
+
+                spec = self.find(module)
+                if spec is None:
+                    break
+
+                self.reached[module] = spec
+                # the standard library doesn't import third-party packages
+                if spec.origin and spec.origin.endswith(SOURCE_SUFFIX) \
+                        and not _is_stdlib(spec):
+                    pending.extend(self._parse(
+                        module,
+                        spec.origin,
+                        spec.submodule_search_locations is not None
+                    ))
+
+
+@functools.lru_cache(maxsize=None)
+def _stdlib_dir():
+    return os.path.normcase(
+        os.path.realpath(sysconfig.get_paths()['stdlib']))
+
+
+def _is_stdlib(spec):
+    if spec.origin is None or spec.origin in ('built-in', 'frozen'):
+        return True
+    stdlib = _stdlib_dir()
+    origin = os.path.normcase(os.path.realpath(spec.origin))
+    return origin.startswith(stdlib + os.sep) \
+        and 'site-packages' not in origin
+
+
+def unreachable(graph, keep=()):
+    """
+    Return what can be left out of the third-party packages in a graph.
+
+    Args:
+        graph: An ImportGraph that has followed the application's imports.
+        keep: An iterable of str top-level names never to shake (such as
+            the application's own package).
+
+    Returns:
+        A dict with "excluded" (a sorted list of module and package names
+        to exclude), "source_bytes" (int size of the .py sources left out,
+        not of the compiled modules PyInstaller would have bundled) and
+        "skipped" (a sorted list of packages that were not shaken and why).
+    """
+    excluded = set()
+    skipped = {}
+    size = 0
+
+    # the application could import anything
+    if graph.dynamic & ({'__main__'} | set(keep)):
+        return {
+            'excluded': [],
+            'source_bytes': 0,
+            'skipped': ['application (dynamic imports)'],
+        }
+
+    tops = sorted({_top(name) for name in graph.reached} - set(keep))
+    for top in tops:
+        spec = graph.reached[top]
+        if not spec.submodule_search_locations or _is_stdlib(spec):
+            continue
+
+        location = os.path.dirname(spec.origin or '')
+        if not os.path.isfile(os.path.join(location, INIT_FILE)):
+            skipped[top] = 'namespace package'
+            continue
+
+        modules = package_modules(location)
+        if top in graph.dynamic:
+            skipped[top] = 'dynamic imports'
+            continue
+        if any(not path.endswith(SOURCE_SUFFIX) for _, path in modules):
+            skipped[top] = 'extension modules'
+            continue
+
+        for name, path in modules:
+            if name in graph.reached:
+                continue
+            # exclude the highest unreached package rather than each module
+            parts = name.split('.')
+            for index in range(2, len(parts) + 1):
+                if '.'.join(parts[:index]) not in graph.reached:
+                    excluded.add('.'.join(parts[:index]))
+                    break
+            size += os.path.getsize(path)
+
+    return {
+        'excluded': sorted(excluded),
+        'source_bytes': size,
+        'skipped': sorted(f"{top} ({reason})"
+                          for top, reason in skipped.items()),
+    }
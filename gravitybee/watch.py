@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Rebuild a standalone application whenever its inputs change.
+
+``gravitybee watch`` builds once and then polls the package source, the
+extra data, the hook template and the setup files, comparing the mtime and
+size of every file. Once a change is seen, it waits until nothing has
+changed for the debounce interval, since editors and formatters often write
+several files in a row, and then rebuilds. Changes made while a build is
+running are picked up by the next one.
+
+As much as possible is kept warm between builds. The setup configuration is
+only read again when a setup file changes, builds are incremental so that
+PyInstaller reuses its analysis, and, unless another engine is chosen,
+PyInstaller runs in a worker process so it is only imported once.
+"""
+
+import logging
+import os
+import time
+
+from gravitybee import EXIT_NOT_OKAY, engine, requirements
+from gravitybee.generator import Arguments, PackageGenerator
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+DEFAULT_INTERVAL = 0.5
+DEFAULT_DEBOUNCE = 0.3
+IGNORED_DIRS = ('__pycache__', '.git', '.gravitybee')
+IGNORED_SUFFIXES = ('.pyc', '.pyo', '.swp', '~')
+
+
+def snapshot(paths):
+    """
+    Return the mtime and size of every file under some paths.
+
+    Args:
+        paths: A list of str files or directories. Missing ones are skipped
+            so that creating them later counts as a change.
+
+    Returns:
+        A dict of str file paths to tuples of int mtime (ns) and size.
+    """
+    stats = {}
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = []
+            for root, dirs, names in os.walk(path):
+                dirs[:] = [name for name in dirs if name not in IGNORED_DIRS]
+                files.extend(os.path.join(root, name) for name in names)
+
+        for filename in files:
+            if filename.endswith(IGNORED_SUFFIXES):
+                continue
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            stats[filename] = (stat.st_mtime_ns, stat.st_size)
+
+    return stats
+
+
+def changes(before, after):
+    """Return a sorted list of files added, removed or modified."""
+    return sorted(
+        filename for filename in set(before) | set(after)
+        if before.get(filename) != after.get(filename)
+    )
+
+
+class Watcher():                # pylint: disable=too-few-public-methods
+    """Poll files for changes, debouncing bursts of changes."""
+
+    def __init__(self, paths, interval=DEFAULT_INTERVAL,
+                 debounce=DEFAULT_DEBOUNCE):
+        self.paths = list(paths)
+        self.interval = interval
+        self.debounce = debounce
+        self._stats = snapshot(self.paths)
+
+    def wait(self, timeout=None):
+        """
+        Wait for files to change and then stop changing.
+
+        Changes are relative to when the watcher was created or last
+        returned from wait().
+
+        Args:
+            timeout: An optional number of seconds to wait for a change.
+
+        Returns:
+            A sorted list of str files that changed, empty on a timeout.
+        """
+        started = time.monotonic()
+        while True:
+            current = snapshot(self.paths)
+            if changes(self._stats, current):
+                break
+            if timeout is not None and time.monotonic() - started > timeout:
+                return []
+            time.sleep(self.interval)
+
+        # wait out the rest of a burst of changes
+        while True:
+            time.sleep(self.debounce)
+            settled = snapshot(self.paths)
+            if not changes(current, settled):
+                break
+            current = settled
+
+        changed = changes(self._stats, settled)
+        self._stats = settled
+        return changed
+
+
+def watched_paths(args):
+    """Return the files and directories a build depends on."""
+    pkg_dir = args.directories["pkg"]
+    source_dir = pkg_dir
+    if args.directories["src"] != ".":
+        source_dir = os.path.join(source_dir, args.directories["src"])
+    source_dir = os.path.join(source_dir, args.info["pkg_name"])
+
+    paths = [source_dir, args.info["hook_template"]]
+    paths.extend(os.path.join(pkg_dir, name)
+                 for name in requirements.SETUP_FILES)
+    paths.extend(os.path.join(source_dir, data)
+                 for data in args.extra.get("data") or [])
+    return paths
+
+
+def _build(args):
+    """Run one build, returning its exit code."""
+    started = time.perf_counter()
+    try:
+        exit_code = PackageGenerator(args).generate()
+    except Exception:       # pylint: disable=broad-except
+        logger.exception("Build failed")
+        exit_code = EXIT_NOT_OKAY
+
+    # generate() returns False when the script can't be found
+    if exit_code is False:
+        exit_code = EXIT_NOT_OKAY
+
+    logger.info(
+        "Build finished with exit code %s in %.2fs",
+        exit_code,
+        time.perf_counter() - started)
+    return exit_code
+
+
+def watch(kwargs, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE,
+          builds=None):
+    """
+    Build and then rebuild whenever the inputs of the build change.
+
+    Args:
+        kwargs: A dict of keyword arguments for gravitybee.Arguments.
+            Builds are always incremental and use the worker engine unless
+            an engine is given.
+        interval: A number of seconds between polls for changes.
+        debounce: A number of seconds files must be unchanged for before
+            rebuilding.
+        builds: An optional int number of builds after which to stop.
+            Otherwise, watches until interrupted.
+
+    Returns:
+        A list of the int exit code of each build.
+    """
+    kwargs = dict(kwargs)
+    kwargs['incremental'] = True
+    kwargs['engine'] = kwargs.get('engine') or engine.ENGINE_WORKER
+
+    args = Arguments(**kwargs)
+    watcher = Watcher(watched_paths(args), interval, debounce)
+    results = []
+
+    try:
+        rebuild = True
+        while True:
+            if rebuild:
+                results.append(_build(args))
+                if builds is not None and len(results) >= builds:
+                    break
+
+            logger.info("Watching for changes: %s", watcher.paths)
+            changed = watcher.wait()
+            logger.info("Changed: %s", changed)
+
+            rebuild = True
+            if any(os.path.basename(filename) in requirements.SETUP_FILES
+                   for filename in changed):
+                logger.info("Reading the setup configuration again")
+                try:
+                    args = Arguments(**kwargs)
+                except Exception:       # pylint: disable=broad-except
+                    logger.exception("Setup configuration could not be read")
+                    rebuild = False
+                else:
+                    watcher.paths = watched_paths(args)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        engine.close_engines()
+
+    return results
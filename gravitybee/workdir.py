@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""Utilities for managing gravitybee work directories.
+
+In incremental mode, the work directory is stable across runs so that
+PyInstaller can reuse the Analysis and PYZ caches it keeps under
+``--workpath``. PyInstaller only checks its own inputs (module mtimes,
+TOCs), so a state file recording a fingerprint of everything gravitybee
+feeds to PyInstaller (hook, command line, interpreter and package
+versions) is kept next to those caches. When the fingerprint changes, the
+caches are thrown away before building.
+
+Work directories that are no longer needed are removed without holding up
+the build: they are renamed out of the way (which is quick) and deleted by
+a detached child process, so gravitybee can exit without waiting for it.
+Work directories left behind by earlier builds can be garbage collected by
+age and by the total size of the build area, also in a detached process.
+Anything a detached process doesn't get to is trash that the next garbage
+collection removes. For that, gravitybee moves work directories to the
+trash in its build area, wherever they were, as long as they're on the same
+filesystem.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+import uuid
+
+logger = logging.getLogger(__name__)        # pylint: disable=invalid-name
+
+STATE_FILE = 'gravitybee-state.json'
+TRASH_PREFIX = '.trash-'
+
+AGE_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+_pending = []
+
+
+def read_state(build_dir):
+    """Return the state recorded for a PyInstaller build dir or None."""
+    state_path = os.path.join(build_dir, STATE_FILE)
+    if not os.path.isfile(state_path):
+        return None
+
+    try:
+        with open(state_path, "r", encoding="utf8") as state_file:
+            return json.loads(state_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def prepare_incremental(build_dir, fingerprint):
+    """
+    Make a PyInstaller build dir safe to reuse.
+
+    Args:
+        build_dir: A str of the PyInstaller build dir for one standalone.
+        fingerprint: A str digest of the inputs gravitybee gives PyInstaller.
+
+    Returns:
+        True if the existing caches can be reused, False if they were
+        missing or invalidated.
+    """
+    state = read_state(build_dir)
+    if state is not None and state.get('fingerprint') == fingerprint:
+        logger.info("Reusing PyInstaller caches: %s", build_dir)
+        return True
+
+    if os.path.isdir(build_dir):
+        logger.info("Build inputs changed, invalidating: %s", build_dir)
+        shutil.rmtree(build_dir)
+
+    return False
+
+
+def record_state(build_dir, fingerprint):
+    """Record the fingerprint of a successful build in its build dir."""
+    if not os.path.isdir(build_dir):
+        os.makedirs(build_dir)
+
+    with open(
+        os.path.join(build_dir, STATE_FILE), "w", encoding="utf8"
+    ) as state_file:
+        state_file.write(json.dumps({'fingerprint': fingerprint}))
+
+
+def parse_age(age):
+    """
+    Return a number of seconds from a number or a str like "12h" or "7d".
+
+    Raises:
+        ValueError: If the age can't be parsed.
+    """
+    if age is None or isinstance(age, (int, float)):
+        return age
+
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*', age.lower())
+    if not match:
+        raise ValueError(f"Invalid age: {age}")
+
+    return float(match.group(1)) * AGE_UNITS[match.group(2)]
+
+
+def dir_size(path):
+    """Return the total bytes of the files under a directory."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+# runs a function of this module with JSON arguments
+DETACHED_SCRIPT = (
+    "import json, sys; from gravitybee import workdir; "
+    "getattr(workdir, sys.argv[1])(*json.loads(sys.argv[2]))"
+)
+
+
+def _detach(function_name, *args):
+    """
+    Run a function of this module in a detached child process.
+
+    Returns:
+        The subprocess.Popen of the child or None if one can't be started,
+        such as when gravitybee is itself frozen.
+    """
+    if not sys.executable or getattr(sys, 'frozen', False):
+        return None
+
+    import subprocess   # pylint: disable=import-outside-toplevel
+
+    options = {}
+    if sys.platform == 'win32':
+        options['creationflags'] = subprocess.DETACHED_PROCESS \
+            | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        options['start_new_session'] = True
+
+    try:
+        # pylint: disable=consider-using-with
+        process = subprocess.Popen(
+            [sys.executable, '-c', DETACHED_SCRIPT, function_name,
+             json.dumps(args)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            **options
+        )
+    except OSError as err:
+        logger.warning("Could not start %s: %s", function_name, err)
+        return None
+
+    _pending.append(process)
+    return process
+
+
+def _remove_trash(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_tree(path, background=True, trash_dir=None):
+    """
+    Remove a directory, by default without waiting for it to be deleted.
+
+    The directory is first renamed to a trash name, so it is gone from its
+    original path right away, even if deleting it fails or the process exits
+    first (garbage collection of the dir holding the trash finishes the
+    job).
+
+    Args:
+        path: A str directory.
+        background: A bool of whether to delete it in a detached process.
+        trash_dir: An optional str directory to move it to the trash in,
+            such as the build area garbage collection looks in. When it is
+            on another filesystem, or not given, the trash is put next to
+            the directory instead.
+
+    Returns:
+        The subprocess.Popen deleting the directory or None.
+    """
+    name = TRASH_PREFIX + uuid.uuid4().hex[:16]
+    candidates = [os.path.join(os.path.dirname(os.path.abspath(path)), name)]
+    if trash_dir is not None:
+        os.makedirs(trash_dir, exist_ok=True)
+        candidates.insert(0, os.path.join(os.path.abspath(trash_dir), name))
+
+    trash = path
+    for candidate in candidates:
+        try:
+            os.rename(path, candidate)
+        except OSError:
+            continue
+        trash = candidate
+        break
+
+    if not background:
+        _remove_trash(trash)
+        return None
+
+    return _detach('_remove_trash', trash)
+
+
+def wait_for_removals():
+    """Wait for background removals and garbage collection to finish."""
+    while _pending:
+        _pending.pop().wait()
+
+
+def collect_garbage(build_root, max_age=None, max_size=None, protect=()):
+    """
+    Remove old work directories from a build area.
+
+    Leftover trash is always removed. Work directories older than
+    ``max_age`` seconds are removed, then the oldest remaining are removed
+    until the build area is no larger than ``max_size`` bytes.
+
+    Args:
+        build_root: A str directory holding work directories.
+        max_age: An optional number of seconds.
+        max_size: An optional int number of bytes.
+        protect: An iterable of str work directories never to remove.
+
+    Returns:
+        A list of the str paths removed, including trash.
+    """
+    if not os.path.isdir(build_root):
+        return []
+
+    protected = {os.path.abspath(path) for path in protect}
+    removed = []
+    work_dirs = []
+
+    for entry in os.scandir(build_root):
+        if not entry.is_dir(follow_symlinks=False) \
+                or os.path.abspath(entry.path) in protected:
+            continue
+        if entry.name.startswith(TRASH_PREFIX):
+            removed.append(entry.path)
+        else:
+            work_dirs.append(
+                (entry.stat(follow_symlinks=False).st_mtime, entry.path))
+
+    # oldest first
+    work_dirs.sort()
+    now = time.time()
+
+    if max_age is not None:
+        while work_dirs and now - work_dirs[0][0] > max_age:
+            removed.append(work_dirs.pop(0)[1])
+
+    if max_size is not None:
+        sizes = [dir_size(path) for _, path in work_dirs]
+        # protected work dirs still count towards the size
+        total = sum(sizes) + sum(
+            dir_size(path) for path in protected
+            if os.path.dirname(path) == os.path.abspath(build_root)
+        )
+        while work_dirs and total > max_size:
+            total -= sizes.pop(0)
+            removed.append(work_dirs.pop(0)[1])
+
+    for path in removed:
+        logger.info("Removing work dir: %s", path)
+        shutil.rmtree(path, ignore_errors=True)
+
+    return removed
+
+
+def collect_garbage_later(build_root, max_age=None, max_size=None,
+                          protect=()):
+    """Run collect_garbage() in a detached process and return it."""
+    return _detach(
+        'collect_garbage', build_root, max_age, max_size, list(protect))
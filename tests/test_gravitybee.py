@@ -1,16 +1,29 @@
 # -*- coding: utf-8 -*-
-# pylint: disable=redefined-outer-name
+# pylint: disable=redefined-outer-name,too-many-lines
 """test_gravitybee module."""
 import glob
+import hashlib
 import os
 import json
 from pathlib import Path
 
 from subprocess import check_output
 import platform
+import sys
+import sysconfig
+import threading
+import time
 
+import pyppyn
 import pytest
-from gravitybee import Arguments, PackageGenerator, EXIT_OKAY, FILE_DIR
+from click.testing import CliRunner
+import gravitybee
+from gravitybee import EXIT_NOT_OKAY, EXIT_OKAY, FILE_DIR
+from gravitybee.generator import Arguments, PackageGenerator
+from gravitybee import benchmark, cli, discovery, engine, extraction, \
+    hashing, remote, requirements, staging, treeshake, watch, workdir
+from gravitybee.cache import BuildCache, compute_key
+from gravitybee.matrix import build_matrix, expand_specs
 
 
 def test_no_output():
@@ -84,6 +97,249 @@ def test_extra_pkgs_modules():
     assert generated_okay == EXIT_OKAY
 
 
+def test_install_packages(monkeypatch):
+    """Tests that only missing extra packages are installed, in one pass."""
+    pip_calls = []
+    monkeypatch.setattr(requirements.subprocess, "check_call",
+                        pip_calls.append)
+
+    assert requirements.install_packages(["pytest", "click"]) == []
+    assert not pip_calls
+
+    installed = requirements.install_packages(
+        ["pytest", "gb-missing-one", "gb-missing-two>=1.0"],
+        wheelhouse="wheels")
+
+    assert installed == ["gb-missing-one", "gb-missing-two>=1.0"]
+    assert len(pip_calls) == 1
+    assert pip_calls[0][-5:] == ["--no-index", "--find-links", "wheels",
+                                 "gb-missing-one", "gb-missing-two>=1.0"]
+    assert not requirements.is_installed("pytest<1")
+
+
+def test_resolved_requirements(tmp_path, monkeypatch):
+    """Tests that resolved setup configuration is persisted and reused."""
+    pkg_dir = os.path.join("tests", "gbtestapp")
+    cache_dir = str(tmp_path / "requirements")
+    first = requirements.load_config_rep(pkg_dir, cache_dir)
+    required = first.get_required(False)
+
+    def no_wheel(_):
+        raise AssertionError("setup configuration was read again")
+
+    monkeypatch.setattr(pyppyn.ConfigRep, "read_config", no_wheel)
+    second = requirements.load_config_rep(pkg_dir, cache_dir)
+
+    assert second.get_required(False) == required
+    assert second.get_config_attr('version') == '4.2.6'
+
+
+def test_setup_key_dynamic_version(tmp_path):
+    """Tests that versions read from other files are part of the key."""
+    (tmp_path / "setup.cfg").write_text(
+        "[metadata]\nversion = attr: app.__version__\n"
+        "[options]\npackage_dir =\n    =lib\n", encoding="utf-8")
+    (tmp_path / "pyproject.toml").write_text(
+        "[tool.setuptools.dynamic]\nreadme = {file = ['README.rst']}\n",
+        encoding="utf-8")
+    (tmp_path / "setup.py").write_text(
+        "import setuptools\nopen('VERSION').read()\nsetuptools.setup()\n",
+        encoding="utf-8")
+    (tmp_path / "lib" / "app").mkdir(parents=True)
+    init = tmp_path / "lib" / "app" / "__init__.py"
+    init.write_text("__version__ = '1.0'\n", encoding="utf-8")
+    (tmp_path / "README.rst").write_text("app\n", encoding="utf-8")
+    (tmp_path / "VERSION").write_text("1.0\n", encoding="utf-8")
+
+    assert requirements.dynamic_sources(str(tmp_path)) == sorted(
+        str(path) for path in
+        (init, tmp_path / "README.rst", tmp_path / "VERSION"))
+
+    key = requirements.setup_key(str(tmp_path))
+    init.write_text("__version__ = '1.1'\n", encoding="utf-8")
+    bumped = requirements.setup_key(str(tmp_path))
+    (tmp_path / "VERSION").write_text("1.1\n", encoding="utf-8")
+
+    assert len({key, bumped, requirements.setup_key(str(tmp_path))}) == 3
+
+
+def test_metadata_closure(tmp_path):
+    """Tests resolving dependency metadata transitively."""
+    closure = requirements.metadata_closure(["pytest"])
+    cache_dir = str(tmp_path / "metadata")
+    datas, unresolved = requirements.metadata_datas(["pytest"], cache_dir)
+
+    assert {"pytest", "pluggy", "iniconfig"} <= set(closure)
+    assert not unresolved
+    assert all(os.path.isdir(source) and source.endswith(destination)
+               for source, destination in datas)
+    assert requirements.metadata_datas(["pytest"], cache_dir) == \
+        (datas, unresolved)
+
+
+def test_precompute_metadata():
+    """Tests building with precomputed dependency metadata."""
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        clean=False,
+        precompute_metadata=True
+    )
+    package_generator = PackageGenerator(args)
+    generated_okay = package_generator.generate()
+
+    hook = (Path(args.directories['work']) / 'hooks' / 'hook-gbtestapp.py'
+            ).read_text(encoding='utf-8')
+
+    assert generated_okay == EXIT_OKAY
+    assert "copy_metadata('click')" not in hook
+    assert ".dist-info', 'click-" in hook
+
+
+def test_unreachable(tmp_path):
+    """Tests finding modules an application never imports."""
+    files = {
+        "thirdp/__init__.py": "from . import core\n",
+        "thirdp/core.py": "import os\n",
+        "thirdp/tests/__init__.py": "",
+        "thirdp/tests/test_core.py": "import thirdp.core\n",
+        "thirdp/backends/__init__.py": "",
+        "thirdp/backends/big.py": "BIG = 1\n",
+        "dyn/__init__.py": "import importlib\nimportlib.import_module(N)\n",
+        "dyn/extra.py": "",
+        "script.py": "import thirdp\nimport dyn\n",
+    }
+    for name, content in files.items():
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_text(content, encoding="utf-8")
+
+    graph = treeshake.ImportGraph([str(tmp_path)])
+    graph.add_script(str(tmp_path / "script.py"))
+    result = treeshake.unreachable(graph)
+
+    assert result["excluded"] == ["thirdp.backends", "thirdp.tests"]
+    assert result["source_bytes"] == \
+        len(files["thirdp/tests/test_core.py"]) + \
+        len(files["thirdp/backends/big.py"])
+    assert result["skipped"] == ["dyn (dynamic imports)"]
+
+
+def test_tree_shake():
+    """Tests building with tree shaking."""
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        clean=True,
+        tree_shake=True
+    )
+    package_generator = PackageGenerator(args)
+    generated_okay = package_generator.generate()
+
+    info = json.loads(
+        Path(PackageGenerator.INFO_FILE).read_text(encoding="utf-8"))
+    report = json.loads(
+        Path(package_generator.files["tree_shake"]).read_text(
+            encoding="utf-8"))
+
+    assert generated_okay == EXIT_OKAY
+    assert info["tree_shake_excluded"] == len(report["excluded"])
+    assert info["tree_shake_source_bytes"] == report["source_bytes"]
+
+
+def test_cli_import():
+    """Tests that the CLI loads quickly, without the build machinery."""
+    code = (
+        "import json, sys\n"
+        "import gravitybee.cli\n"
+        "print(json.dumps(sorted(sys.modules)))\n"
+    )
+    modules = json.loads(check_output([sys.executable, "-c", code]))
+
+    for module in ("pyppyn", "subprocess", "hashlib", "logging.config",
+                   "gravitybee.generator", "gravitybee.engine",
+                   "gravitybee.hashing", "gravitybee.staging",
+                   "gravitybee.workdir"):
+        assert module not in modules
+    assert gravitybee.Arguments is Arguments
+    assert CliRunner().invoke(cli.main, ["--version"]).output.strip() \
+        .endswith(gravitybee.__version__)
+
+
+def test_plan():
+    """Tests resolving a build without running PyInstaller."""
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        plan=True
+    )
+    package_generator = PackageGenerator(args)
+    plan = package_generator.plan()
+    workdir.wait_for_removals()
+
+    assert plan["valid"] is True
+    assert not plan["problems"]
+    assert "'gbtestapp.gbextradata'" in plan["hook"]
+    assert plan["commands"][0] == "pyinstaller"
+    assert package_generator.standalone_name in plan["commands"]
+    assert "--noupx" in plan["commands"]
+    assert "--strip" not in plan["commands"]
+    assert not os.path.exists(args.directories["work"])
+
+    if platform.system().lower() != "windows":
+        args = Arguments(
+            src_dir="src",
+            pkg_dir=os.path.join("tests", "gbtestapp"),
+            plan=True,
+            strip=True
+        )
+        assert "--strip" in PackageGenerator(args).plan()["commands"]
+        workdir.wait_for_removals()
+
+
+def test_plan_problems(tmp_path):
+    """Tests that a plan reports bad paths and hooks."""
+    hook_template = tmp_path / "hook-template"
+    hook_template.write_text(
+        "import gravitybee_missing\nhiddenimports = $hiddenimports\n",
+        encoding="utf-8")
+    args = Arguments(
+        src_dir="src",
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        script_path=str(tmp_path / "missing.py"),
+        hook_template=str(hook_template),
+        plan=True
+    )
+    plan = PackageGenerator(args).plan()
+
+    assert plan["valid"] is False
+    assert plan["problems"] == [
+        f"script_path not found: {tmp_path / 'missing.py'}",
+        "Hook imports a module that can't be found: gravitybee_missing",
+    ]
+
+    hook_template.write_text("hiddenimports = [\n", encoding="utf-8")
+    plan = PackageGenerator(args).plan()
+
+    assert len(plan["problems"]) == 2
+    assert plan["problems"][1].startswith("Hook has a syntax error")
+
+
+def test_plan_cli():
+    """Tests that the CLI writes only the plan to stdout."""
+    output = check_output([
+        sys.executable, "-c", "from gravitybee.cli import main; main()",
+        "--plan", "--src-dir", "src", "--extra-data", "gbextradata",
+        "--pkg-dir", os.path.join("tests", "gbtestapp"),
+    ])
+    plan = json.loads(output)
+
+    assert plan["valid"] is True
+    assert plan["app_name"] == "gbtestapp"
+
+
 @pytest.fixture
 def arguments():
     """Returns an Arguments instance using the included app"""
@@ -124,6 +380,68 @@ def test_executable(arguments):
         assert False
 
 
+@pytest.mark.parametrize("build_profile", [
+    Arguments.OPTION_BUILD_RELEASE, Arguments.OPTION_BUILD_DEBUG])
+def test_onedir_executable(build_profile):
+    """Tests running a onedir executable built with each profile."""
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        clean=True,
+        onedir=True,
+        build_profile=build_profile
+    )
+    package_generator = PackageGenerator(args)
+    generated_okay = package_generator.generate()
+
+    info = json.loads(
+        Path(PackageGenerator.INFO_FILE).read_text(encoding="utf-8"))
+    executable = os.path.join(
+        package_generator.files["gen_w_path"],
+        package_generator.standalone_name)
+    cmd_output = check_output(executable, universal_newlines=True)
+    compare_file = (Path("tests") / "gbtestapp" /
+                    "correct_stdout.txt").read_text(encoding="utf-8")
+
+    assert generated_okay == EXIT_OKAY
+    assert info["build_profile"] == build_profile
+    assert cmd_output == compare_file
+
+
+def test_optimize(tmp_path):
+    """Tests that optimized bytecode shrinks the PYZ against a baseline."""
+    def build(level, **kwargs):
+        args = Arguments(
+            src_dir="src",
+            extra_data=["gbextradata"],
+            pkg_dir=os.path.join("tests", "gbtestapp"),
+            clean=True,
+            optimize=level,
+            benchmark=3,
+            info_dir=str(tmp_path),
+            **kwargs
+        )
+        package_generator = PackageGenerator(args)
+        assert package_generator.generate() == EXIT_OKAY
+        return json.loads(
+            (tmp_path / "gravitybee-info.json").read_text(encoding="utf-8"))
+
+    baseline = build(0)
+    # a debug build has its own baseline rather than replacing this one
+    build(0, build_profile=Arguments.OPTION_BUILD_DEBUG)
+    info = build(2)
+
+    assert len(os.listdir(tmp_path / PackageGenerator.BASELINE_DIR)) == 2
+
+    assert info["optimize"] == 2
+    assert info["benchmark"]["failures"] == 0
+    assert info["pyz_size"] < baseline["pyz_size"]
+    assert info["pyz_size_delta"] == info["pyz_size"] - baseline["pyz_size"]
+    assert "startup_delta_seconds" in info
+    assert "pyz_size_delta" not in baseline
+
+
 def test_hook():
     """ Tests that the hook generated matches what is expected. """
     arguments = Arguments(
@@ -257,6 +575,250 @@ def test_file_sha(arguments):
         assert False
 
 
+def test_file_digests():
+    """Tests that extra digests are written to the SHA and info files."""
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        sha=Arguments.OPTION_SHA_FILE,
+        clean=True,
+        hash_algorithms=["sha512", "blake2b"]
+    )
+    package_generator = PackageGenerator(args)
+    generated_okay = package_generator.generate()
+
+    info = json.loads(
+        Path(PackageGenerator.INFO_FILE).read_text(encoding="utf-8"))
+    sha_dict = json.loads(Path(package_generator.files["sha_w_path"])
+                          .read_text(encoding="utf-8"))
+    content = Path(info['gen_file_w_path']).read_bytes()
+
+    assert generated_okay == EXIT_OKAY
+    assert sha_dict[info['gen_file']] == info['file_sha']
+    assert sha_dict['digests'] == info['file_digests']
+    assert info['file_digests']['blake2b'] == \
+        hashlib.blake2b(content).hexdigest()
+
+
+def test_hash_file(tmp_path):
+    """Tests single-pass hashing across buffer boundaries."""
+    content = os.urandom(10000)
+    data_file = tmp_path / "data.bin"
+    data_file.write_bytes(content)
+    empty_file = tmp_path / "empty.bin"
+    empty_file.write_bytes(b"")
+
+    digests = hashing.hash_file(str(data_file), ["sha512", "md5"], 4096)
+
+    assert list(digests) == ["sha256", "sha512", "md5"]
+    assert digests["sha256"] == hashlib.sha256(content).hexdigest()
+    assert digests["sha512"] == hashlib.sha512(content).hexdigest()
+    assert hashing.hash_file(str(empty_file))["sha256"] == \
+        hashlib.sha256(b"").hexdigest()
+    assert hashing.hash_file(str(tmp_path / "missing")) is None
+    with pytest.raises(ValueError):
+        hashing.normalize_algorithms(["crc32"])
+
+
+def test_copy_and_hash(tmp_path):
+    """Tests hashing while copying and moving files."""
+    content = os.urandom(10000)
+    src = tmp_path / "src.bin"
+    src.write_bytes(content)
+    expected = {"sha256": hashlib.sha256(content).hexdigest()}
+
+    digests = hashing.copy_and_hash(
+        str(src), str(tmp_path / "copy.bin"), buffer_size=4096)
+    moved = hashing.move_and_hash(
+        str(tmp_path / "copy.bin"), str(tmp_path / "moved.bin"))
+
+    assert digests == expected
+    assert moved is None
+    assert (tmp_path / "moved.bin").read_bytes() == content
+    with pytest.raises(OSError):
+        hashing.copy_and_hash(
+            str(src), str(tmp_path / "bad.bin"), expected={"sha256": "0"})
+    assert not (tmp_path / "bad.bin").exists()
+
+
+def test_hash_tree(tmp_path):
+    """Tests the manifest and Merkle root of a onedir tree."""
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "app").write_bytes(b"app")
+    (tmp_path / "lib" / "a.so").write_bytes(b"a")
+    (tmp_path / "lib" / "b.so").write_bytes(b"b")
+
+    root, manifest = hashing.hash_tree(str(tmp_path), max_workers=2)
+    (tmp_path / "lib" / "b.so").write_bytes(b"changed")
+    changed_root, changed = hashing.hash_tree(str(tmp_path))
+
+    assert sorted(manifest) == ["app", "lib/a.so", "lib/b.so"]
+    assert manifest["app"] == hashlib.sha256(b"app").hexdigest()
+    assert root == hashing.merkle_root(manifest)
+    assert changed_root != root
+    assert hashing.diff_manifests(manifest, changed) == {
+        "added": [], "removed": [], "changed": ["lib/b.so"]}
+
+
+@pytest.mark.parametrize("strategy", staging.STRATEGIES)
+def test_staging_strategy(tmp_path, strategy):
+    """Tests that each latest strategy stages files and directories."""
+    (tmp_path / "version" / "app").mkdir(parents=True)
+    (tmp_path / "version" / "app" / "lib.so").write_bytes(b"lib")
+    (tmp_path / "version" / "app.bin").write_bytes(b"app")
+    (tmp_path / "latest").mkdir()
+
+    staging.stage_file(
+        str(tmp_path / "version" / "app.bin"),
+        str(tmp_path / "latest" / "app.bin"),
+        strategy)
+    staging.stage_tree(
+        str(tmp_path / "version" / "app"),
+        str(tmp_path / "latest" / "app"),
+        strategy)
+
+    assert (tmp_path / "latest" / "app.bin").read_bytes() == b"app"
+    assert (tmp_path / "latest" / "app" / "lib.so").read_bytes() == b"lib"
+    assert (tmp_path / "latest" / "app.bin").is_symlink() == \
+        (strategy == staging.STRATEGY_SYMLINK)
+    with pytest.raises(ValueError):
+        staging.link("a", "b", "teleport")
+
+
+def test_prune_versions(tmp_path):
+    """Tests the retention policy of incremental staging."""
+    for age, version in enumerate(["3.0", "2.0", "1.0"]):
+        (tmp_path / version).mkdir()
+        (tmp_path / version / "app").write_bytes(b"x" * 100)
+        os.utime(tmp_path / version, (1000 - age, 1000 - age))
+    (tmp_path / "latest").mkdir()
+
+    assert staging.prune_versions(str(tmp_path)) == []
+    assert staging.prune_versions(
+        str(tmp_path), keep=2, protect=("1.0",)) == ["2.0"]
+    assert staging.prune_versions(str(tmp_path), max_size=150) == ["1.0"]
+    assert sorted(os.listdir(tmp_path)) == ["3.0", "latest"]
+    assert staging.parse_size("2G") == 2 * 1024 ** 3
+    with pytest.raises(ValueError):
+        staging.parse_size("lots")
+
+
+def test_incremental_staging(tmp_path):
+    """Tests that incremental staging keeps and prunes earlier versions."""
+    staging_dir = tmp_path / "dist"
+    for age, version in enumerate(["4.2.5", "4.2.4"]):
+        (staging_dir / version).mkdir(parents=True)
+        os.utime(staging_dir / version, (1000 - age, 1000 - age))
+
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        sha=Arguments.OPTION_SHA_FILE,
+        clean=True,
+        with_latest=True,
+        staging_dir=str(staging_dir),
+        staging_mode=Arguments.OPTION_STAGING_INCREMENTAL,
+        keep_versions=2
+    )
+    package_generator = PackageGenerator(args)
+    generated_okay = package_generator.generate()
+
+    assert generated_okay == EXIT_OKAY
+    assert sorted(os.listdir(staging_dir)) == ["4.2.5", "4.2.6", "latest"]
+    assert os.path.dirname(package_generator.files["gen_w_path"]) == \
+        str(staging_dir / "4.2.6")
+    assert os.path.isfile(package_generator.files["sha_w_path"])
+
+
+def test_incremental_staging_failure(tmp_path, monkeypatch):
+    """Tests that a failure before publishing leaves no staged temp dir."""
+    def fail(_):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(PackageGenerator, "_process_sha", fail)
+    staging_dir = tmp_path / "dist"
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        clean=True,
+        staging_dir=str(staging_dir),
+        staging_mode=Arguments.OPTION_STAGING_INCREMENTAL
+    )
+
+    with pytest.raises(OSError):
+        PackageGenerator(args).generate()
+
+    assert not os.listdir(staging_dir)
+
+
+def test_collect_garbage(tmp_path):
+    """Tests age and size based collection of old work dirs."""
+    now = time.time()
+    ages = {"new": 0, "mid": 60, "old": 2 * 86400, "older": 3 * 86400}
+    for name, age in ages.items():
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "build.toc").write_bytes(b"x" * 100)
+        os.utime(tmp_path / name, (now - age, now - age))
+    (tmp_path / (workdir.TRASH_PREFIX + "left")).mkdir()
+
+    removed = workdir.collect_garbage(
+        str(tmp_path), max_age=workdir.parse_age("1d"), max_size=250,
+        protect=[str(tmp_path / "older")])
+
+    assert sorted(os.path.basename(path) for path in removed) == [
+        workdir.TRASH_PREFIX + "left", "mid", "old"]
+    assert sorted(os.listdir(tmp_path)) == ["new", "older"]
+
+    workdir.remove_tree(str(tmp_path / "new"))
+    assert not (tmp_path / "new").exists()
+    workdir.wait_for_removals()
+    assert os.listdir(tmp_path) == ["older"]
+
+
+def test_remove_tree_trash_dir(tmp_path, monkeypatch):
+    """Tests that trash left by a failed removal is where GC looks."""
+    # as if the detached process couldn't be started
+    monkeypatch.setattr(workdir, "_detach", lambda *args: None)
+    (tmp_path / "custom" / "work").mkdir(parents=True)
+    build_root = tmp_path / "build"
+
+    workdir.remove_tree(
+        str(tmp_path / "custom" / "work"), trash_dir=str(build_root))
+
+    assert not os.listdir(tmp_path / "custom")
+    assert workdir.collect_garbage(str(build_root))
+    assert not os.listdir(build_root)
+
+
+def test_find_submodules(tmp_path):
+    """Tests static discovery of submodules and its cache."""
+    pkg = tmp_path / "pkg"
+    (pkg / "sub").mkdir(parents=True)
+    (pkg / "data").mkdir()
+    (pkg / "__init__.py").write_text("", encoding="utf-8")
+    (pkg / "cli.py").write_text("import os\n", encoding="utf-8")
+    (pkg / "broken.py").write_text("def (:\n", encoding="utf-8")
+    (pkg / "sub" / "__init__.py").write_text("", encoding="utf-8")
+    (pkg / "sub" / "mod.py").write_text("", encoding="utf-8")
+    (pkg / "data" / "notmodule.py").write_text("", encoding="utf-8")
+    cache_dir = str(tmp_path / "cache")
+
+    found = discovery.find_submodules(str(pkg), cache_dir)
+
+    assert found == ["pkg", "pkg.cli", "pkg.sub", "pkg.sub.mod"]
+    assert discovery.find_submodules(str(pkg), cache_dir) == found
+    assert len(os.listdir(cache_dir)) == 1
+
+    (pkg / "__init__.py").write_text(
+        "__path__ = __import__('pkgutil').extend_path(__path__, __name__)",
+        encoding="utf-8")
+    assert discovery.find_submodules(str(pkg), cache_dir) is None
+    assert discovery.find_submodules(str(tmp_path / "missing")) is None
+
+
 @pytest.fixture
 def latest_arguments():
     """Returns an Arguments instance using the included app"""
@@ -384,6 +946,514 @@ def test_testapp2_filename_file(testapp2_arguments):
         assert False
 
 
+def test_streamed_output(tmp_path):
+    """Tests that PyInstaller output and phases are reported as it runs."""
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        clean=True,
+        log_file=str(tmp_path / "pyinstaller.log")
+    )
+    phases = []
+    package_generator = PackageGenerator(
+        args, progress=lambda phase, number, total: phases.append(phase))
+    generated_okay = package_generator.generate()
+
+    assert generated_okay == EXIT_OKAY
+    assert phases == ['Analysis', 'PYZ', 'PKG', 'EXE']
+    assert "Building EXE" in (tmp_path / "pyinstaller.log").read_text(
+        encoding="utf-8")
+
+
+@pytest.mark.parametrize("engine_name", [
+    Arguments.OPTION_ENGINE_INPROCESS,
+    Arguments.OPTION_ENGINE_WORKER,
+])
+def test_engine(engine_name):
+    """Tests generating the executable without a pyinstaller subprocess."""
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        clean=True,
+        engine=engine_name
+    )
+    phases = []
+    package_generator = PackageGenerator(
+        args, progress=lambda phase, number, total: phases.append(phase))
+    generated_okay = package_generator.generate()
+    engine.close_engines()
+
+    assert generated_okay == EXIT_OKAY
+    assert phases == ['Analysis', 'PYZ', 'PKG', 'EXE']
+    assert os.path.isfile(package_generator.files["gen_w_path"])
+
+
+def test_profile():
+    """Tests that build timings are written to the info file."""
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        clean=True,
+        profile=True
+    )
+    package_generator = PackageGenerator(args)
+    generated_okay = package_generator.generate()
+
+    info = json.loads(
+        Path(PackageGenerator.INFO_FILE).read_text(encoding="utf-8"))
+
+    assert generated_okay == EXIT_OKAY
+    assert set(info['profile']['timings']) >= {
+        'create_hook', 'install_extra_packages', 'pyinstaller',
+        'process_sha', 'stage_artifacts', 'write_info_files', 'total'}
+    if platform.system().lower() != "windows":
+        assert info['profile']['pyinstaller']['max_rss_bytes'] > 0
+
+
+def test_benchmark():
+    """Tests startup percentiles and peak memory of an executable."""
+    assert benchmark.percentile([1, 2, 3, 4], 50) == 2.5
+    assert benchmark.percentile([4, 1, 3, 2], 99) == 3.97
+    assert benchmark.percentile([], 50) is None
+
+    result = benchmark.benchmark(sys.executable, ["-c", "pass"], runs=4)
+
+    assert result["runs"] == 4
+    assert result["failures"] == 0
+    assert result["first_run_seconds"] > 0
+    warm = result["warm_seconds"]
+    assert warm["min"] <= warm["p50"] <= warm["p90"] <= warm["max"]
+    if platform.system().lower() != "windows":
+        assert result["max_rss_bytes"] > 0
+    assert result["timeouts"] == 0
+
+
+def test_benchmark_timeout():
+    """Tests that a run that doesn't exit is killed instead of waited on."""
+    started = time.perf_counter()
+    result = benchmark.benchmark(
+        sys.executable, ["-c", "import time; time.sleep(60)"], runs=3,
+        timeout=0.5)
+
+    assert time.perf_counter() - started < 30
+    assert result["timeouts"] == 1
+    assert result["timeout_seconds"] == 0.5
+    assert result["first_run_seconds"] is None
+
+
+def test_benchmark_build():
+    """Tests that the startup benchmark is written to the info file."""
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        clean=True,
+        benchmark=3
+    )
+    package_generator = PackageGenerator(args)
+    generated_okay = package_generator.generate()
+
+    info = json.loads(
+        Path(PackageGenerator.INFO_FILE).read_text(encoding="utf-8"))
+
+    assert generated_okay == EXIT_OKAY
+    assert info["benchmark"]["runs"] == 3
+    assert info["benchmark"]["args"] == ["--help"]
+    assert info["benchmark"]["failures"] == 0
+    assert info["benchmark"]["first_run_seconds"] > 0
+
+
+@pytest.mark.skipif(platform.system().lower() == "windows",
+                    reason="the bootstrap is a POSIX shell script")
+def test_make_bootstrap(tmp_path):
+    """Tests that a self-extracting executable extracts only once."""
+    def make(version):
+        app_dir = tmp_path / version / "app"
+        app_dir.mkdir(parents=True)
+        app = app_dir / "app"
+        app.write_text(
+            f'#!/bin/sh\necho "{version} $*" "$(dirname "$0")"\n',
+            encoding="utf-8")
+        app.chmod(0o755)
+        bootstrap = tmp_path / f"bootstrap-{version}"
+        key = extraction.make_bootstrap(
+            str(app_dir), str(bootstrap), "app", version, "1d")
+        return str(bootstrap), key
+
+    environ = dict(os.environ, GB_EXTRACT_DIR=str(tmp_path / "cache"))
+    cache = tmp_path / "cache" / "app"
+
+    bootstrap, key = make("1.0")
+    first = check_output([bootstrap, "x"], env=environ, text=True).split()
+    second = check_output([bootstrap, "y"], env=environ, text=True).split()
+
+    assert first == ["1.0", "x", str(cache / key)]
+    assert second == ["1.0", "y", str(cache / key)]
+    assert sorted(os.listdir(cache)) == [key]
+
+    # versions that haven't run for longer than the max age are evicted
+    os.utime(cache / key, (time.time() - 3 * 86400,) * 2)
+    bootstrap, new_key = make("2.0")
+    check_output([bootstrap], env=environ)
+
+    assert sorted(os.listdir(cache)) == [new_key]
+
+
+def test_runtime_tmpdir():
+    """Tests that an empty runtime tmpdir means the system temp dir."""
+    def runtime_tmpdir(**kwargs):
+        return Arguments(
+            src_dir="src",
+            pkg_dir=os.path.join("tests", "gbtestapp"),
+            **kwargs
+        ).info["runtime_tmpdir"]
+
+    assert runtime_tmpdir(runtime_tmpdir="") is None
+    assert runtime_tmpdir(runtime_tmpdir="/var/tmp") == "/var/tmp"
+    if platform.system().lower() != "windows":
+        assert runtime_tmpdir() == "."
+
+
+@pytest.mark.skipif(platform.system().lower() == "windows",
+                    reason="the bootstrap is a POSIX shell script")
+def test_extract_cache(tmp_path, monkeypatch):
+    """Tests building and running a self-extracting executable."""
+    monkeypatch.setenv("GB_EXTRACT_DIR", str(tmp_path))
+    args = Arguments(
+        src_dir="src",
+        extra_data=["gbextradata"],
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        clean=True,
+        extract_cache=True
+    )
+    package_generator = PackageGenerator(args)
+    generated_okay = package_generator.generate()
+
+    info = json.loads(
+        Path(PackageGenerator.INFO_FILE).read_text(encoding="utf-8"))
+    cmd_output = check_output(
+        package_generator.files["gen_w_path"], universal_newlines=True)
+    compare_file = (Path("tests") / "gbtestapp" /
+                    "correct_stdout.txt").read_text(encoding="utf-8")
+
+    assert generated_okay == EXIT_OKAY
+    assert os.path.isfile(package_generator.files["gen_w_path"])
+    assert cmd_output == compare_file
+    assert info["extract_cache"] is True
+    assert os.listdir(tmp_path / "gbtestapp") == [info["extract_key"]]
+
+
+def test_cache_hit(tmp_path):
+    """Tests that an unchanged build is restored from the build cache."""
+    def cached_build():
+        args = Arguments(
+            src_dir="src",
+            extra_data=["gbextradata"],
+            pkg_dir=os.path.join("tests", "gbtestapp"),
+            clean=True,
+            cache=True,
+            cache_dir=str(tmp_path / "cache")
+        )
+        package_generator = PackageGenerator(args)
+        return package_generator, package_generator.generate()
+
+    first, first_okay = cached_build()
+    second, second_okay = cached_build()
+
+    assert first_okay == EXIT_OKAY and second_okay == EXIT_OKAY
+    assert not first.cache["hit"] and second.cache["hit"]
+    assert first.cache["key"] == second.cache["key"]
+    assert first.file_sha == second.file_sha
+
+
+def test_cache_key_portable(tmp_path, monkeypatch):
+    """Tests that the cache key doesn't depend on where the venv is."""
+    # pylint: disable=protected-access
+    args = Arguments(
+        src_dir="src",
+        pkg_dir=os.path.join("tests", "gbtestapp"),
+        optimize=1,
+        precompute_metadata=True
+    )
+    package_generator = PackageGenerator(args)
+    package_generator._temp_script = str(tmp_path / "script.py")
+    Path(package_generator._temp_script).write_text("", encoding="utf-8")
+    monkeypatch.setattr(PackageGenerator, "_pyinstaller_optimizes",
+                        classmethod(lambda _: False))
+
+    keys = []
+    for root in (tmp_path / "one", tmp_path / "two"):
+        site = str(root / "venv" / "site-packages")
+        paths = {"purelib": site, "platlib": site}
+        datas = [[os.path.join(site, "click.dist-info"), "click.dist-info"]]
+        monkeypatch.setattr(sys, "executable", str(root / "venv" / "python"))
+        monkeypatch.setattr(sysconfig, "get_paths", lambda p=paths: p)
+        monkeypatch.setattr(
+            requirements, "metadata_datas", lambda *_, d=datas: (d, []))
+        package_generator._metadata = None
+        args.directories["work"] = str(root / "work")
+
+        commands = package_generator._pyinstaller_commands()
+        assert commands[0] == sys.executable
+        keys.append(compute_key(package_generator._build_inputs(commands)))
+
+    assert keys[0] == keys[1]
+
+
+def test_cache_store_fetch(tmp_path):
+    """Tests storing and restoring an artifact in the build cache."""
+    artifact = tmp_path / "app-standalone"
+    artifact.write_bytes(b"standalone")
+    build_cache = BuildCache(str(tmp_path / "cache"))
+    key = compute_key({'input': 1})
+
+    assert build_cache.fetch(key, str(tmp_path / "dist")) is None
+    assert build_cache.store(key, str(artifact))
+    assert not build_cache.store(key, str(artifact))
+
+    restored = build_cache.fetch(key, str(tmp_path / "dist"))
+    assert Path(restored).read_bytes() == b"standalone"
+    assert compute_key({'input': 2}) != key
+
+
+@pytest.fixture
+def cache_server(tmp_path):
+    """Return the URL of a remote cache server running in a thread."""
+    server = remote.make_server(str(tmp_path / "served"), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("kind", ["directory", "http"])
+def test_remote_cache(tmp_path, request, kind):
+    """Tests publishing an entry to a remote cache and pulling it."""
+    location = str(tmp_path / "shared")
+    if kind == "http":
+        location = request.getfixturevalue("cache_server")
+    remote_cache = remote.get_remote(location)
+    artifact = tmp_path / "app-standalone"
+    artifact.write_bytes(b"standalone")
+    info = tmp_path / "gravitybee-info.json"
+    info.write_text('{"app_name": "app"}', encoding="utf-8")
+    key = compute_key({'input': 1})
+
+    builder = BuildCache(str(tmp_path / "builder"))
+    builder.store(key, str(artifact))
+    agent = BuildCache(str(tmp_path / "agent"))
+
+    assert not remote_cache.pull(key, agent)
+    assert remote_cache.push(key, builder, {info.name: str(info)})
+    assert not remote_cache.push(key, builder)
+    assert remote_cache.pull(key, agent)
+
+    restored = agent.fetch(key, str(tmp_path / "dist"))
+    assert Path(restored).read_bytes() == b"standalone"
+    assert json.loads(Path(agent.entry_path(key), info.name).read_text(
+        encoding="utf-8")) == {"app_name": "app"}
+    assert not [name for name in os.listdir(agent.directory)
+                if name.startswith(".tmp-")]
+
+
+def test_remote_cache_unreachable(tmp_path):
+    """Tests that an unreachable remote cache is an error to ignore."""
+    remote_cache = remote.get_remote("http://127.0.0.1:9/")
+
+    with pytest.raises(remote.ERRORS):
+        remote_cache.pull(compute_key({}), BuildCache(str(tmp_path)))
+
+
+def test_remote_cache_hit(tmp_path, cache_server):
+    """Tests that a build published by one machine serves another."""
+    def remote_build(name):
+        args = Arguments(
+            src_dir="src",
+            extra_data=["gbextradata"],
+            pkg_dir=os.path.join("tests", "gbtestapp"),
+            clean=True,
+            cache_dir=str(tmp_path / name),
+            info_dir=str(tmp_path / name / "info"),
+            remote_cache=cache_server
+        )
+        package_generator = PackageGenerator(args)
+        return package_generator, package_generator.generate()
+
+    builder, builder_okay = remote_build("builder")
+    agent, agent_okay = remote_build("agent")
+
+    info = json.loads(Path(agent.files["info"]).read_text(encoding="utf-8"))
+
+    assert builder_okay == EXIT_OKAY and agent_okay == EXIT_OKAY
+    assert not builder.cache["hit"]
+    assert agent.cache["hit"] and agent.cache["source"] == "remote"
+    assert info["cache_source"] == "remote"
+    assert agent.file_sha == builder.file_sha
+    assert os.path.isfile(
+        tmp_path / "served" / (builder.cache["key"] + remote.ENTRY_SUFFIX))
+
+
+def test_incremental(tmp_path):
+    """Tests that an incremental build can reuse an existing work dir."""
+    def incremental_build():
+        args = Arguments(
+            src_dir="src",
+            extra_data=["gbextradata"],
+            pkg_dir=os.path.join("tests", "gbtestapp"),
+            work_dir=str(tmp_path / "work"),
+            clean=True,
+            incremental=True
+        )
+        package_generator = PackageGenerator(args)
+        return package_generator, package_generator.generate()
+
+    first, first_okay = incremental_build()
+    assert first_okay == EXIT_OKAY
+    build_dir = tmp_path / "work" / "build" / first.standalone_name
+    state = workdir.read_state(str(build_dir))
+
+    _, second_okay = incremental_build()
+    assert second_okay == EXIT_OKAY
+    assert state is not None
+    assert workdir.read_state(str(build_dir)) == state
+
+
+def test_incremental_invalidation(tmp_path):
+    """Tests that changed build inputs invalidate PyInstaller caches."""
+    build_dir = str(tmp_path / "build")
+    assert not workdir.prepare_incremental(build_dir, "a")
+
+    workdir.record_state(build_dir, "a")
+    assert workdir.prepare_incremental(build_dir, "a")
+
+    assert not workdir.prepare_incremental(build_dir, "b")
+    assert not os.path.exists(build_dir)
+
+
+def test_matrix(tmp_path):
+    """Tests building two variants concurrently with isolated paths."""
+    specs = {
+        "defaults": {
+            "src_dir": "src",
+            "extra_data": ["gbextradata"],
+            "pkg_dir": os.path.join("tests", "gbtestapp"),
+            "sha": Arguments.OPTION_SHA_FILE,
+            "clean": True,
+        },
+        "builds": [
+            {"name": "plain", "staging_dir": str(tmp_path / "plain")},
+            {"name": "named", "staging_dir": str(tmp_path / "named"),
+             "name_format": "{an}-{v}-matrix-{os}-{m}"},
+        ],
+    }
+
+    results = build_matrix(specs, jobs=2)
+
+    assert [result['name'] for result in results] == ["plain", "named"]
+    assert all(result['exit_code'] == EXIT_OKAY for result in results)
+    assert results[1]['gen_file'].startswith("gbtestapp-4.2.6-matrix")
+    assert results[0]['file_sha'] == PackageGenerator.get_hash(
+        results[0]['gen_file_w_path'])
+    assert os.path.isfile(
+        os.path.join(results[1]['info_dir'], "gravitybee-info.json"))
+
+
+def test_matrix_missing_script(tmp_path):
+    """Tests that a variant whose script is missing is reported failed."""
+    results = build_matrix([{
+        "name": "missing",
+        "src_dir": "src",
+        "pkg_dir": os.path.join("tests", "gbtestapp"),
+        "script_path": str(tmp_path / "missing-script"),
+        "staging_dir": str(tmp_path / "missing"),
+        "clean": True,
+    }], jobs=1)
+
+    assert results[0]['exit_code'] == EXIT_NOT_OKAY
+    assert results[0]['gen_file_w_path'] is None
+
+
+def test_matrix_specs():
+    """Tests that build specs get unique, isolated directories."""
+    expanded = expand_specs([{}, {"name": "b", "incremental": True}],
+                            defaults={"clean": True})
+
+    assert [build['name'] for build in expanded] == ["variant-0", "b"]
+    assert all(build['clean'] for build in expanded)
+    assert expanded[0]['work_dir'] != expanded[1]['work_dir']
+    assert expanded[1]['work_dir'] == os.path.join(
+        FILE_DIR, 'matrix', 'b', 'build')
+
+    with pytest.raises(ValueError):
+        expand_specs([{"name": "a"}, {"name": "a"}])
+
+    shared = expand_specs(
+        {"defaults": {"staging_dir": "dist"},
+         "builds": [{"name": "a"}, {"name": "b", "info_dir": "info"}]},
+        defaults={"work_dir": "work", "incremental": True})
+
+    assert [build['work_dir'] for build in shared] == [
+        os.path.join("work", "a"), os.path.join("work", "b")]
+    assert [build['staging_dir'] for build in shared] == [
+        os.path.join("dist", "a"), os.path.join("dist", "b")]
+    assert shared[1]['info_dir'] == "info"
+
+
+def test_watcher(tmp_path):
+    """Tests that the watcher reports settled changes to files."""
+    (tmp_path / "__pycache__").mkdir()
+    (tmp_path / "module.py").write_text("a = 1\n", encoding="utf-8")
+    watcher = watch.Watcher(
+        [str(tmp_path), str(tmp_path / "setup.cfg")],
+        interval=0.01,
+        debounce=0.05)
+
+    assert not watcher.wait(timeout=0.1)
+
+    (tmp_path / "__pycache__" / "module.cpython.pyc").write_bytes(b"")
+    (tmp_path / "module.py").write_text("a = 22\n", encoding="utf-8")
+    (tmp_path / "setup.cfg").write_text("[metadata]\n", encoding="utf-8")
+
+    assert watcher.wait(timeout=1) == [
+        str(tmp_path / "module.py"), str(tmp_path / "setup.cfg")]
+    assert not watcher.wait(timeout=0.1)
+
+
+def test_watch(tmp_path, monkeypatch):
+    """Tests rebuilding when the hook template changes."""
+    hook_template = tmp_path / "hook-template"
+    hook_template.write_text(
+        Path(gravitybee.__file__).with_name("hook-template").read_text(
+            encoding="utf-8"),
+        encoding="utf-8")
+    build = watch._build    # pylint: disable=protected-access
+
+    def build_and_edit(args):
+        exit_code = build(args)
+        with hook_template.open("a", encoding="utf-8") as template:
+            template.write("# edited\n")
+        return exit_code
+
+    monkeypatch.setattr(watch, "_build", build_and_edit)
+    results = watch.watch({
+        "src_dir": "src",
+        "extra_data": ["gbextradata"],
+        "pkg_dir": os.path.join("tests", "gbtestapp"),
+        "hook_template": str(hook_template),
+        "staging_dir": str(tmp_path / "dist"),
+    }, interval=0.05, debounce=0.05, builds=2)
+
+    assert results == [EXIT_OKAY, EXIT_OKAY]
+    assert not engine._engines    # pylint: disable=protected-access
+    assert "# edited" in Path(
+        FILE_DIR, "build", "incremental-gbtestapp", "hooks",
+        "hook-gbtestapp.py").read_text(encoding="utf-8")
+
+
 @pytest.fixture
 def testing_defaults():
     """Return an Arguments instance for testing defaults"""